@@ -7,69 +7,11 @@ import numpy as np
 import netCDF4
 import scipy.interpolate
 import datetime
-
-def shrink(a,b):
-    """Return array shrunk to fit a specified shape by triming or averaging.
-    
-    a = shrink(array, shape)
-    
-    array is an numpy ndarray, and shape is a tuple (e.g., from
-    array.shape). a is the input array shrunk such that its maximum
-    dimensions are given by shape. If shape has more dimensions than
-    array, the last dimensions of shape are fit.
-    
-    as, bs = shrink(a, b)
-    
-    If the second argument is also an array, both a and b are shrunk to
-    the dimensions of each other. The input arrays must have the same
-    number of dimensions, and the resulting arrays will have the same
-    shape.
-    Example
-    -------
-    
-    >>> shrink(rand(10, 10), (5, 9, 18)).shape
-    (9, 10)
-    >>> map(shape, shrink(rand(10, 10, 10), rand(5, 9, 18)))        
-    [(5, 9, 10), (5, 9, 10)]   
-       
-    """
-
-    if isinstance(b, np.ndarray):
-        if not len(a.shape) == len(b.shape):
-            raise Exception, \
-                  'input arrays must have the same number of dimensions'
-        a = shrink(a,b.shape)
-        b = shrink(b,a.shape)
-        return (a, b)
-
-    if isinstance(b, int):
-        b = (b,)
-
-    if len(a.shape) == 1:                # 1D array is a special case
-        dim = b[-1]
-        while a.shape[0] > dim:          # only shrink a
-            if (dim - a.shape[0]) >= 2:  # trim off edges evenly
-                a = a[1:-1]
-            else:                        # or average adjacent cells
-                a = 0.5*(a[1:] + a[:-1])
-    else:
-        for dim_idx in range(-(len(a.shape)),0):
-            dim = b[dim_idx]
-            a = a.swapaxes(0,dim_idx)        # put working dim first
-            while a.shape[0] > dim:          # only shrink a
-                if (a.shape[0] - dim) >= 2:  # trim off edges evenly
-                    a = a[1:-1,:]
-                if (a.shape[0] - dim) == 1:  # or average adjacent cells
-                    a = 0.5*(a[1:,:] + a[:-1,:])
-            a = a.swapaxes(0,dim_idx)        # swap working dim back
-
-    return a
-
-def rot2d(x, y, ang):
-    '''rotate vectors by geometric angle'''
-    xr = x*np.cos(ang) - y*np.sin(ang)
-    yr = x*np.sin(ang) + y*np.cos(ang)
-    return xr, yr
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','code','us'))
+import rho_grid
+import grid_store
 
 # <codecell>
 
@@ -80,10 +22,19 @@ def surf_vel_roms(x,y,url,date_mid=datetime.datetime.utcnow,hours_ave=24,tvar='o
     #####################################################################################
 
     nc = netCDF4.Dataset(url)
-    mask = nc.variables['mask_rho'][:]
-    lon_rho = nc.variables['lon_rho'][:]
-    lat_rho = nc.variables['lat_rho'][:]
-    anglev = nc.variables['angle'][:]
+    # static grid arrays come from the local store (see code/us/grid_store.py)
+    g = grid_store.get(url,['mask_rho','lon_rho','lat_rho','angle'],nc)
+    mask = g['mask_rho']
+    lon_rho = g['lon_rho']
+    lat_rho = g['lat_rho']
+    anglev = g['angle']
+
+    # only read the part of the grid that overlaps the x,y domain
+    igood = g.where('lon_rho','lat_rho',x.min(),x.max(),y.min(),y.max())
+    if len(igood[0])==0:
+        print('no overlap with the x,y domain')
+        return None
+    j0,j1,i0,i1 = rho_grid.window(igood,lon_rho.shape)
 
     desired_stop_date = date_mid+datetime.timedelta(0,3600.*hours_ave/2.)  # specific time (UTC)
     istop = netCDF4.date2index(desired_stop_date,nc.variables[tvar],select='nearest')
@@ -100,22 +51,25 @@ def surf_vel_roms(x,y,url,date_mid=datetime.datetime.utcnow,hours_ave=24,tvar='o
     uvar='u'
     vvar='v'
     isurf_layer = -1
+    # u is on (eta_rho, xi_rho-1) points, v on (eta_rho-1, xi_rho)
     print('reading u...')
-    u=np.mean(nc.variables[uvar][istart:istop:time_sub,isurf_layer,:,:],axis=0)
+    u=np.mean(nc.variables[uvar][istart:istop:time_sub,isurf_layer,j0:j1,i0:i1-1],axis=0)
     print('reading v...')
-    v=np.mean(nc.variables[vvar][istart:istop:time_sub,isurf_layer,:,:],axis=0)
+    v=np.mean(nc.variables[vvar][istart:istop:time_sub,isurf_layer,j0:j1-1,i0:i1],axis=0)
     print('done reading data...')
-    u = shrink(u, mask[1:-1, 1:-1].shape)
-    v = shrink(v, mask[1:-1, 1:-1].shape)
-
-    u, v = rot2d(u, v, anglev[1:-1, 1:-1])
+    inner = (slice(j0+1,j1-1),slice(i0+1,i1-1))
+    # u,v at the interior rho points, rotated to east/north
+    u, v = rho_grid.get((url,j0,j1,i0,i1),anglev[inner])(u, v)
 
 
     # <codecell>
 
-    lon=lon_rho[1:-1,1:-1]
-    lat=lat_rho[1:-1,1:-1]
-    mask=mask[1:-1,1:-1]
+    lon=lon_rho[inner]
+    lat=lat_rho[inner]
+    mask=mask[inner]
+    if lonlat_sub>1:
+        sub=(slice(None,None,lonlat_sub),slice(None,None,lonlat_sub))
+        u, v, lon, lat, mask = u[sub], v[sub], lon[sub], lat[sub], mask[sub]
     # <codecell>
 
     long=lon[mask==1]
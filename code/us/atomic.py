@@ -0,0 +1,41 @@
+"""
+atomic: write files so that nobody reads one half written.
+
+Outputs (served by the web server while the next run writes them) and
+caches (read by other runs and processes) are written under a temporary
+name next to the file, unique to the process and thread writing it, and
+renamed into place when complete, which replaces the old file in one
+step.  A write that fails leaves the old file as it was.
+
+    with atomic.writer(fname,'wb') as f:
+        np.savez(f,values=values)
+    atomic.write_text(fname,json.dumps(state))
+"""
+import os
+import threading
+import contextlib
+
+def tmp_name(fname):
+    return '%s.%d.%d.tmp' % (fname,os.getpid(),threading.current_thread().ident)
+
+@contextlib.contextmanager
+def writer(fname,mode='w'):
+    """File object (opened with mode) to write fname through: renamed to
+    fname at the end of the block, or removed if the block raises."""
+    tmp = tmp_name(fname)
+    f = open(tmp,mode)
+    try:
+        yield f
+        f.close()
+    except BaseException:
+        f.close()
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    os.rename(tmp,fname)
+
+def write_text(fname,text):
+    with writer(fname,'w') as f:
+        f.write(text)
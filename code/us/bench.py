@@ -0,0 +1,284 @@
+"""
+bench: benchmarks of the merge stages on local synthetic model output.
+
+make_fixtures writes netCDF files laid out like the real sources -- ROMS
+(staggered u/v, mask_rho, angle, ocean_time), FVCOM (lonc/latc, u/v on
+elements) and HYCOM (1D lon in 0-360 and lat, water_u/water_v) -- with
+a time axis around the current time, at a given size factor.  Each stage
+is then run in a fresh process, first with empty caches ("cold") and
+then again with the caches from the cold run ("warm"), recording the
+wall time and the growth of peak memory.
+
+    python bench.py                         # all stages, sizes 1,2,4
+    python bench.py --sizes 1 --stages roms,merge
+    python bench.py --out new.json --compare old.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import datetime
+import argparse
+import resource
+import multiprocessing
+import numpy as np
+import netCDF4
+import interp_cache
+import slab_cache
+import rolling_mean
+import grid_store
+import time_axis
+import last_good
+import changes
+import regrid
+import ocean_data
+import surf_vel
+import surf_vel_roms
+import rho_grid
+import build
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+workdir = os.path.join(os.path.dirname(os.path.abspath(__file__)),'cache','bench')
+sizes = [1,2,4]
+nt = 48             # hourly steps, from 36 hours ago to 12 hours ahead
+
+# target grid of the US domain
+x = np.linspace(-130.103438,-60.885558,501)
+y = np.linspace(20.191999,52.807669,237)
+
+def time_var(nc,name):
+    nc.createDimension(name,None)
+    t = nc.createVariable(name,'f8',(name,))
+    t.units = 'hours since 1970-01-01 00:00:00'
+    now = netCDF4.date2num(datetime.datetime.utcnow(),t.units)
+    t[:] = np.floor(now)-36+np.arange(nt)
+
+def field(lon,lat,k,phase=0.):
+    '''smooth, time varying test field'''
+    return (np.sin(np.deg2rad(lon)*20+phase+k*0.26)*np.cos(np.deg2rad(lat)*15)).astype(np.float32)
+
+def make_roms(fname,size):
+    ny,nx = 100*size,120*size
+    nc = netCDF4.Dataset(fname,'w')
+    time_var(nc,'ocean_time')
+    nc.createDimension('s_rho',4)
+    for name,n in (('eta_rho',ny),('xi_rho',nx),('eta_u',ny),('xi_u',nx-1),('eta_v',ny-1),('xi_v',nx)):
+        nc.createDimension(name,n)
+    jj,ii = np.mgrid[0:ny,0:nx].astype(np.float64)
+    ang = 0.5
+    step = 0.05/size
+    lon = -76.+step*(ii*np.cos(ang)-jj*np.sin(ang))
+    lat = 36.+step*(ii*np.sin(ang)+jj*np.cos(ang))
+    mask = np.ones((ny,nx))
+    mask[:ny//5,:nx//4] = 0         # a block of land
+    for name,a in (('lon_rho',lon),('lat_rho',lat),('mask_rho',mask),('angle',np.zeros((ny,nx))+ang)):
+        nc.createVariable(name,'f8',('eta_rho','xi_rho'))[:] = a
+    u = nc.createVariable('u','f4',('ocean_time','s_rho','eta_u','xi_u'),fill_value=1e37)
+    v = nc.createVariable('v','f4',('ocean_time','s_rho','eta_v','xi_v'),fill_value=1e37)
+    land_u = (mask[:,1:]*mask[:,:-1])==0
+    land_v = (mask[1:,:]*mask[:-1,:])==0
+    for k in range(nt):
+        uk = np.ma.masked_array(np.repeat(field(lon[:,1:],lat[:,1:],k)[np.newaxis],4,0),
+                                np.repeat(land_u[np.newaxis],4,0))
+        vk = np.ma.masked_array(np.repeat(field(lon[1:,:],lat[1:,:],k,1.)[np.newaxis],4,0),
+                                np.repeat(land_v[np.newaxis],4,0))
+        u[k] = uk
+        v[k] = vk
+    nc.close()
+
+def make_fvcom(fname,size):
+    n = 20000*size*size
+    rs = np.random.RandomState(0)
+    lonc = -72.+rs.rand(n)*7.
+    latc = 40.+rs.rand(n)*5.
+    nc = netCDF4.Dataset(fname,'w')
+    time_var(nc,'time')
+    nc.createDimension('siglay',4)
+    nc.createDimension('nele',n)
+    nc.createVariable('lonc','f4',('nele',))[:] = lonc
+    nc.createVariable('latc','f4',('nele',))[:] = latc
+    u = nc.createVariable('u','f4',('time','siglay','nele'))
+    v = nc.createVariable('v','f4',('time','siglay','nele'))
+    for k in range(nt):
+        u[k] = np.repeat(field(lonc,latc,k)[np.newaxis],4,0)
+        v[k] = np.repeat(field(lonc,latc,k,1.)[np.newaxis],4,0)
+    nc.close()
+
+def make_hycom(fname,size):
+    lon = np.arange(262.,305.,0.16/size)
+    lat = np.arange(5.,32.,0.16/size)
+    nc = netCDF4.Dataset(fname,'w')
+    time_var(nc,'time')
+    nc.createDimension('depth',2)
+    nc.createDimension('lat',len(lat))
+    nc.createDimension('lon',len(lon))
+    nc.createVariable('lon','f8',('lon',))[:] = lon
+    nc.createVariable('lat','f8',('lat',))[:] = lat
+    lon2,lat2 = np.meshgrid(lon,lat)
+    land = (lon2-270.)**2/4.+(lat2-20.)**2 < 9.     # an island
+    u = nc.createVariable('water_u','f4',('time','depth','lat','lon'),fill_value=-30000.)
+    v = nc.createVariable('water_v','f4',('time','depth','lat','lon'),fill_value=-30000.)
+    for k in range(nt):
+        u[k] = np.ma.masked_array(np.repeat(field(lon2,lat2,k)[np.newaxis],2,0),np.repeat(land[np.newaxis],2,0))
+        v[k] = np.ma.masked_array(np.repeat(field(lon2,lat2,k,1.)[np.newaxis],2,0),np.repeat(land[np.newaxis],2,0))
+    nc.close()
+
+makers = {'roms':make_roms,'fvcom':make_fvcom,'hycom':make_hycom}
+
+def fixture(kind,size):
+    return os.path.join(workdir,'data','%s_%d.nc' % (kind,size))
+
+def make_fixtures(size):
+    try:
+        os.makedirs(os.path.join(workdir,'data'))
+    except OSError:
+        pass
+    for kind,make in sorted(makers.items()):
+        fname = fixture(kind,size)
+        if not os.path.exists(fname):
+            print('making %s' % fname)
+            make(fname+'.tmp',size)
+            os.rename(fname+'.tmp',fname)
+
+# stages: setup(size) returns the arguments of run, which is what is timed
+
+def read_roms(size):
+    return surf_vel_roms.surf_vel_roms(x,y,fixture('roms',size),date_mid=datetime.datetime.utcnow(),time_sub=1)
+
+def read_fvcom(size):
+    return surf_vel.surf_vel(x,y,fixture('fvcom',size),lonvar='lonc',latvar='latc',isurf_layer=0,
+                             ugrid=True,time_sub=3)
+
+def read_hycom(size):
+    return surf_vel.surf_vel(x,y,fixture('hycom',size),uvar='water_u',vvar='water_v',isurf_layer=0,
+                             lon360=True)
+
+def staggered(size):
+    ny,nx = 100*size,120*size
+    rs = np.random.RandomState(0)
+    return (rho_grid.RhoGrid(rs.rand(ny-2,nx-2)),
+            np.ma.masked_array(rs.rand(ny,nx-1),rs.rand(ny,nx-1)<0.1),
+            np.ma.masked_array(rs.rand(ny-1,nx),rs.rand(ny-1,nx)<0.1))
+
+def merged(size):
+    sx = np.linspace(x[0],x[-1],int(len(x)*size))
+    sy = np.linspace(y[0],y[-1],int(len(y)*size))
+    xx,yy = np.meshgrid(sx,sy)
+    ui = np.cos(np.deg2rad(xx)*10).ravel()
+    vi = np.sin(np.deg2rad(yy)*10).ravel()
+    return ui,vi,len(sx),len(sy)
+
+def write_js(ui,vi,nx,ny):
+    ocean_data.write_js(os.path.join(workdir,'ocean-data.js'),ui,vi,x[0],y[0],x[-1],y[-1],nx,ny,'now')
+
+def write_bin(ui,vi,nx,ny):
+    ocean_data.write_bin(os.path.join(workdir,'ocean-data.bin'),ui,vi,x[0],y[0],x[-1],y[-1],nx,ny,'now')
+
+stages = {
+    'roms': (lambda size: (size,), read_roms),
+    'fvcom': (lambda size: (size,), read_fvcom),
+    'hycom': (lambda size: (size,), read_hycom),
+    'destagger': (staggered, lambda rg,u,v: rg(u,v)),
+    'merge': (lambda size: ([read_roms(size),read_fvcom(size),read_hycom(size)],x,y), regrid.merge),
+    'write_js': (merged, write_js),
+    'write_bin': (merged, write_bin),
+}
+
+def use_caches():
+    base = os.path.join(workdir,'cache')
+    interp_cache.cache_dir = os.path.join(base,'interp')
+    slab_cache.cache_dir = os.path.join(base,'slabs')
+    rolling_mean.state_dir = os.path.join(base,'rolling')
+    grid_store.cache_dir = os.path.join(base,'grid')
+    time_axis.cache_dir = os.path.join(base,'time')
+    last_good.cache_dir = os.path.join(base,'fields')
+    changes.state_file = os.path.join(base,'changes.json')
+    build.land_dir = os.path.join(base,'land')
+
+def peak_rss():
+    '''peak resident memory of this process, in MB'''
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss/2.**20 if sys.platform=='darwin' else rss/2.**10
+
+def measure(stage,size,queue):
+    """Run stage once (in a child process) and put its time and memory on
+    the queue."""
+    use_caches()
+    setup,run = stages[stage]
+    sys.stdout = open(os.devnull,'w')      # the stages are chatty
+    args = setup(size)
+    rss0 = peak_rss()
+    if tracemalloc:
+        tracemalloc.start()
+    t0 = time.time()
+    run(*args)
+    seconds = time.time()-t0
+    traced = None
+    if tracemalloc:
+        traced = tracemalloc.get_traced_memory()[1]/2.**20
+        tracemalloc.stop()
+    queue.put({'seconds':seconds,'rss_mb':peak_rss()-rss0,'traced_mb':traced})
+
+def run_stage(stage,size):
+    queue = multiprocessing.Queue()
+    p = multiprocessing.Process(target=measure,args=(stage,size,queue))
+    p.start()
+    p.join()
+    if p.exitcode != 0:
+        return {'error':'exit code %s' % p.exitcode}
+    return queue.get()
+
+def bench(stage_names,size_list,repeat=1):
+    """Cold and warm results for each stage and size, as a list of dicts."""
+    results = []
+    for size in size_list:
+        make_fixtures(size)
+        for stage in stage_names:
+            shutil.rmtree(os.path.join(workdir,'cache'),ignore_errors=True)
+            cold = run_stage(stage,size)
+            warm = [run_stage(stage,size) for k in range(repeat)]
+            warm = min(warm,key=lambda r: r.get('seconds',np.inf))
+            for mode,r in (('cold',cold),('warm',warm)):
+                r.update(stage=stage,size=size,mode=mode)
+                results.append(r)
+                report(r)
+    return results
+
+def report(r,old=None):
+    if 'error' in r:
+        print('%-10s %2d %-5s  %s' % (r['stage'],r['size'],r['mode'],r['error']))
+        return
+    line = '%-10s %2d %-5s %9.3f s %8.1f MB' % (r['stage'],r['size'],r['mode'],r['seconds'],r['rss_mb'])
+    if r.get('traced_mb') is not None:
+        line += ' %8.1f MB traced' % r['traced_mb']
+    if old and old.get('seconds'):
+        line += '   x%.2f time vs old' % (r['seconds']/old['seconds'])
+    print(line)
+
+def compare(results,fname):
+    '''print the results again with the time ratio to those in fname'''
+    old = dict([((r['stage'],r['size'],r['mode']),r) for r in json.load(open(fname))])
+    print('compared with %s:' % fname)
+    for r in results:
+        report(r,old.get((r['stage'],r['size'],r['mode'])))
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='benchmark the merge stages on synthetic data')
+    parser.add_argument('--stages',default=','.join(sorted(stages)))
+    parser.add_argument('--sizes',default=','.join([str(s) for s in sizes]))
+    parser.add_argument('--repeat',type=int,default=1,help='warm runs (the fastest is kept)')
+    parser.add_argument('--out',help='write the results to this JSON file')
+    parser.add_argument('--compare',help='JSON results of an earlier run to compare with')
+    args = parser.parse_args()
+    results = bench(args.stages.split(','),[int(s) for s in args.sizes.split(',')],args.repeat)
+    if args.out:
+        f = open(args.out,'w')
+        json.dump(results,f,indent=1)
+        f.close()
+    if args.compare:
+        compare(results,args.compare)
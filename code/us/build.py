@@ -0,0 +1,323 @@
+"""
+build: merge the model sources onto all the map domains in one run.
+
+The domain scripts each read their own sources, so NECOFS, HYCOM and the
+GLCFS lakes were downloaded by several of them in the same hour.  build
+plans the domains of registry.domains together: every source that any
+of them needs is read once (concurrently, see fetch.py), over the union
+of the bounds of the domains that use it, and the resulting Field is
+regridded onto each of those domains (see regrid.merge), optionally
+with the sources of a domain regridded in parallel processes
+(regrid_workers, see regrid_pool.py).
+
+    python build.py                   # all domains
+    python build.py us great_lakes    # just these
+    python build.py --outdir /var/www/%(name)s
+    python build.py --regrid-workers 4
+
+The output of each domain goes to outdir % {'name':name}, by default a
+directory named after the domain.  The hourly cron job (do_merge_vel)
+builds every domain in one run, replacing the per-domain merge_vel
+scripts.  The time, bytes and memory of every stage of every source and
+domain go to a JSON run report, and optionally to a Prometheus text file
+(see metrics.py).
+
+Reading the sources stops at deadline seconds into the run, and each
+source gets its registry timeout (or fetch.timeout) per attempt, so a
+hung server can't hold up the run.  A source that fails or is cut off
+is filled in from its last good field (see last_good.py), and the
+output metadata (ocean-data.json, tiles/index.json) lists it under
+"stale" with the age of its data (from the middle of its averaging
+window), or under "missing" if there is none.
+
+Before reading anything, every source is probed for a new time step, a
+changed grid or a time window that moved (the hours around now, or the
+frames from the current hour), and domains built since from the same
+data over the same steps are skipped (see changes.py); --force builds
+them anyway.  The points of a domain that none of its sources filled
+(land, mostly) are kept in cache/land, so the next merge can stop as
+soon as the rest are filled.
+
+With --animate, instead of the mean field each domain gets an animation
+of the next frame_hours hours of the forecast, every frame_step hours
+(ocean-frames.bin, see ocean_data.write_frames).  Each source is read
+for all the frames at once and regridded with one set of weights.
+
+    python build.py --animate us
+"""
+import os
+import time
+import argparse
+import datetime
+import numpy as np
+import regrid_pool
+import ocean_data
+import tiles
+import fetch
+import surf_vel
+import surf_vel_roms
+import registry
+import metrics
+import last_good
+import changes
+import atomic
+
+deadline = 45*60.   # seconds into a run by which the sources must be read
+frame_hours = 72    # length of an animation
+frame_step = 1      # hours between its frames
+date_format = '%I:00 %p on %b %d, %Y'     # of the output timestamp
+land_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),'cache','land')
+
+def domain_grid(dom):
+    '''x,y linspaces of a domain'''
+    if 'width' in dom:
+        nx,ny = dom['width'],dom['height']
+    else:
+        nx = int((dom['x1']-dom['x0'])/dom['dx']+1)
+        ny = int((dom['y1']-dom['y0'])/dom['dy']+1)
+    return np.linspace(dom['x0'],dom['x1'],nx),np.linspace(dom['y0'],dom['y1'],ny)
+
+def plan(names):
+    """Sources needed by the domains names, each with the bounds
+    (x0,x1,y0,y1) of the union of the domains that use it.
+    """
+    need = {}
+    for name in names:
+        dom = registry.domains[name]
+        box = (dom['x0'],dom['x1'],dom['y0'],dom['y1'])
+        for s in dom['sources']:
+            b = need.get(s,box)
+            need[s] = (min(b[0],box[0]),max(b[1],box[1]),min(b[2],box[2]),max(b[3],box[3]))
+    return need
+
+def priority(name):
+    '''sort key of a source: sorted() is stable, so sources of the same
+    priority keep the order they are listed in'''
+    return registry.sources[name]['priority']
+
+def frame_times(date_now,hours=None,step=None):
+    '''times of the frames of an animation starting at the hour of date_now'''
+    hours = hours or frame_hours
+    step = step or frame_step
+    t0 = date_now.replace(minute=0,second=0,microsecond=0)
+    return [t0+datetime.timedelta(hours=h) for h in range(0,hours,step)]
+
+def source_job(name,bounds,date_mid,frames=None):
+    '''fetch.fetch_all job reading source name over bounds (given frames,
+    the u,v at each of those times instead of the mean)'''
+    opts = dict(registry.sources[name])
+    if frames is not None:
+        opts['frames'] = frames
+    opts.pop('timeout',None)
+    url = opts.pop('url')
+    grid = opts.pop('grid')
+    del opts['priority']
+    x = np.array(bounds[:2])
+    y = np.array(bounds[2:])
+    if grid=='roms':
+        return (url,surf_vel_roms.surf_vel_roms,(x,y,url),dict(opts,date_mid=date_mid))
+    return (url,surf_vel.surf_vel,(x,y,url),dict(opts,date_mid=date_mid,ugrid=(grid=='ugrid')))
+
+def read_sources(order,jobs,deadline,max_workers=None,animate=False):
+    """Run the jobs of the sources order (by fetch.fetch_all, until the
+    time.time() value deadline), and return their fields and a dict of
+    the sources that failed: their last good field's age or why there is
+    none.
+    """
+    failures = {}
+    results = fetch.fetch_all(jobs,max_workers=max_workers,failures=failures,
+                              timeout=[registry.sources[s].get('timeout') for s in order],
+                              deadline=deadline)
+    fields = {}
+    failed = {}
+    for k,s in enumerate(order):
+        url = jobs[k][0]
+        if k not in failures:
+            fields[s] = results[k]
+            # animations are only of the current forecast
+            if results[k] is not None and not animate:
+                last_good.save(s,url,results[k])
+            continue
+        field,saved = (None,None) if animate else last_good.load(s,url)
+        fields[s] = field
+        if field is None:
+            failed[s] = {'reason':failures[k]}
+            print('no field for %s' % s)
+        else:
+            # how old the data is, not the copy of it: a field saved an hour
+            # ago may be an average centred a day before that
+            age = last_good.age(field,saved)/3600.
+            failed[s] = {'reason':failures[k],'age_hours':round(age,2),
+                         'saved':time.strftime('%Y-%m-%dT%H:%M:%SZ',time.gmtime(saved))}
+            if getattr(field,'date',None) is not None:
+                failed[s]['data_time'] = field.date.strftime('%Y-%m-%dT%H:%M:%SZ')
+            print('using the field of %s from %.1f hours ago' % (s,age))
+    return fields,failed
+
+def probe_sources(names,date_mid,frames=None,max_workers=None):
+    """changes.probe of each of the sources names (None where it failed),
+    for the window around date_mid or the frames, run concurrently."""
+    jobs = []
+    for s in names:
+        src = registry.sources[s]
+        opts = dict(date_mid=date_mid,hours_ave=src.get('hours_ave',24),frames=frames,
+                    frame_tol=src.get('frame_tol',3.))
+        jobs.append((src['url'],changes.probe,(src['url'],changes.time_var(src),changes.grid_vars(src)),opts))
+    failures = {}
+    results = fetch.fetch_all(jobs,max_workers=max_workers,timeout=changes.timeout,retries=0,
+                              failures=failures)
+    return dict(zip(names,results))
+
+def output_file(name,outdir,animate=False):
+    return os.path.join(outdir % {'name':name},'ocean-frames.json' if animate else 'ocean-data.json')
+
+def land_file(name):
+    return os.path.join(land_dir,name+'.npz')
+
+def load_land(name,x,y):
+    """The points of domain name that no source filled when it was last
+    built from all its sources, or None."""
+    try:
+        z = np.load(land_file(name))
+        try:
+            if np.array_equal(z['x'],x) and np.array_equal(z['y'],y):
+                return z['land']
+        finally:
+            z.close()
+    except (IOError,OSError,ValueError,KeyError):
+        pass
+    return None
+
+def save_land(name,x,y,ui,vi):
+    try:
+        os.makedirs(land_dir)
+    except OSError:
+        pass
+    lead = tuple(range(ui.ndim-2))
+    land = ((ui==0)&(vi==0)).all(axis=lead) if lead else (ui==0)&(vi==0)
+    fname = land_file(name)
+    with atomic.writer(fname,'wb') as f:
+        np.savez(f,x=x,y=y,land=land)
+
+def stamp(dom,fields,now):
+    """The timestamp of a domain's output: now, or with timestamp='data'
+    the time of its first source's data, in EST."""
+    fmt = dom.get('date_format',date_format)
+    if dom.get('timestamp')=='data':
+        for s in sorted(dom['sources'],key=priority):
+            date = getattr(fields.get(s),'date',None)
+            if date is not None:
+                return (date-datetime.timedelta(hours=5)).strftime(fmt)
+    return now.strftime(fmt)
+
+def status(dom,failed):
+    '''metadata for the sources of a domain that were not read this run'''
+    stale = dict([(s,failed[s]) for s in dom['sources'] if s in failed and 'age_hours' in failed[s]])
+    missing = dict([(s,failed[s]) for s in dom['sources'] if s in failed and 'age_hours' not in failed[s]])
+    return {'stale':stale,'missing':missing}
+
+def write_domain(dom,ui,vi,x,y,path,timestamp,extra=None):
+    '''write the merged field of a domain to path, and return the bytes written'''
+    try:
+        os.makedirs(path)
+    except OSError:
+        pass
+    x0,y0,x1,y1 = dom['x0'],dom['y0'],dom['x1'],dom['y1']
+    if dom.get('tiles'):
+        # zoom-level pyramid of tiles, so clients only fetch what they display
+        tiles.write_pyramid(os.path.join(path,'tiles'),ui,vi,x0,y0,x1,y1,timestamp,extra=extra)
+    ui = ui.T.flatten()     # transpose to convention for javascript
+    vi = vi.T.flatten()
+    ui[np.isnan(ui)] = 0.0
+    vi[np.isnan(vi)] = 0.0
+    ocean_data.write_js(os.path.join(path,'ocean-data.js'),ui,vi,x0,y0,x1,y1,len(x),len(y),timestamp)
+    # compact binary copy of the same field (ocean-data.bin + ocean-data.json)
+    ocean_data.write_bin(os.path.join(path,'ocean-data.bin'),ui,vi,x0,y0,x1,y1,len(x),len(y),timestamp,
+                         extra=extra)
+    return sum([os.path.getsize(os.path.join(path,f))
+                for f in ('ocean-data.js','ocean-data.bin','ocean-data.json')])
+
+def write_animation(dom,ui,vi,x,y,path,timestamp,times,extra=None):
+    '''write the merged frames of a domain to path, and return the bytes written'''
+    try:
+        os.makedirs(path)
+    except OSError:
+        pass
+    nt = len(times)
+    ui = ui.transpose(0,2,1).reshape(nt,-1)     # transpose to convention for javascript
+    vi = vi.transpose(0,2,1).reshape(nt,-1)
+    ocean_data.write_frames(os.path.join(path,'ocean-frames.bin'),ui,vi,
+                            dom['x0'],dom['y0'],dom['x1'],dom['y1'],len(x),len(y),timestamp,times,
+                            extra=extra)
+    return sum([os.path.getsize(os.path.join(path,f)) for f in ('ocean-frames.bin','ocean-frames.json')])
+
+def build(names=None,outdir='%(name)s',max_workers=None,regrid_workers=None,
+    report='run-report.json',prom=None,animate=False,deadline=None,force=False):
+    """Read every source needed by the domains names (all of them by
+    default) once, within deadline seconds, and merge and write each
+    domain.  Write the run report to report and, if given, Prometheus
+    metrics to prom.  With animate, write the frames of the forecast (see
+    frame_times) instead of the mean.  Unless force, domains whose sources
+    have nothing new since they were last built are skipped.
+    """
+    metrics.reset()
+    started = time.time()
+    names = names or sorted(registry.domains)
+    date_now = datetime.datetime.utcnow()
+    need = plan(names)
+    frames = frame_times(date_now) if animate else None
+    probes = probe_sources(sorted(need),date_now,frames,max_workers=max_workers)
+    state = changes.load()
+    if not force:
+        names = [n for n in names if not (changes.unchanged(state,n,registry.domains[n],probes,animate)
+                                          and os.path.exists(output_file(n,outdir,animate)))]
+        if not names:
+            # leave changes.json and the run report of the last build as they are
+            print('no source has anything new, nothing to build')
+            return
+        need = plan(names)
+    order = sorted(sorted(need),key=priority)
+    jobs = [source_job(s,need[s],date_now,frames) for s in order]
+    for job in jobs:
+        print(job[0])
+    fields,failed = read_sources(order,jobs,started+(deadline or globals()['deadline']),
+                                 max_workers=max_workers,animate=animate)
+
+    now = datetime.datetime.now()
+    for name in names:
+        dom = registry.domains[name]
+        timestamp = stamp(dom,fields,now)
+        x,y = domain_grid(dom)
+        print('merging %s' % name)
+        # each source only fills points the ones before it left empty, until
+        # all those left are the ones no source filled last time
+        with metrics.timer(name,'merge',shape=(len(y),len(x))):
+            ui,vi = regrid_pool.merge([fields[s] for s in sorted(dom['sources'],key=priority)],x,y,
+                                      workers=regrid_workers,land=load_land(name,x,y))
+        with metrics.timer(name,'write') as m:
+            extra = status(dom,failed)
+            if animate:
+                m.nbytes = write_animation(dom,ui,vi,x,y,outdir % {'name':name},timestamp,frames,extra)
+            else:
+                m.nbytes = write_domain(dom,ui,vi,x,y,outdir % {'name':name},timestamp,extra)
+        if not [s for s in dom['sources'] if s in failed]:
+            state[changes.key(name,animate)] = changes.domain_state(dom,probes)
+            save_land(name,x,y,ui,vi)
+    changes.save(state)
+    if report:
+        metrics.write_json(report)
+    if prom:
+        metrics.write_prometheus(prom)
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='merge the model sources onto the map domains')
+    parser.add_argument('names',nargs='*',help='domains to build (default all)')
+    parser.add_argument('--outdir',default='%(name)s',
+                        help='output directory, %%(name)s for the domain name')
+    parser.add_argument('--animate',action='store_true',help='the forecast frames instead of the mean')
+    parser.add_argument('--force',action='store_true',help='build domains whose sources have nothing new')
+    parser.add_argument('--regrid-workers',type=int,default=None,
+                        help='processes regridding the sources of a domain (default 1)')
+    args = parser.parse_args()
+    build(args.names or None,outdir=args.outdir,regrid_workers=args.regrid_workers,animate=args.animate,
+          force=args.force)
@@ -0,0 +1,110 @@
+"""
+changes: skip rebuilding domains whose sources have nothing new.
+
+The models put out a new forecast a few times a day, but the cron job
+rebuilds every domain every hour.  For each source, probe opens the
+dataset and brings its time axis up to date (see time_axis.py, which
+reads only the tail of it), and reads a signature of its grid (the
+shapes and a checksum of a coarse sample of the grid arrays, as
+grid_store does), which is a few bytes on top of the metadata.
+
+The window of time steps a run would read moves with the clock even
+when the data doesn't: the mean is over the hours_ave hours around now,
+and an animation starts at the current hour.  So the probe also gives
+the steps this run would use, istart and istop of the mean (see
+TimeAxis.window) or the step of each frame, and a source whose window
+moved has changed as much as one with a new forecast.
+
+The state each domain was last built from is kept in cache/changes.json;
+a domain whose sources all probe the same as then (and whose own
+definition is unchanged) need not be built again.
+
+A source that can't be probed counts as unchanged: there is nothing new
+to be had from it, and if the last build used it, its field is as good
+as it was.  A domain is only recorded once it was built with all its
+sources read (none filled in from last_good).
+"""
+import os
+import json
+import netCDF4
+import grid_store
+import time_axis
+import metrics
+import atomic
+
+state_file = os.path.join(os.path.dirname(os.path.abspath(__file__)),'cache','changes.json')
+timeout = 120.      # seconds to probe a source
+
+def grid_vars(src):
+    '''names of the grid arrays of a registry source'''
+    if src['grid']=='roms':
+        return ['lon_rho','lat_rho','mask_rho']
+    return [src.get('lonvar','lon'),src.get('latvar','lat')]
+
+def time_var(src):
+    '''name of the time variable of a registry source'''
+    return src.get('tvar','ocean_time' if src['grid']=='roms' else 'time')
+
+def probe(url,tvar,names,date_mid=None,hours_ave=24,frames=None,frame_tol=3.):
+    """Length and last value of the time axis tvar, the steps of it a run
+    would read (the window of the mean around date_mid or, given frames,
+    the step of each frame) and the signature of the grid arrays names of
+    the dataset at url."""
+    with metrics.timer(url,'probe'):
+        nc = netCDF4.Dataset(url)
+        try:
+            n = len(nc.variables[tvar])
+            last = window = None
+            if n:
+                taxis = time_axis.get(url,tvar,nc)
+                last = float(taxis.values[-1])
+                if frames is not None:
+                    window = [int(i) for i in taxis.indices(frames,3600.*frame_tol)]
+                elif date_mid is not None:
+                    window = [int(i) for i in taxis.window(date_mid,hours_ave)]
+            grid = []
+            for name in names:
+                var = nc.variables[name]
+                grid.append([name,list(var.shape),
+                             grid_store.checksum(var[grid_store.sample_index(var.shape)])])
+        finally:
+            nc.close()
+    return {'ntimes':n,'last_time':last,'window':window,'grid':grid}
+
+def load(fname=None):
+    fname = fname or state_file
+    try:
+        f = open(fname)
+        try:
+            return json.load(f)
+        finally:
+            f.close()
+    except (IOError,OSError,ValueError):
+        return {}
+
+def save(state,fname=None):
+    fname = fname or state_file
+    try:
+        os.makedirs(os.path.dirname(fname))
+    except OSError:
+        pass
+    atomic.write_text(fname,json.dumps(state,indent=1,sort_keys=True))
+
+def key(name,animate=False):
+    return name+(':animate' if animate else '')
+
+def domain_state(dom,probes):
+    '''what a domain is built from: its definition and its sources' probes'''
+    return {'domain':json.loads(json.dumps(dom,sort_keys=True)),
+            'sources':dict([(s,probes.get(s)) for s in dom['sources']])}
+
+def unchanged(state,name,dom,probes,animate=False):
+    """True if the domain name was last built from the same sources, by
+    probes (None for a source that couldn't be probed)."""
+    old = state.get(key(name,animate))
+    if old is None or old['domain']!=json.loads(json.dumps(dom,sort_keys=True)):
+        return False
+    for s in dom['sources']:
+        if probes.get(s) is not None and probes[s]!=old['sources'].get(s):
+            return False
+    return True
@@ -0,0 +1,258 @@
+"""
+dap_server: a small local OPeNDAP (DAP2) server for netCDF files, with
+injected latency, bandwidth caps and errors.
+
+It serves the .dds, .das and .dods responses that netCDF4.Dataset needs
+to open a url and read hyperslabs of its variables.  Variables are all
+plain arrays; their types are limited to Float32/64, Int16/32 and Byte.
+That is enough to stand in for a THREDDS server in load tests (see
+loadtest.py), not a general OPeNDAP implementation.
+
+    server = dap_server.serve({'hycom':'hycom.nc'},latency=0.5,error_rate=0.05)
+    nc = netCDF4.Dataset(server.url('hycom'))
+    ...
+    server.shutdown()
+
+Every request waits latency seconds (plus up to jitter more), fails with
+probability error_rate, and sends its body at no more than bandwidth
+bytes per second.
+
+serve runs the server in a process of its own: the netCDF library is
+not thread safe, and the client reading from the server uses it too.
+The request, error and byte counts are kept in shared memory, so the
+caller can read them as server.stats.
+"""
+import re
+import sys
+import time
+import random
+import threading
+import multiprocessing
+import numpy as np
+import netCDF4
+try:
+    from BaseHTTPServer import HTTPServer,BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    from urllib import unquote
+except ImportError:
+    from http.server import HTTPServer,BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from urllib.parse import unquote
+
+# numpy dtype kind+size -> DAP type, XDR dtype on the wire
+types = {
+    'f4': ('Float32','>f4'),
+    'f8': ('Float64','>f8'),
+    'i4': ('Int32','>i4'),
+    'i2': ('Int16','>i4'),     # XDR sends 16 bit ints as 32 bits
+    'u2': ('UInt16','>u4'),
+    'u4': ('UInt32','>u4'),
+    'u1': ('Byte','u1'),
+    'i1': ('Byte','u1'),
+}
+
+stat_names = ('requests','errors','bytes')
+
+_nclock = threading.Lock()  # the request threads of a server share the netCDF library
+
+def dap_type(dtype):
+    return types.get('%s%d' % (dtype.kind,dtype.itemsize),('Float64','>f8'))
+
+def declaration(name,var,shape,indent='    '):
+    dims = ''.join(['[%s = %d]' % (d,n) for d,n in zip(var.dimensions,shape)])
+    return '%s%s %s%s;\n' % (indent,dap_type(var.dtype)[0],name,dims)
+
+def dds(nc,name,projection):
+    text = 'Dataset {\n'
+    for vname,index in projection:
+        var = nc.variables[vname]
+        text += declaration(vname,var,shape_of(var.shape,index))
+    return text+'} %s;\n' % name
+
+def attr_value(v):
+    if isinstance(v,(str,bytes)) or not np.ndim(v) and isinstance(v,type(u'')):
+        if isinstance(v,bytes):
+            v = v.decode('utf-8','replace')
+        return 'String','"%s"' % v.replace('\\','\\\\').replace('"','\\"')
+    a = np.atleast_1d(np.asarray(v))
+    t = dap_type(a.dtype)[0]
+    return t,', '.join([repr(x.item()) for x in a])
+
+def das(nc):
+    text = 'Attributes {\n'
+    for vname,var in nc.variables.items():
+        text += '    %s {\n' % vname
+        for att in var.ncattrs():
+            t,val = attr_value(var.getncattr(att))
+            text += '        %s %s %s;\n' % (t,att,val)
+        text += '    }\n'
+    text += '    NC_GLOBAL {\n'
+    for att in nc.ncattrs():
+        t,val = attr_value(nc.getncattr(att))
+        text += '        %s %s %s;\n' % (t,att,val)
+    return text+'    }\n}\n'
+
+def parse_constraint(ce,nc):
+    """[(variable, tuple of slices)] for a DAP2 projection such as
+    'u[0:1:5][0][10:99],lon'."""
+    projection = []
+    for item in [c for c in unquote(ce).split('&')[0].split(',') if c]:
+        m = re.match(r'^([^\[]+)((\[[^\]]*\])*)$',item)
+        if m is None:
+            raise ValueError('bad constraint %s' % item)
+        vname = m.group(1)
+        if vname not in nc.variables:
+            raise KeyError(vname)
+        index = []
+        for h in re.findall(r'\[([^\]]*)\]',m.group(2)):
+            p = [int(n) for n in h.split(':')]
+            if len(p)==1:
+                index.append(slice(p[0],p[0]+1,1))
+            elif len(p)==2:
+                index.append(slice(p[0],p[1]+1,1))
+            else:
+                index.append(slice(p[0],p[2]+1,p[1]))
+        ndim = len(nc.variables[vname].shape)
+        index += [slice(None)]*(ndim-len(index))
+        projection.append((vname,tuple(index)))
+    if not projection:
+        projection = [(vname,(slice(None),)*len(var.shape)) for vname,var in nc.variables.items()]
+    return projection
+
+def shape_of(shape,index):
+    return tuple([len(range(*i.indices(n))) for n,i in zip(shape,index)])
+
+def xdr(a,dtype):
+    """XDR encoding of a DAP2 array: the length twice (once for Byte),
+    then the values."""
+    a = np.ascontiguousarray(a,dtype=dtype)
+    n = np.array([a.size,a.size],dtype='>u4').tobytes()
+    if dtype=='u1':
+        pad = (-a.size) % 4
+        return n+a.tobytes()+b'\0'*pad
+    return n+a.tobytes()
+
+class Handler(BaseHTTPRequestHandler):
+
+    def log_message(self,*args):
+        pass
+
+    def do_GET(self):
+        srv = self.server
+        srv.count('requests')
+        delay = srv.latency+random.random()*srv.jitter
+        if delay:
+            time.sleep(delay)
+        if random.random() < srv.error_rate:
+            srv.count('errors')
+            return self.send(500,'Error {\n    code = 500;\n    message = "injected error";\n};\n')
+        path,_,ce = self.path.partition('?')
+        m = re.match(r'^/(.*)\.(dds|das|dods)$',path)
+        if m is None or m.group(1) not in srv.datasets:
+            return self.send(404,'Error {\n    code = 404;\n    message = "no such dataset";\n};\n')
+        name,kind = m.groups()
+        try:
+            with _nclock:
+                nc = netCDF4.Dataset(srv.datasets[name])
+                try:
+                    nc.set_auto_maskandscale(False)
+                    if kind=='das':
+                        body = das(nc)
+                    else:
+                        projection = parse_constraint(ce,nc)
+                        body = dds(nc,name,projection)
+                        if kind=='dods':
+                            body = body.encode('utf-8')+b'\nData:\n'
+                            for vname,index in projection:
+                                var = nc.variables[vname]
+                                body += xdr(var[index],dap_type(var.dtype)[1])
+                finally:
+                    nc.close()
+        except (ValueError,KeyError,IndexError):
+            return self.send(400,'Error {\n    code = 400;\n    message = "%s";\n};\n' % sys.exc_info()[1])
+        self.send(200,body,'application/octet-stream' if kind=='dods' else 'text/plain')
+
+    def send(self,code,body,ctype='text/plain'):
+        if not isinstance(body,bytes):
+            body = body.encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type',ctype)
+        self.send_header('Content-Length',str(len(body)))
+        self.send_header('XDODS-Server','dods/2.0')
+        self.end_headers()
+        rate = self.server.bandwidth
+        step = max(int(rate/20),1024) if rate else len(body) or 1
+        for k in range(0,len(body),step):
+            t0 = time.time()
+            self.wfile.write(body[k:k+step])
+            if rate:
+                wait = float(len(body[k:k+step]))/rate-(time.time()-t0)
+                if wait>0:
+                    time.sleep(wait)
+        self.server.count('bytes',len(body))
+
+class Server(ThreadingMixIn,HTTPServer):
+    daemon_threads = True
+
+    def __init__(self,datasets,port=0,latency=0.,jitter=0.,bandwidth=None,error_rate=0.,counts=None):
+        HTTPServer.__init__(self,('127.0.0.1',port),Handler)
+        self.datasets = datasets
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.counts = counts if counts is not None else multiprocessing.Array('d',len(stat_names))
+
+    def count(self,key,n=1):
+        with self.counts.get_lock():
+            self.counts[stat_names.index(key)] += n
+
+def run(datasets,kwargs,counts,conn):
+    """Run a Server in this (child) process, sending its port, or the
+    error that stopped it starting, back on conn."""
+    try:
+        server = Server(datasets,counts=counts,**kwargs)
+    except Exception:
+        conn.send(sys.exc_info()[1])
+        return
+    conn.send(server.server_address[1])
+    conn.close()
+    server.serve_forever()
+
+class Running(object):
+    '''a Server running in a child process'''
+    def __init__(self,datasets,**kwargs):
+        self.counts = multiprocessing.Array('d',len(stat_names))
+        recv,send = multiprocessing.Pipe(False)
+        self.proc = multiprocessing.Process(target=run,args=(datasets,kwargs,self.counts,send))
+        self.proc.daemon = True
+        self.proc.start()
+        send.close()
+        msg = recv.recv()
+        recv.close()
+        if isinstance(msg,Exception):
+            self.proc.join()
+            raise msg
+        self.port = msg
+
+    @property
+    def stats(self):
+        return dict(zip(stat_names,[int(n) for n in self.counts[:]]))
+
+    def url(self,name):
+        return 'http://127.0.0.1:%d/%s' % (self.port,name)
+
+    def shutdown(self):
+        if self.proc.is_alive():
+            self.proc.terminate()
+        self.proc.join()
+
+    def server_close(self):
+        self.shutdown()
+
+def serve(datasets,**kwargs):
+    """Start a Server for datasets, a dict of name -> netCDF file, in a
+    child process and return a handle to it (url, stats, shutdown).
+    Keyword arguments are those of Server (port, latency, jitter,
+    bandwidth, error_rate)."""
+    return Running(datasets,**kwargs)
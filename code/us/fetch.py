@@ -0,0 +1,202 @@
+"""
+fetch: read several model sources concurrently.
+
+fetch_all runs a list of source jobs (typically surf_vel or surf_vel_roms
+calls) at most max_workers at a time, so the run takes about as long as
+the slowest source instead of the sum of all of them.  No more than
+per_host jobs run against the same server at once, so e.g. the five GLCFS
+lakes don't all hit michigan.glin.net together.  Results come back in job
+order, so the caller can do the usual priority merge exactly as before.
+
+The netCDF library is not thread safe, so each attempt at a job runs in a
+child process of its own (forked, so it sees the caller's settings) and
+sends its result, and the metrics it recorded, back through a pipe.  A
+server that hangs makes netCDF4.Dataset(url) block for good, so an
+attempt still running after timeout seconds is killed, along with any
+processes it started.  A failed, crashed or killed job is retried up to
+retries times, waiting retry_wait seconds before the first retry and
+twice as long each time after.  Given a deadline (a time.time() value),
+nothing runs past it: attempts still running then are killed and jobs not
+started are given up on.  By default a job that fails raises; with a
+failures dict, its result is None and the reason goes in failures
+instead, so the caller can carry on without it.
+
+With max_workers=1 the jobs run one after another, as they used to.
+"""
+import os
+import sys
+import time
+import signal
+import multiprocessing
+try:
+    from urlparse import urlparse
+except ImportError:
+    from urllib.parse import urlparse
+import metrics
+
+max_workers = 6
+per_host = 2
+timeout = 20*60.    # seconds per attempt at a job
+retries = 1         # extra attempts at a failed job
+retry_wait = 30.    # seconds before the first retry, doubled each time
+poll = 0.05         # seconds between checks on the running jobs
+
+# children are forked, so they see the caller's settings (cache dirs,
+# worker counts, ...) without pickling anything (also used by reader.py)
+try:
+    context = multiprocessing.get_context('fork')
+except AttributeError:
+    context = multiprocessing   # python 2 always forks
+
+def host(url):
+    return urlparse(url).netloc
+
+class Timeout(Exception):
+    '''a job that took longer than its timeout or the deadline'''
+
+class Failed(Exception):
+    '''a job that failed in a way that can't be sent back as it was'''
+
+def child(conn,func,args,kwargs):
+    '''run one attempt at a job and send back its result and metrics'''
+    try:
+        os.setpgid(0,0)     # so a kill takes any processes it starts too
+    except OSError:
+        pass
+    metrics.reset()
+    try:
+        msg = ('ok',func(*args,**kwargs))
+    except Exception:
+        err = sys.exc_info()
+        msg = ('error',err[1])
+        print('%s: %s' % (err[0].__name__,err[1]))
+    try:
+        conn.send(msg+(metrics.snapshot(),))
+    except Exception:
+        # unpicklable exception (or result)
+        conn.send(('error',Failed('%s: %s' % (type(msg[1]).__name__,msg[1])),metrics.snapshot()))
+    conn.close()
+
+def kill(p):
+    try:
+        os.killpg(p.pid,signal.SIGKILL)
+    except OSError:
+        p.terminate()
+    p.join()
+
+class Attempt(object):
+    '''one attempt at a job, running in a child process'''
+    def __init__(self,func,args,kwargs,limit):
+        self.conn,send = context.Pipe(False)
+        self.proc = context.Process(target=child,args=(send,func,args,kwargs))
+        self.proc.daemon = False    # it may start processes of its own
+        self.proc.start()
+        send.close()
+        self.started = time.time()
+        self.limit = limit
+
+    def outcome(self):
+        """('ok',result) or ('error',exception) once the attempt is over,
+        None while it is still running."""
+        msg = None
+        if self.conn.poll():
+            try:
+                status,value,snap = self.conn.recv()
+                metrics.merge(snap)
+                msg = (status,value)
+            except (EOFError,IOError,OSError):
+                self.proc.join()
+                msg = ('error',Failed('process died (exit code %s)' % self.proc.exitcode))
+        elif not self.proc.is_alive():
+            if self.conn.poll():
+                return self.outcome()
+            msg = ('error',Failed('process died (exit code %s)' % self.proc.exitcode))
+        elif time.time()-self.started > self.limit:
+            kill(self.proc)
+            msg = ('error',Timeout('no answer after %.1f s' % self.limit))
+        if msg is not None:
+            self.proc.join()
+            self.conn.close()
+        return msg
+
+def fetch_all(jobs,max_workers=None,per_host=None,timeout=None,retries=None,
+    retry_wait=None,deadline=None,failures=None):
+    """Run jobs, a list of (url, func, args, kwargs), and return the list
+    of func(*args,**kwargs) results in the same order.  If any job raises,
+    the first exception (in job order) is raised once all jobs are done,
+    unless failures (a dict) is given: then the jobs that failed or missed
+    the deadline are None in the results and failures[k] says why job k
+    failed.  timeout is in seconds per attempt, or a list of them per job
+    (None for the default).
+    """
+    max_workers = max_workers or globals()['max_workers']
+    per_host = per_host or globals()['per_host']
+    default = globals()['timeout']
+    retries = retries if retries is not None else globals()['retries']
+    retry_wait = retry_wait if retry_wait is not None else globals()['retry_wait']
+    njobs = len(jobs)
+    timeouts = timeout if isinstance(timeout,(list,tuple)) else [timeout]*njobs
+    timeouts = [t or default for t in timeouts]
+    results = [None]*njobs
+    errors = [None]*njobs
+    tries = [0]*njobs
+    waits = [retry_wait]*njobs
+    not_before = [0.]*njobs
+    pending = list(range(njobs))
+    running = {}
+    active = {}
+
+    while pending or running:
+        now = time.time()
+        for k in sorted(running):
+            msg = running[k].outcome()
+            if msg is None:
+                continue
+            del running[k]
+            url = jobs[k][0]
+            active[host(url)] -= 1
+            status,value = msg
+            if status=='ok':
+                results[k] = value
+                continue
+            tries[k] += 1
+            left = None if deadline is None else deadline-time.time()
+            if tries[k]<=retries and (left is None or left>waits[k]):
+                print('retrying %s (%s)' % (url,value))
+                not_before[k] = time.time()+waits[k]
+                waits[k] *= 2
+                pending.append(k)
+                pending.sort()
+            else:
+                errors[k] = value
+                print('failed: %s (%s)' % (url,value))
+
+        if deadline is not None and now>=deadline:
+            # jobs not started (or waiting to retry) by the deadline
+            for k in pending:
+                errors[k] = errors[k] or Timeout('deadline passed before it started')
+                print('failed: %s (%s)' % (jobs[k][0],errors[k]))
+            pending = []
+
+        # start the first pending jobs whose servers aren't already busy
+        for k in list(pending):
+            if len(running)>=max_workers:
+                break
+            h = host(jobs[k][0])
+            if active.get(h,0)>=per_host or not_before[k]>now:
+                continue
+            url,func,args,kwargs = jobs[k]
+            limit = timeouts[k] if deadline is None else min(timeouts[k],deadline-now)
+            pending.remove(k)
+            active[h] = active.get(h,0)+1
+            running[k] = Attempt(func,args,kwargs,limit)
+        if pending or running:
+            time.sleep(poll)
+
+    for k,err in enumerate(errors):
+        if err is None:
+            continue
+        if failures is None:
+            raise err
+        failures[k] = '%s: %s' % (type(err).__name__,err)
+    return results
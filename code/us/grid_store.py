@@ -0,0 +1,248 @@
+"""
+grid_store: local copies of the static grid arrays of each model source.
+
+lon_rho, lat_rho, mask_rho, angle, lonc/latc and the 1D HYCOM/NCOM
+coordinates never change, but were downloaded on every run.  A Grid keeps
+them in cache/grid after the first read.  Later runs check only the
+shapes, which come with the dataset metadata anyway.  Every recheck_hours
+they also check a checksum of a coarse strided sample of each array,
+which is a few bytes.
+
+Each Grid also keeps a BoxIndex per lon/lat pair: the bounding box of
+every block of block x block cells.  Finding the cells inside a domain's
+x,y bounds then only looks at the blocks whose boxes overlap it, instead
+of running np.where over the whole 2D lon/lat.
+
+    g = grid_store.get(url,['lon_rho','lat_rho','mask_rho','angle'],nc)
+    igood = g.where('lon_rho','lat_rho',x.min(),x.max(),y.min(),y.max())
+"""
+import os
+import time
+import hashlib
+import warnings
+import numpy as np
+import netCDF4
+import atomic
+
+cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),'cache','grid')
+recheck_hours = 24.
+nsample = 4         # samples per dimension in the checksum
+block = 16          # cells per side of a BoxIndex block
+
+_grids = {}         # (url,names) -> Grid, for reuse within a run
+
+def sample_index(shape):
+    '''strided index picking about nsample values along each dimension'''
+    return tuple([slice(0,n,max(n//nsample,1)) for n in shape])
+
+def checksum(a):
+    a = np.ma.filled(np.ma.asarray(a,dtype=np.float64),np.nan)
+    return hashlib.sha1(np.ascontiguousarray(a).tobytes()).hexdigest()
+
+def as_array(a):
+    '''plain ndarray, masked values as NaN for floating point data'''
+    if np.ma.isMaskedArray(a):
+        if a.dtype.kind=='f':
+            return np.ma.filled(a,np.nan)
+        return np.ma.getdata(a)
+    return np.asarray(a)
+
+class BoxIndex(object):
+    """Bounding boxes of block x block cells of a 2D lon/lat grid (or of
+    runs of block**2 consecutive points of an unstructured one).
+    """
+    fields = ('lonmin','lonmax','latmin','latmax')
+
+    def __init__(self,lon,lat,block=block,arrays=None):
+        if arrays is not None:
+            # restored from the store
+            self.shape = tuple(arrays['shape'])
+            self.block = tuple(arrays['block'])
+            for f in self.fields:
+                setattr(self,f,arrays[f])
+            return
+        lon = np.asarray(lon,dtype=np.float64)
+        lat = np.asarray(lat,dtype=np.float64)
+        self.shape = lon.shape
+        if lon.ndim==1:
+            self.block = (1,block*block)
+            lon = lon[np.newaxis,:]
+            lat = lat[np.newaxis,:]
+        else:
+            self.block = (block,block)
+        self.lonmin,self.lonmax = self.minmax(lon)
+        self.latmin,self.latmax = self.minmax(lat)
+
+    def minmax(self,a):
+        bj,bi = self.block
+        ny,nx = a.shape
+        nby = -(-ny//bj)
+        nbx = -(-nx//bi)
+        p = np.empty((nby*bj,nbx*bi))
+        p.fill(np.nan)
+        p[:ny,:nx] = a
+        p = p.reshape(nby,bj,nbx,bi)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore',RuntimeWarning)   # all-NaN blocks
+            return (np.nanmin(np.nanmin(p,axis=3),axis=1),
+                    np.nanmax(np.nanmax(p,axis=3),axis=1))
+
+    def to_arrays(self):
+        arrays = dict([(f,getattr(self,f)) for f in self.fields])
+        arrays['shape'] = np.array(self.shape)
+        arrays['block'] = np.array(self.block)
+        return arrays
+
+    def blocks(self,x0,x1,y0,y1):
+        '''(jb,ib) of the blocks whose boxes overlap the bounds'''
+        return np.where((self.lonmax>=x0)&(self.lonmin<=x1)&
+                        (self.latmax>=y0)&(self.latmin<=y1))
+
+    def where(self,lon,lat,x0,x1,y0,y1):
+        """Same as np.where((lon>=x0)&(lon<=x1)&(lat>=y0)&(lat<=y1)), looking
+        only at the blocks that overlap the bounds.
+        """
+        lon = np.asarray(lon)
+        lat = np.asarray(lat)
+        flat = (lon.ndim==1)
+        if flat:
+            lon = lon[np.newaxis,:]
+            lat = lat[np.newaxis,:]
+        bj,bi = self.block
+        jj = []
+        ii = []
+        for jb,ib in zip(*self.blocks(x0,x1,y0,y1)):
+            sj = slice(jb*bj,(jb+1)*bj)
+            si = slice(ib*bi,(ib+1)*bi)
+            lo = lon[sj,si]
+            la = lat[sj,si]
+            j,i = np.where((lo>=x0)&(lo<=x1)&(la>=y0)&(la<=y1))
+            jj.append(j+jb*bj)
+            ii.append(i+ib*bi)
+        if jj:
+            jj = np.concatenate(jj)
+            ii = np.concatenate(ii)
+            order = np.lexsort((ii,jj))    # same (row-major) order as np.where
+            jj = jj[order]
+            ii = ii[order]
+        else:
+            jj = np.zeros(0,dtype=np.intp)
+            ii = np.zeros(0,dtype=np.intp)
+        if flat:
+            return (ii,)
+        return (jj,ii)
+
+class Grid(object):
+    """The grid arrays names of the dataset at url, read once and then
+    served from the local store.
+    """
+    def __init__(self,url,names,nc=None):
+        self.url = url
+        self.names = list(names)
+        key = hashlib.sha1(('|'.join([url]+self.names)).encode('utf-8')).hexdigest()
+        self.fname = os.path.join(cache_dir,key+'.npz')
+        self.arrays = {}
+        self.sums = {}
+        self.checked = 0.
+        self.indexes = {}
+        self.nbytes = 0     # bytes of the arrays read from the dataset by the last get
+        self._nc = nc
+        if not self.load():
+            self.read()
+
+    def dataset(self):
+        if self._nc is None:
+            self._nc = netCDF4.Dataset(self.url)
+        return self._nc
+
+    def load(self):
+        """Load the stored arrays, and return True if they are still valid
+        for the dataset.
+        """
+        if not os.path.exists(self.fname):
+            return False
+        try:
+            z = np.load(self.fname)
+            for name in self.names:
+                self.arrays[name] = z['a:'+name]
+                self.sums[name] = str(z['s:'+name])
+            self.checked = float(z['checked'])
+            for k in z.files:
+                if k.startswith('i:'):
+                    lonvar,latvar,field = k[2:].split(':')
+                    self.indexes.setdefault((lonvar,latvar),{})[field] = z[k]
+            z.close()
+            for pair,arrays in self.indexes.items():
+                self.indexes[pair] = BoxIndex(None,None,arrays=arrays)
+        except Exception:
+            self.indexes = {}
+            return False
+        nc = self.dataset()
+        for name in self.names:
+            if nc.variables[name].shape != self.arrays[name].shape:
+                print('%s: %s has changed shape, reading grid again' % (self.url,name))
+                return False
+        if time.time()-self.checked > 3600.*recheck_hours:
+            for name in self.names:
+                var = nc.variables[name]
+                if checksum(var[sample_index(var.shape)]) != self.sums[name]:
+                    print('%s: %s has changed, reading grid again' % (self.url,name))
+                    return False
+            self.checked = time.time()
+            self.save()
+        return True
+
+    def read(self):
+        nc = self.dataset()
+        self.indexes = {}
+        self.nbytes = 0
+        for name in self.names:
+            a = as_array(nc.variables[name][:])
+            self.arrays[name] = a
+            self.nbytes += a.nbytes
+            self.sums[name] = checksum(a[sample_index(a.shape)])
+        self.checked = time.time()
+        self.save()
+
+    def save(self):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            pass
+        arrays = {'checked':np.array(self.checked)}
+        for name in self.names:
+            arrays['a:'+name] = self.arrays[name]
+            arrays['s:'+name] = np.array(self.sums[name])
+        for (lonvar,latvar),bindex in self.indexes.items():
+            for field,a in bindex.to_arrays().items():
+                arrays['i:%s:%s:%s' % (lonvar,latvar,field)] = a
+        with atomic.writer(self.fname,'wb') as f:
+            np.savez(f,**arrays)
+
+    def __getitem__(self,name):
+        return self.arrays[name]
+
+    def index(self,lonvar,latvar):
+        '''the BoxIndex of a lon/lat pair, built and stored on first use'''
+        if (lonvar,latvar) not in self.indexes:
+            self.indexes[(lonvar,latvar)] = BoxIndex(self[lonvar],self[latvar])
+            self.save()
+        return self.indexes[(lonvar,latvar)]
+
+    def where(self,lonvar,latvar,x0,x1,y0,y1,lon_offset=0.):
+        """Indices of the points of lonvar,latvar inside the bounds, as
+        np.where would give them.  lon_offset is added to the stored lon
+        (e.g. -360 for 0-360 grids).
+        """
+        return self.index(lonvar,latvar).where(self[lonvar],self[latvar],
+            x0-lon_offset,x1-lon_offset,y0,y1)
+
+def get(url,names,nc=None):
+    """The Grid of arrays names for url, loaded once per run."""
+    key = (url,tuple(names))
+    g = _grids.get(key)
+    if g is None:
+        g = _grids.setdefault(key,Grid(url,names,nc))
+    else:
+        g.nbytes = 0        # nothing read this time
+    return g
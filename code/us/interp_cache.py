@@ -0,0 +1,199 @@
+"""
+interp_cache: on-disk cache of the Delaunay interpolation weights used to
+put model surface currents onto the uniform lon/lat grid.
+
+scipy.interpolate.griddata(...,method='linear') builds a new Delaunay
+triangulation of the source points on every call, but the model grids
+and the target grid don't change from one cron run to the next.  Here we
+triangulate once, keep the three vertex indices and barycentric weights
+of every target point in a .npz file keyed by a hash of the source lon/lat
+and the target x/y, and reuse them for u, v and all later runs.
+
+The result is the same as griddata(...,method='linear',fill_value=0.0).
+
+For logically rectangular (ROMS) grids, method='bilinear' instead finds
+the grid cell holding each target point, through a k-d tree of the cell
+centres, and inverts the cell's bilinear map.  Weights of masked (land)
+corners are dropped and the rest renormalized.
+"""
+import os
+import glob
+import hashlib
+import numpy as np
+import scipy.spatial
+import atomic
+
+# where the weights live, and how much disk they may use before the
+# least recently used files are removed
+cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),'cache','interp')
+max_bytes = 500*1024*1024
+ncandidates = (4,16)    # cells tried per target point, in successive passes
+
+def grid_key(*arrays):
+    '''sha1 hex digest of the shapes and values of a set of coordinate arrays'''
+    h = hashlib.sha1()
+    for a in arrays:
+        a = np.ascontiguousarray(np.asarray(a,dtype=np.float64))
+        h.update(repr(a.shape).encode('ascii'))
+        h.update(a.tobytes())
+    return h.hexdigest()
+
+def delaunay_weights(lon,lat,xi,yi):
+    """Triangulate the source points and locate the target points.
+
+    Returns vtx (npts,3) vertex indices into the flattened source grid,
+    wts (npts,3) barycentric weights and outside (npts,) which is True
+    for target points outside the convex hull of the source points.
+    """
+    points = np.column_stack((np.ravel(lon),np.ravel(lat))).astype(np.float64)
+    xi = np.column_stack((np.ravel(xi),np.ravel(yi))).astype(np.float64)
+    tri = scipy.spatial.Delaunay(points)
+    simplex = tri.find_simplex(xi)
+    outside = (simplex<0)
+    vtx = tri.simplices[simplex].astype(np.int32)
+    trans = tri.transform[simplex]
+    bary = np.einsum('ijk,ik->ij',trans[:,:2,:],xi-trans[:,2,:])
+    wts = np.column_stack((bary,1.0-bary.sum(axis=1)))
+    vtx[outside] = 0
+    wts[outside] = 0.0
+    return vtx,wts,outside
+
+def inverse_bilinear(px,py,cx,cy,niter=8):
+    """Fractional position (s,t) of the points px,py within quadrilaterals
+    with corners cx,cy (each (4,n), in the order (j,i),(j,i+1),(j+1,i),
+    (j+1,i+1)), by Newton iteration on the bilinear map.  Also returns
+    the final misfit, relative to the cell size.
+    """
+    ax,bx,dx = cx[1]-cx[0],cx[2]-cx[0],cx[3]-cx[1]-cx[2]+cx[0]
+    ay,by,dy = cy[1]-cy[0],cy[2]-cy[0],cy[3]-cy[1]-cy[2]+cy[0]
+    s = np.empty(len(px))
+    s.fill(0.5)
+    t = s.copy()
+    with np.errstate(invalid='ignore',divide='ignore'):
+        for it in range(niter):
+            fx = cx[0]+ax*s+bx*t+dx*s*t-px
+            fy = cy[0]+ay*s+by*t+dy*s*t-py
+            j00,j01 = ax+dx*t,bx+dx*s
+            j10,j11 = ay+dy*t,by+dy*s
+            det = j00*j11-j01*j10
+            s = s-(j11*fx-j01*fy)/det
+            t = t-(j00*fy-j10*fx)/det
+        fx = cx[0]+ax*s+bx*t+dx*s*t-px
+        fy = cy[0]+ay*s+by*t+dy*s*t-py
+        size = np.hypot(ax,ay)+np.hypot(bx,by)
+        misfit = np.hypot(fx,fy)/size
+    return s,t,misfit
+
+def bilinear_weights(lon,lat,xi,yi,mask=None,tol=1e-6):
+    """Locate the target points in the cells of the 2D source grid lon,lat
+    and return (vtx,wts,outside) as for delaunay_weights, with the four
+    corners of each point's cell.  Corners where mask is 0 get no weight;
+    points with no wet corner have all-zero weights.
+    """
+    lon = np.asarray(lon,dtype=np.float64)
+    lat = np.asarray(lat,dtype=np.float64)
+    ny,nx = lon.shape
+    xi = np.ravel(xi).astype(np.float64)
+    yi = np.ravel(yi).astype(np.float64)
+    corners = [(slice(0,-1),slice(0,-1)),(slice(0,-1),slice(1,None)),
+               (slice(1,None),slice(0,-1)),(slice(1,None),slice(1,None))]
+    cx = np.array([lon[c].ravel() for c in corners])
+    cy = np.array([lat[c].ravel() for c in corners])
+    # cell centres, with lon scaled to make distances roughly isotropic
+    scale = np.cos(np.deg2rad(np.nanmean(lat)))
+    tree = scipy.spatial.cKDTree(np.column_stack((cx.mean(axis=0)*scale,cy.mean(axis=0))))
+    cell = np.zeros(len(xi),dtype=np.int64)
+    s = np.zeros(len(xi))
+    t = np.zeros(len(xi))
+    found = np.zeros(len(xi),dtype=bool)
+    inbox = (xi>=np.nanmin(lon))&(xi<=np.nanmax(lon))&(yi>=np.nanmin(lat))&(yi<=np.nanmax(lat))
+    for k in ncandidates:
+        todo = np.where(inbox&~found)[0]
+        if len(todo)==0:
+            break
+        k = min(k,cx.shape[1])
+        cand = tree.query(np.column_stack((xi[todo]*scale,yi[todo])),k=k)[1].reshape(len(todo),k)
+        for n in range(k):
+            left = ~found[todo]
+            pts = todo[left]
+            c = cand[left,n]
+            sc,tc,misfit = inverse_bilinear(xi[pts],yi[pts],cx[:,c],cy[:,c])
+            ok = ((misfit<tol)&(sc>=-tol)&(sc<=1+tol)&(tc>=-tol)&(tc<=1+tol))
+            pts = pts[ok]
+            cell[pts] = c[ok]
+            s[pts] = np.clip(sc[ok],0,1)
+            t[pts] = np.clip(tc[ok],0,1)
+            found[pts] = True
+    outside = ~found
+    j,i = np.divmod(cell,nx-1)
+    vtx = np.column_stack((j*nx+i,j*nx+i+1,(j+1)*nx+i,(j+1)*nx+i+1)).astype(np.int32)
+    wts = np.column_stack(((1-s)*(1-t),s*(1-t),(1-s)*t,s*t))
+    if mask is not None:
+        wts *= (np.ravel(mask)[vtx]>0)
+        total = wts.sum(axis=1)
+        wet = (total>0)
+        wts[wet] /= total[wet][:,np.newaxis]
+    vtx[outside] = 0
+    wts[outside] = 0.0
+    return vtx,wts,outside
+
+def evict(directory=None,budget=None,pattern='*.npz'):
+    '''remove least recently used cache files until they fit in budget bytes'''
+    directory = directory or cache_dir
+    budget = max_bytes if budget is None else budget
+    files = []
+    for f in glob.glob(os.path.join(directory,pattern)):
+        try:
+            st = os.stat(f)
+        except OSError:
+            continue
+        files.append((st.st_mtime,st.st_size,f))
+    files.sort()
+    total = sum([s for t,s,f in files])
+    for t,s,f in files:
+        if total <= budget:
+            break
+        try:
+            os.remove(f)
+        except OSError:
+            pass
+        total -= s
+
+def interp_weights(lon,lat,xi,yi,directory=None,budget=None,method='linear',mask=None):
+    """Return (vtx,wts,outside) for linear interpolation from the points
+    lon,lat to the points xi,yi, loading them from the cache if this pair
+    of grids has been seen before and computing and saving them if not.
+    Pass directory=False to skip the disk cache altogether.
+
+    method='bilinear' uses bilinear_weights on the 2D grid lon,lat, with
+    the optional land mask.
+    """
+    if method=='bilinear':
+        compute = lambda: bilinear_weights(lon,lat,xi,yi,mask)
+        arrays = (lon,lat,xi,yi) if mask is None else (lon,lat,xi,yi,mask)
+        key = 'bilinear-'+grid_key(*arrays)
+    else:
+        compute = lambda: delaunay_weights(lon,lat,xi,yi)
+        key = grid_key(lon,lat,xi,yi)
+    if directory is False:
+        return compute()
+    directory = directory or cache_dir
+    fname = os.path.join(directory,key+'.npz')
+    if os.path.exists(fname):
+        try:
+            w = np.load(fname)
+            vtx,wts,outside = w['vtx'],w['wts'],w['outside']
+            w.close()
+            os.utime(fname,None)    # mark as recently used
+            return vtx,wts,outside
+        except Exception:
+            pass                    # unreadable or half-written, rebuild it
+    vtx,wts,outside = compute()
+    try:
+        os.makedirs(directory)
+    except OSError:
+        pass                        # already there
+    with atomic.writer(fname,'wb') as f:
+        np.savez(f,vtx=vtx,wts=wts,outside=outside)
+    evict(directory,budget)
+    return vtx,wts,outside
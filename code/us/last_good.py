@@ -0,0 +1,65 @@
+"""
+last_good: the last field read successfully from each source, kept on
+disk so a source that is down or late can be filled in from it.
+
+build.py saves every source's regrid.Field here after a good read, and
+when a source misses the run's deadline (see fetch.py) merges the saved
+one instead, recording how old its data is in the output metadata.  Fields
+are kept per registry source (two sources may read the same url in
+different ways) and url.  Fields whose data is older than max_age
+seconds are not used.
+"""
+import os
+import time
+import datetime
+import hashlib
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+import atomic
+
+cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),'cache','fields')
+max_age = 3*24*3600.
+
+def field_file(source,url,directory=None):
+    key = hashlib.sha1(('%s|%s' % (source,url)).encode('utf-8')).hexdigest()
+    return os.path.join(directory or cache_dir,key+'.pkl')
+
+def save(source,url,field,directory=None):
+    directory = directory or cache_dir
+    try:
+        os.makedirs(directory)
+    except OSError:
+        pass
+    fname = field_file(source,url,directory)
+    with atomic.writer(fname,'wb') as f:
+        pickle.dump({'url':url,'saved':time.time(),'field':field},f,2)
+
+def age(field,saved):
+    """Seconds since the time of the field's data (Field.date), or since
+    it was saved if it has none."""
+    date = getattr(field,'date',None)
+    if date is None:
+        return time.time()-saved
+    return (datetime.datetime.utcnow()-date).total_seconds()
+
+def load(source,url,directory=None,max_age=None):
+    """The last good field of source (read from url) and the time it was
+    saved (seconds since 1970), or (None,None) if there is none younger
+    than max_age."""
+    max_age = max_age or globals()['max_age']
+    fname = field_file(source,url,directory)
+    if not os.path.exists(fname):
+        return None,None
+    try:
+        f = open(fname,'rb')
+        try:
+            saved = pickle.load(f)
+        finally:
+            f.close()
+    except Exception:
+        return None,None            # unreadable or from an older version
+    if saved.get('url')!=url or age(saved['field'],saved['saved'])>max_age:
+        return None,None
+    return saved['field'],saved['saved']
@@ -0,0 +1,135 @@
+"""
+loadtest: run the merge end to end against a slow or flaky local
+OPeNDAP server.
+
+The synthetic ROMS, FVCOM and HYCOM files of bench.py are served by
+dap_server with the given per-request latency, bandwidth cap and error
+rate, and build.py merges them onto the US grid exactly as it would the
+real sources.  The total wall time, each source's time and array bytes (from
+metrics.py) and the server's request, error and byte counts are printed
+and can be saved as JSON, so the effect of concurrency, caching,
+retries, deadlines and fallbacks can be checked offline.
+
+    python loadtest.py --latency 0.5 --bandwidth 1e6
+    python loadtest.py --error-rate 0.05 --warm     # caches from the last run
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import bench
+import dap_server
+import registry
+import build
+import metrics
+import reader
+import fetch
+
+workdir = os.path.join(bench.workdir,'loadtest')
+port = 8711         # fixed, so the urls (and cache keys) are the same from run to run
+
+def test_sources(server):
+    '''registry entries for the served fixtures'''
+    return {
+        'roms': dict(url=server.url('roms'),grid='roms',priority=10,hours_ave=24,time_sub=1),
+        'fvcom': dict(url=server.url('fvcom'),grid='ugrid',priority=20,lonvar='lonc',latvar='latc',
+                      isurf_layer=0,time_sub=3),
+        'hycom': dict(url=server.url('hycom'),grid='structured',priority=90,uvar='water_u',
+                      vvar='water_v',isurf_layer=0,lon360=True),
+    }
+
+def run(size=1,warm=False,fetch_workers=None,read_workers=None,retries=None,retry_wait=None,
+    fetch_retries=None,fetch_retry_wait=None,deadline=None,**server_opts):
+    """Serve the fixtures of the given size with server_opts (latency,
+    jitter, bandwidth, error_rate), build the US domain from them (within
+    deadline seconds) and return a summary of the run.  retries and
+    retry_wait are those of a chunk read (reader.py), fetch_retries and
+    fetch_retry_wait those of a whole source (fetch.py).
+    """
+    bench.make_fixtures(size)
+    if not warm:
+        shutil.rmtree(os.path.join(bench.workdir,'cache'),ignore_errors=True)
+    bench.use_caches()
+    if read_workers:
+        reader.max_workers = read_workers
+    if retries is not None:
+        reader.retries = retries
+    if retry_wait is not None:
+        reader.retry_wait = retry_wait
+    if fetch_retries is not None:
+        fetch.retries = fetch_retries
+    if fetch_retry_wait is not None:
+        fetch.retry_wait = fetch_retry_wait
+    server_opts.setdefault('port',port)
+    server = dap_server.serve(dict([(kind,bench.fixture(kind,size)) for kind in bench.makers]),
+                              **server_opts)
+    saved = registry.sources,registry.domains
+    registry.sources = test_sources(server)
+    dom = dict(registry.domains['us'],sources=sorted(registry.sources))
+    registry.domains = {'loadtest':dom}
+    error = None
+    t0 = time.time()
+    try:
+        build.build(['loadtest'],outdir=workdir,max_workers=fetch_workers,report=None,deadline=deadline,
+                    force=True)
+    except Exception:
+        error = '%s: %s' % (sys.exc_info()[0].__name__,sys.exc_info()[1])
+    seconds = time.time()-t0
+    server.shutdown()
+    server.server_close()
+    registry.sources,registry.domains = saved
+    report = metrics.report()
+    meta = json.load(open(os.path.join(workdir,'ocean-data.json'))) if error is None else {}
+    names = dict([(src['url'],name) for name,src in test_sources(server).items()])
+    per_source = {}
+    for source,src in report['sources'].items():
+        per_source[names.get(source,source)] = {'seconds':src['seconds'],'bytes':src['bytes']}
+    return {'seconds':seconds,'error':error,'server':server.stats,'sources':per_source,
+            'stale':meta.get('stale',{}),'missing':meta.get('missing',{}),
+            'options':dict(server_opts,size=size,warm=warm,fetch_workers=fetch_workers,
+                           read_workers=read_workers,deadline=deadline)}
+
+def show(summary):
+    print('wall time %.2f s%s' % (summary['seconds'],
+          '  FAILED (%s)' % summary['error'] if summary['error'] else ''))
+    for name,src in sorted(summary['sources'].items()):
+        print('  %-10s %8.2f s in stages %10d array bytes' % (name,src['seconds'],src['bytes']))
+    for name,src in sorted(summary['stale'].items()):
+        print('  %-10s stale, %.2f hours old (%s)' % (name,src['age_hours'],src['reason']))
+    for name,src in sorted(summary['missing'].items()):
+        print('  %-10s missing (%s)' % (name,src['reason']))
+    s = summary['server']
+    print('server: %d requests, %d injected errors, %d bytes' % (s['requests'],s['errors'],s['bytes']))
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='merge synthetic sources served by a slow local OPeNDAP server')
+    parser.add_argument('--size',type=int,default=1,help='fixture size factor (see bench.py)')
+    parser.add_argument('--latency',type=float,default=0.,help='seconds added to every request')
+    parser.add_argument('--jitter',type=float,default=0.,help='up to this many more seconds')
+    parser.add_argument('--bandwidth',type=float,default=None,help='bytes per second per request')
+    parser.add_argument('--error-rate',type=float,default=0.,help='fraction of requests that fail')
+    parser.add_argument('--port',type=int,default=port)
+    parser.add_argument('--warm',action='store_true',help='keep the caches of the last run')
+    parser.add_argument('--fetch-workers',type=int,default=None,help='sources read at once')
+    parser.add_argument('--read-workers',type=int,default=None,help='chunks read at once per variable')
+    parser.add_argument('--retries',type=int,default=None,help='extra attempts at a failed chunk read')
+    parser.add_argument('--retry-wait',type=float,default=None,help='seconds before a chunk is read again')
+    parser.add_argument('--fetch-retries',type=int,default=None,help='extra attempts at a failed source')
+    parser.add_argument('--fetch-retry-wait',type=float,default=None,
+                        help='seconds before a source is read again')
+    parser.add_argument('--deadline',type=float,default=None,help='seconds to read the sources in')
+    parser.add_argument('--out',help='write the summary to this JSON file')
+    args = parser.parse_args()
+    summary = run(size=args.size,warm=args.warm,fetch_workers=args.fetch_workers,
+                  read_workers=args.read_workers,retries=args.retries,retry_wait=args.retry_wait,
+                  fetch_retries=args.fetch_retries,fetch_retry_wait=args.fetch_retry_wait,
+                  deadline=args.deadline,
+                  latency=args.latency,jitter=args.jitter,bandwidth=args.bandwidth,
+                  error_rate=args.error_rate,port=args.port)
+    show(summary)
+    if args.out:
+        f = open(args.out,'w')
+        json.dump(summary,f,indent=1)
+        f.close()
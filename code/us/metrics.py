@@ -0,0 +1,147 @@
+"""
+metrics: per-source, per-stage timing and byte counts of a merge run.
+
+Each stage of reading and merging a source (open dataset, time index,
+grid read, data read, cache read, averaging, destagger, regridding) and
+of building a domain (merge, write) is recorded under its source url (or
+domain name) with its wall time, its bytes, the array shapes involved
+and the peak RSS of the process when it finished.  Stages that run many
+times (data reads of each chunk, say) are added up.
+
+The bytes of a read are those of the arrays it gave, in memory (decoded
+values, not what went over the wire, which netCDF4 doesn't report); the
+bytes of a write are the size of the files written.
+
+    with metrics.timer(url,'open dataset'):
+        nc = netCDF4.Dataset(url)
+    metrics.record(url,'data read',seconds,nbytes=data.nbytes,shape=data.shape)
+
+At the end of a run write_json writes the run report and write_prometheus
+the same numbers as Prometheus text metrics (e.g. for node_exporter's
+textfile collector).
+
+Sources are read in child processes (see fetch.py), which send their
+stages back to be merged in here; peak RSS is that of the process a
+stage ran in, as seen when one of the source's stages ended.
+"""
+import sys
+import json
+import time
+import threading
+import resource
+import atomic
+
+max_shapes = 4      # distinct shapes kept per stage
+
+_lock = threading.Lock()
+_sources = {}
+_started = time.time()
+
+def peak_rss():
+    '''peak resident memory of the process, in bytes'''
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform=='darwin' else rss*1024
+
+def reset():
+    global _started
+    with _lock:
+        _sources.clear()
+        _started = time.time()
+
+def record(source,stage,seconds=0.,nbytes=0,shape=None):
+    '''add one run of stage for source'''
+    rss = peak_rss()
+    with _lock:
+        src = _sources.setdefault(source,{'stages':{},'peak_rss':0})
+        st = src['stages'].setdefault(stage,{'seconds':0.,'bytes':0,'calls':0,'shapes':[]})
+        st['seconds'] += seconds
+        st['bytes'] += int(nbytes)
+        st['calls'] += 1
+        if shape is not None:
+            shape = list(shape)
+            if shape not in st['shapes'] and len(st['shapes'])<max_shapes:
+                st['shapes'].append(shape)
+        src['peak_rss'] = max(src['peak_rss'],rss)
+
+def snapshot():
+    '''the stages recorded so far, e.g. to send back from a child process'''
+    with _lock:
+        return json.loads(json.dumps(_sources))
+
+def merge(sources):
+    '''add the stages of a snapshot (from another process) to this one's'''
+    with _lock:
+        for source,new in sources.items():
+            src = _sources.setdefault(source,{'stages':{},'peak_rss':0})
+            for stage,nst in new['stages'].items():
+                st = src['stages'].setdefault(stage,{'seconds':0.,'bytes':0,'calls':0,'shapes':[]})
+                for key in ('seconds','bytes','calls'):
+                    st[key] += nst[key]
+                for shape in nst['shapes']:
+                    if shape not in st['shapes'] and len(st['shapes'])<max_shapes:
+                        st['shapes'].append(shape)
+            src['peak_rss'] = max(src['peak_rss'],new['peak_rss'])
+
+class timer(object):
+    """Context manager recording the time of a stage.  nbytes and shape
+    can be set on it inside the block."""
+    def __init__(self,source,stage,nbytes=0,shape=None):
+        self.source = source
+        self.stage = stage
+        self.nbytes = nbytes
+        self.shape = shape
+
+    def __enter__(self):
+        self.t0 = time.time()
+        return self
+
+    def __exit__(self,*exc):
+        record(self.source,self.stage,time.time()-self.t0,self.nbytes,self.shape)
+        return False
+
+def report():
+    '''the run report, as a dict'''
+    sources = snapshot()
+    total = {}
+    for src in sources.values():
+        src['seconds'] = sum([st['seconds'] for st in src['stages'].values()])
+        src['bytes'] = sum([st['bytes'] for st in src['stages'].values()])
+        for name,st in src['stages'].items():
+            total[name] = total.get(name,0.)+st['seconds']
+    return {'started':time.strftime('%Y-%m-%dT%H:%M:%SZ',time.gmtime(_started)),
+            'seconds':time.time()-_started,
+            'peak_rss':peak_rss(),
+            'stage_seconds':total,
+            'sources':sources}
+
+def write_json(fname):
+    atomic.write_text(fname,json.dumps(report(),indent=1,sort_keys=True))
+
+def label(s):
+    return str(s).replace('\\','\\\\').replace('"','\\"')
+
+def prometheus(prefix='ocean_merge'):
+    '''the report as Prometheus text exposition format'''
+    r = report()
+    lines = []
+    def metric(name,kind,doc,samples):
+        lines.append('# HELP %s_%s %s' % (prefix,name,doc))
+        lines.append('# TYPE %s_%s %s' % (prefix,name,kind))
+        for labels,value in samples:
+            lines.append('%s_%s%s %s' % (prefix,name,labels,repr(float(value))))
+    metric('run_seconds','gauge','wall time of the run',[('',r['seconds'])])
+    metric('peak_rss_bytes','gauge','peak resident memory of the run',[('',r['peak_rss'])])
+    for name,kind,key,doc in (('stage_seconds','gauge','seconds','time spent in a stage'),
+                              ('stage_bytes','gauge','bytes','in-memory bytes of the arrays a stage read, or bytes of the files it wrote'),
+                              ('stage_calls','gauge','calls','times a stage ran')):
+        samples = []
+        for source,src in sorted(r['sources'].items()):
+            for stage,st in sorted(src['stages'].items()):
+                samples.append(('{source="%s",stage="%s"}' % (label(source),label(stage)),st[key]))
+        metric(name,kind,doc,samples)
+    metric('source_peak_rss_bytes','gauge','peak resident memory when a source stage ended',
+           [('{source="%s"}' % label(source),src['peak_rss']) for source,src in sorted(r['sources'].items())])
+    return '\n'.join(lines)+'\n'
+
+def write_prometheus(fname,prefix='ocean_merge'):
+    atomic.write_text(fname,prometheus(prefix))
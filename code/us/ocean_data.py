@@ -0,0 +1,162 @@
+"""
+ocean_data: writers for the merged surface current field.
+
+write_js writes the ocean-data.js text file read by the streakmap page.
+write_bin writes the same field as a compact little-endian binary file
+(scaled int16 or float16 u,v pairs, in the same order as the js "field"
+array) plus a small JSON header, for clients on slow links.
+
+write_frames writes a forecast animation the same way, each frame after
+the first as its quantized difference from the one before, one byte per
+value with the rare larger ones escaped to two, and zlib compressed.
+
+All take ui,vi already transposed and flattened to the javascript
+convention, as in the merge scripts (write_frames a stack of them).
+
+Files are written under a temporary name and renamed into place (see
+atomic.py), so a web server never serves a partly written one.
+"""
+import json
+import zlib
+import numpy as np
+import atomic
+
+def write_js(fname,ui,vi,x0,y0,x1,y1,gridWidth,gridHeight,timestamp):
+    '''write the field as the "var windData = {...}" javascript file'''
+    nvals=len(ui)
+    with atomic.writer(fname,'w') as f:
+        f.write('var windData = {\n')
+        f.write('timestamp: "%s",\n' % timestamp )
+        f.write('x0: %12.6f,\n' % x0)
+        f.write('y0: %12.6f,\n' % y0)
+        f.write('x1: %12.6f,\n' % x1)
+        f.write('y1: %12.6f,\n' % y1)
+        f.write('gridWidth: %6.1f,\n' % gridWidth)
+        f.write('gridHeight: %6.1f,\n' % gridHeight)
+        f.write('field: [\n')
+        Lines = ['%4.3f,%4.3f,\n' % (ui[i],vi[i]) for i in range(nvals-1)]
+        f.writelines(Lines)
+        f.write('%4.3f,%4.3f\n' % (ui[-1],vi[-1]))
+        f.write(']\n}\n')
+
+def write_bin(fname,ui,vi,x0,y0,x1,y1,gridWidth,gridHeight,timestamp,
+    dtype='int16',scale=0.001,header=None,extra=None):
+    """Write the field as interleaved u,v pairs to the binary file fname
+    and its description to the JSON file header (default: fname with the
+    extension replaced by .json).  header=False writes the data only.
+    extra holds more entries for the header (e.g. stale sources).
+
+    dtype='int16' stores round(u/scale) (scale=0.001 keeps the mm/s
+    resolution of ocean-data.js); dtype='float16' stores u directly and
+    records scale=1.  Values are decoded as u = stored*scale.
+    """
+    if header is None:
+        header=fname.rsplit('.',1)[0]+'.json'
+    uv=np.empty((len(ui),2),dtype=np.float64)
+    uv[:,0]=ui
+    uv[:,1]=vi
+    uv[np.isnan(uv)]=0.0
+    if dtype=='int16':
+        info=np.iinfo(np.int16)
+        data=np.clip(np.round(uv/scale),info.min,info.max).astype('<i2')
+    elif dtype=='float16':
+        scale=1.0
+        data=uv.astype('<f2')
+    else:
+        raise ValueError('dtype must be int16 or float16, not %s' % dtype)
+    with atomic.writer(fname,'wb') as f:
+        f.write(data.tobytes())
+    meta={'timestamp':timestamp,
+          'x0':float(x0),'y0':float(y0),'x1':float(x1),'y1':float(y1),
+          'gridWidth':int(gridWidth),'gridHeight':int(gridHeight),
+          'dtype':dtype,'byteorder':'little','scale':scale,
+          'layout':'uv-interleaved'}
+    meta.update(extra or {})
+    if header is not False:
+        atomic.write_text(header,json.dumps(meta,sort_keys=True))
+    return meta
+
+def write_frames(fname,ui,vi,x0,y0,x1,y1,gridWidth,gridHeight,timestamp,times,
+    scale=0.001,header=None,extra=None,level=6):
+    """Write the frames ui,vi (frame x point stacks, the points in the
+    order of write_bin) at times to the binary file fname and its
+    description to the JSON file header (default: fname with the
+    extension replaced by .json).
+
+    Every frame is quantized to round(u/scale), as in write_bin.  The first
+    is stored as int16 u,v pairs, and each later one as its difference
+    from the frame before, one int8 per value; a value of -128 is an
+    escape, and the actual difference is the next entry of an int16 list
+    that follows the int8 values.  Differences are taken from the decoded
+    frame before, so rounding errors don't add up.  Each frame is then
+    zlib compressed (at level) on its own.  Frame t decodes as
+    u = scale*(q0+d1+...+dt); the header gives the byte offset, length
+    and escape count of each frame, and extra more entries for it.
+    """
+    if header is None:
+        header=fname.rsplit('.',1)[0]+'.json'
+    info=np.iinfo(np.int16)
+    nt=len(times)
+    npts=np.shape(ui)[-1]
+    uv=np.empty((nt,npts,2),dtype=np.float64)
+    uv[...,0]=ui
+    uv[...,1]=vi
+    uv[np.isnan(uv)]=0.0
+    q=np.clip(np.round(uv/scale),info.min,info.max).astype(np.int32)
+    frames=[]
+    offset=0
+    with atomic.writer(fname,'wb') as f:
+        prev=None
+        for t in range(nt):
+            if prev is None:
+                raw=q[t].astype('<i2').tobytes()
+                prev=q[t].copy()
+                nesc=0
+            else:
+                d=np.clip(q[t]-prev,info.min,info.max)
+                esc=(d<-127)|(d>127)
+                small=np.where(esc,-128,d).astype('<i1')
+                raw=small.tobytes()+d[esc].astype('<i2').tobytes()
+                prev+=d
+                nesc=int(esc.sum())
+            data=zlib.compress(raw,level)
+            f.write(data)
+            frames.append({'time':times[t].strftime('%Y-%m-%dT%H:%M:%SZ'),'offset':offset,
+                           'bytes':len(data),'dtype':'int16' if t==0 else 'int8',
+                           'escapes':nesc,'delta':t>0})
+            offset+=len(data)
+    meta={'timestamp':timestamp,
+          'x0':float(x0),'y0':float(y0),'x1':float(x1),'y1':float(y1),
+          'gridWidth':int(gridWidth),'gridHeight':int(gridHeight),
+          'byteorder':'little','scale':scale,'layout':'uv-interleaved',
+          'encoding':'delta-escape-zlib','frames':frames}
+    meta.update(extra or {})
+    if header is not False:
+        atomic.write_text(header,json.dumps(meta,sort_keys=True))
+    return meta
+
+def read_frames(fname,header=None):
+    """The description of the frames written by write_frames to fname
+    and their u,v (frame x point stacks), decoded as a client would."""
+    if header is None:
+        header=fname.rsplit('.',1)[0]+'.json'
+    f=open(header)
+    meta=json.load(f)
+    f.close()
+    f=open(fname,'rb')
+    body=f.read()
+    f.close()
+    n=2*meta['gridWidth']*meta['gridHeight']
+    q=None
+    out=[]
+    for fr in meta['frames']:
+        raw=zlib.decompress(body[fr['offset']:fr['offset']+fr['bytes']])
+        if q is None:
+            q=np.frombuffer(raw,dtype='<i2',count=n).astype(np.int32)
+        else:
+            d=np.frombuffer(raw,dtype='<i1',count=n).astype(np.int32)
+            d[d==-128]=np.frombuffer(raw,dtype='<i2',count=fr['escapes'],offset=n)
+            q=q+d
+        out.append(q*meta['scale'])
+    uv=np.array(out).reshape(len(out),-1,2)
+    return meta,uv[...,0],uv[...,1]
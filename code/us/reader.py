@@ -0,0 +1,328 @@
+"""
+reader: time averages of model fields read in chunks, in parallel.
+
+Reading nc.variables[uvar][istart:istop:time_sub,isurf_layer,bj,bi] in one
+request is a single huge OPeNDAP transfer that a busy server may time out
+on.  time_mean splits the time window into chunks of chunk_size steps
+(and optionally blocks of row_block rows), fetches them with max_workers
+worker processes (the netCDF library is not thread safe), each with its
+own connection to the dataset, retries a failed chunk on its own, and
+adds each chunk into the running sum as it arrives.
+
+Given the time values of the window, slabs are read through slab_cache,
+so steps already fetched by an earlier run come from local disk.
+
+Only the float64 sum and valid-count arrays and a bounded number of
+chunks are held in memory at once, however long the window.  The chunk
+size and row blocks are reduced as needed to keep that under max_bytes.
+
+The result is the same masked mean as np.mean(...,axis=0).
+
+time_steps reads the same way but keeps every step (the frames of a
+forecast animation) instead of adding them up.
+"""
+import time
+import hashlib
+import threading
+import numpy as np
+import netCDF4
+import slab_cache
+import grid_store
+import metrics
+import fetch
+
+chunk_size = 6      # time steps per request
+max_workers = 4     # concurrent requests per variable
+row_block = None    # rows per request (None: all rows in one request)
+retries = 3         # extra attempts for a failed chunk
+retry_wait = 5.     # seconds before the first retry, doubled each time
+max_bytes = 256*1024*1024   # memory ceiling for the sums and chunks in flight
+
+_datasets = {}      # url -> netCDF4.Dataset, in the worker processes
+
+def runs(tidx,positions,step,size):
+    '''split sorted positions into runs, at most size long, whose time
+    indices tidx[p] are step apart'''
+    out = []
+    for p in positions:
+        if out and tidx[p]-tidx[out[-1][-1]]==step and len(out[-1])<size:
+            out[-1].append(p)
+        else:
+            out.append([p])
+    return out
+
+def row_blocks(rows,size):
+    '''split an array of row indices into blocks of at most size rows'''
+    if not size:
+        return [slice(0,len(rows))]
+    return [slice(k,min(k+size,len(rows))) for k in range(0,len(rows),size)]
+
+def chunking(nrows,nvals,itemsize,chunk_size,row_block,max_workers,max_bytes):
+    """Chunk size and row block that keep a time_sum within max_bytes.
+
+    nvals is the number of values in one row of one time step.  The sum
+    and count take 16 bytes a value; each chunk in flight (one per worker
+    plus the one being added up) takes itemsize+1 bytes a value (data and
+    mask), and adding one up about 24 more.
+    """
+    fixed = 16*nrows*nvals
+    avail = max_bytes-fixed
+    if avail<=0:
+        print('warning: the sums alone need %.1f MB' % (fixed/2.**20))
+        avail = 0
+    per = nvals*((itemsize+1)*(max_workers+1)+24)     # one time step of one row
+    rb = row_block or nrows
+    cs = max(1,min(chunk_size,avail//max(rb*per,1)))
+    if cs*rb*per > avail:
+        rb = max(1,min(rb,avail//per))
+    if rb>=nrows:
+        rb = None
+    return cs,rb
+
+def index_ranges(idx,max_ranges=8,max_gap=0):
+    """Cover the sorted indices idx with at most max_ranges contiguous
+    slices, merging ranges across the smallest gaps first (gaps of up to
+    max_gap are always merged).  Returns the slices and the positions of
+    idx in the concatenation of the slices.
+    """
+    idx = np.unique(np.asarray(idx,dtype=np.int64))
+    if len(idx)==0:
+        return [],np.zeros(0,dtype=np.int64)
+    gaps = np.diff(idx)-1
+    # split where the gap is larger than max_gap, keeping the largest gaps
+    split = np.where(gaps>max_gap)[0]
+    if len(split)>max_ranges-1:
+        split = np.sort(split[np.argsort(gaps[split],kind='mergesort')[::-1][:max_ranges-1]])
+    starts = np.concatenate(([idx[0]],idx[split+1]))
+    stops = np.concatenate((idx[split]+1,[idx[-1]+1]))
+    ranges = [slice(int(a),int(b)) for a,b in zip(starts,stops)]
+    # position of each index in the concatenated ranges
+    offset = np.concatenate(([0],np.cumsum(stops-starts)[:-1]))
+    which = np.searchsorted(starts,idx,side='right')-1
+    keep = offset[which]+(idx-starts[which])
+    return ranges,keep
+
+def masked_mean(total,count):
+    '''mean from a sum and valid-count, masked where nothing was valid'''
+    with np.errstate(invalid='ignore',divide='ignore'):
+        mean = total/count
+    return np.ma.masked_array(mean,mask=(count==0))
+
+def time_mean(url,vname,istart,istop,time_sub,isurf_layer,index,**kwargs):
+    """Return the masked time mean of
+    vname[istart:istop:time_sub,isurf_layer,*index] from the dataset at url.
+
+    index holds the indices of the remaining dimensions, e.g. (bj,bi) for a
+    structured grid or (slice(None),) for an unstructured one.  Other
+    keyword arguments are passed to time_sum.
+    """
+    tidx = list(range(istart,istop,time_sub))
+    return masked_mean(*time_sum(url,vname,tidx,time_sub,isurf_layer,index,**kwargs))
+
+def time_sum(url,vname,tidx,time_sub,isurf_layer,index,checksums=None,**kwargs):
+    """Return the float64 sum and the count of valid values over the time
+    steps tidx (ascending indices, read in runs spaced time_sub apart) of
+    vname[t,isurf_layer,*index].  If checksums (a list) is given, the
+    checksum of the values of each step is added to it, in tidx order.
+    Other keyword arguments are those of read_slabs.
+    """
+    acc = {}
+    blocks = {}
+    def add(rows,r,run,data):
+        t0 = time.time()
+        data = np.ma.masked_invalid(data)   # NaN (e.g. from the cache) is missing
+        if not acc:
+            shape = (len(rows),)+data.shape[2:]
+            acc['sum'] = np.zeros(shape,dtype=np.float64)
+            acc['count'] = np.zeros(shape,dtype=np.int64)
+        acc['sum'][r] += np.ma.filled(data,0.0).sum(axis=0)
+        acc['count'][r] += (~np.ma.getmaskarray(data)).sum(axis=0)
+        if checksums is not None:
+            for n,k in enumerate(run):
+                blocks.setdefault(k,{})[r.start] = grid_store.checksum(data[n])
+        metrics.record(url,'averaging',time.time()-t0)
+    read_slabs(url,vname,tidx,time_sub,isurf_layer,index,add,**kwargs)
+    if checksums is not None:
+        for k in range(len(tidx)):
+            checksums.append(hashlib.sha1(''.join([blocks[k][b] for b in sorted(blocks[k])])
+                                          .encode('utf-8')).hexdigest())
+    return acc['sum'],acc['count']
+
+def time_steps(url,vname,tidx,isurf_layer,index,**kwargs):
+    """Return vname[t,isurf_layer,*index] for each of the time steps tidx
+    (e.g. the frames of an animation) as one masked float32 array.  A
+    negative index gives a fully masked step; repeated indices are read
+    once.  Keyword arguments are those of read_slabs, with times and
+    revisions, if given, those of the steps tidx.
+    """
+    tidx = np.asarray(tidx,dtype=np.int64)
+    steps = np.unique(tidx[tidx>=0])
+    if not len(steps):
+        raise ValueError('no time steps to read from %s in %s' % (vname,url))
+    for name in ('times','revisions'):
+        if kwargs.get(name) is not None:
+            values = list(kwargs[name])
+            kwargs[name] = [values[np.where(tidx==t)[0][0]] for t in steps]
+    step = int(np.diff(steps).min()) if len(steps)>1 else 1
+    out = {}
+    def add(rows,r,run,data):
+        data = np.ma.masked_invalid(data)
+        if not out:
+            out['data'] = np.empty((len(steps),len(rows))+data.shape[2:],dtype=np.float32)
+            out['data'][:] = np.nan
+        out['data'][run,r] = np.ma.filled(data.astype(np.float32),np.nan)
+    read_slabs(url,vname,steps,step,isurf_layer,index,add,**kwargs)
+    data = out['data'][np.searchsorted(steps,np.maximum(tidx,steps[0]))]
+    data[tidx<0] = np.nan
+    return np.ma.masked_invalid(data)
+
+def read_chunk(var,vname,index,retries,reopen=None):
+    """var()[index], tried retries more times if it fails, calling reopen
+    (if given) before each retry.  Returns the data and the seconds taken.
+    """
+    wait = retry_wait
+    for attempt in range(retries+1):
+        try:
+            t0 = time.time()
+            data = var()[index]
+            return data,time.time()-t0
+        except Exception:
+            if attempt==retries:
+                raise
+            print('retrying %s %s' % (vname,index[0]))
+            if reopen is not None:
+                reopen()
+            time.sleep(wait)
+            wait *= 2
+
+def worker_read(task):
+    """read_chunk in a worker process, with one connection per dataset
+    per process, saving the slabs read under keys (if given)."""
+    piece,url,vname,index,retries,keys = task
+    def var():
+        if url not in _datasets:
+            _datasets[url] = netCDF4.Dataset(url)
+        return _datasets[url].variables[vname]
+    def reopen():
+        _datasets.pop(url,None)
+    data,seconds = read_chunk(var,vname,index,retries,reopen)
+    for n,key in enumerate(keys or []):
+        slab_cache.save(key,data[n])
+    return piece,data,seconds
+
+def read_slabs(url,vname,tidx,time_sub,isurf_layer,index,add,nc=None,
+    chunk_size=None,max_workers=None,row_block=None,retries=None,
+    times=None,revisions=None,cache=True,max_bytes=None):
+    """Read vname[t,isurf_layer,*index] for the time steps tidx (ascending
+    indices, read in runs spaced time_sub apart) in chunks, and hand each
+    chunk to add(rows,r,run,data) as it arrives: data holds the time steps
+    tidx[run] of the rows rows[r] (rows being the row indices of index).
+
+    nc, if given, is used for the variable metadata and for the reads when
+    they are done sequentially.  If times, the time coordinate values of
+    the steps tidx, is given (and cache is true) slabs are read through
+    slab_cache, so only time steps not seen by an earlier run are fetched;
+    revisions, if given, is the slab_cache revision of each of them (see
+    time_axis.revisions).  chunk_size and row_block are reduced if needed to stay within
+    max_bytes (see chunking).
+    """
+    chunk_size = chunk_size or globals()['chunk_size']
+    max_workers = max_workers or globals()['max_workers']
+    row_block = row_block if row_block is not None else globals()['row_block']
+    retries = retries if retries is not None else globals()['retries']
+    max_bytes = max_bytes or globals()['max_bytes']
+    if nc is None:
+        nc = netCDF4.Dataset(url)
+    var = nc.variables[vname]
+
+    # rows as an explicit index array so they can be split into blocks
+    rows = np.arange(var.shape[2])[index[0]]
+    rest = tuple(index[1:])
+    tidx = list(tidx)
+    if not tidx:
+        raise ValueError('no time steps to read from %s in %s' % (vname,url))
+    nvals = int(np.prod([np.arange(n)[i].size for n,i in zip(var.shape[3:],rest)]))
+    chunk_size,row_block = chunking(len(rows),nvals,var.dtype.itemsize,chunk_size,
+                                    row_block,max_workers,max_bytes)
+    blocks = row_blocks(rows,row_block)
+    use_cache = cache and times is not None
+
+    def key(k,r):
+        rev = revisions[k] if revisions is not None else None
+        return slab_cache.slab_key(url,vname,times[k],isurf_layer,(rows[r],)+rest,rev)
+
+    # hand on the time steps already in the cache as they are loaded, and
+    # make runs of the rest to fetch
+    ncached = 0
+    pieces = []
+    for r in blocks:
+        missing = []
+        for k in range(len(tidx)):
+            t0 = time.time()
+            data = slab_cache.load(key(k,r)) if use_cache else None
+            if data is not None:
+                metrics.record(url,'cache read',time.time()-t0,nbytes=data.nbytes,shape=data.shape)
+            if data is None:
+                missing.append(k)
+            else:
+                add(rows,r,[k],data[np.newaxis])
+                ncached += 1
+        pieces += [(run,r) for run in runs(tidx,missing,time_sub,chunk_size)]
+    if ncached:
+        print('%s: %d of %d slabs from cache' % (vname,ncached,len(tidx)*len(blocks)))
+
+    def task(piece):
+        run,r = piece
+        t = slice(tidx[run[0]],tidx[run[-1]]+1,time_sub)
+        keys = [key(k,r) for k in run] if use_cache else None
+        return (piece,url,vname,(t,isurf_layer,rows[r])+rest,retries,keys)
+
+    def read(piece):
+        # in this process, through nc
+        index,keys = task(piece)[3:6:2]
+        data,seconds = read_chunk(lambda: var,vname,index,retries)
+        for n,k in enumerate(keys or []):
+            slab_cache.save(k,data[n])
+        return piece,data,seconds
+
+    # at most one chunk per worker is read ahead of the one being added up
+    inflight = threading.BoundedSemaphore(max_workers)
+    stop = []
+    def feed():
+        for piece in pieces:
+            inflight.acquire()
+            if stop:
+                return
+            yield task(piece)
+
+    if max_workers==1 or len(pieces)<=1:
+        results = (read(piece) for piece in pieces)
+        pool = None
+    else:
+        pool = fetch.context.Pool(min(max_workers,len(pieces)))
+        results = pool.imap_unordered(worker_read,feed())
+    done = False
+    try:
+        for (run,r),data,seconds in results:
+            metrics.record(url,'data read',seconds,nbytes=data.nbytes,shape=data.shape)
+            add(rows,r,run,data)
+            del data
+            if pool is not None:
+                inflight.release()
+        done = True
+    finally:
+        if pool is not None:
+            # let feed() finish if a read failed
+            stop.append(True)
+            for n in range(max_workers):
+                try:
+                    inflight.release()
+                except ValueError:
+                    break
+            if done:
+                pool.close()
+            else:
+                pool.terminate()
+            pool.join()
+    if use_cache and pieces:
+        slab_cache.evict()
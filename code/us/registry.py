@@ -0,0 +1,68 @@
+"""
+registry: the model sources and map domains built by build.py.
+
+Each source says where its data is and how to read it:
+
+    url        OPeNDAP url
+    grid       'roms' (read with surf_vel_roms), 'ugrid' (unstructured,
+               e.g. FVCOM) or 'structured' (1D or 2D lon/lat)
+    priority   sources with a lower number fill a domain first; later
+               ones only fill what is still empty.  Sources of the same
+               priority fill in the order the domain lists them.
+    timeout    (optional) seconds per attempt at reading it, instead of
+               fetch.timeout
+
+Any other keys (uvar, vvar, lonvar, latvar, tvar, isurf_layer, lon360,
+lonlat_sub, time_sub, hours_ave, inclusive, ...) are passed to surf_vel or
+surf_vel_roms as they are.
+
+A source read differently for some domain is a separate entry (e.g.
+hycom_west, with the lon360 and bounds the west coast script used).
+
+Each domain is a uniform lon/lat grid given by its bounds x0,y0,x1,y1
+and either the spacing dx,dy or the number of points width,height, and
+the sources merged onto it.  tiles=True also writes a tile pyramid.
+The output is stamped with the time of the run, or with timestamp='data'
+the middle of the averaging window of its first source (in EST, as the
+coawst and necofs scripts did), formatted with date_format (default
+build.date_format).
+"""
+
+glcfs = 'http://michigan.glin.net:8080/thredds/dodsC/glos/glcfs/%s/ncas_his3d'
+lakes = ['superior','michigan','huron','erie','ontario']
+
+sources = {
+    'espresso': dict(url='http://tds.marine.rutgers.edu:8080/thredds/dodsC/roms/espresso/2009_da/his',
+        grid='roms',priority=10,hours_ave=24,time_sub=1),
+    'ccroms': dict(url='http://thredds.axiomalaska.com/thredds/dodsC/CA_FCST.nc',
+        grid='structured',priority=10,lonvar='lon',latvar='lat',isurf_layer=0,time_sub=3,inclusive=True),
+    'coawst': dict(url='http://geoport.whoi.edu/thredds/dodsC/coawst_2_2/fmrc/coawst_2_2_best.ncd',
+        grid='roms',priority=10,hours_ave=24,tvar='time1',lonlat_sub=1,time_sub=3),
+    'amseas': dict(url='http://ecowatch.ncddc.noaa.gov/thredds/dodsC/ncom_amseas_agg/AmSeas_Apr_05_2013_to_Current_best.ncd',
+        grid='structured',priority=20,uvar='water_u',vvar='water_v',isurf_layer=0,lon360=True,lonlat_sub=2),
+    'ncom_us_east': dict(url='http://ecowatch.ncddc.noaa.gov/thredds/dodsC/ncom_us_east_agg/US_East_Apr_05_2013_to_Current_best.ncd',
+        grid='structured',priority=30,uvar='water_u',vvar='water_v',isurf_layer=0,lon360=True,lonlat_sub=2),
+    'necofs': dict(url='http://www.smast.umassd.edu:8080/thredds/dodsC/FVCOM/NECOFS/Forecasts/NECOFS_GOM3_FORECAST.nc',
+        grid='ugrid',priority=40,lonvar='lonc',latvar='latc',isurf_layer=0,time_sub=3),
+    'hycom': dict(url='http://ecowatch.ncddc.noaa.gov/thredds/dodsC/hycom/hycom_reg7_agg/HYCOM_Region_7_Aggregation_best.ncd',
+        grid='structured',priority=90,uvar='water_u',vvar='water_v',isurf_layer=0,lon360=True,lonlat_sub=1),
+}
+sources['hycom_west'] = dict(sources['hycom'],lon360=False,inclusive=True)
+for nam in lakes:
+    sources['glcfs_'+nam] = dict(url=glcfs % nam,grid='structured',priority=50,
+        uvar='u',vvar='v',isurf_layer=0,inclusive=True)
+
+domains = {
+    'us': dict(x0=-130.103438,y0=20.191999,x1=-60.885558,y1=52.807669,width=501,height=237,
+        sources=['espresso','amseas','ncom_us_east','necofs']+
+            ['glcfs_'+nam for nam in ['michigan','huron','erie','ontario','superior']]+['hycom'],
+        tiles=True),
+    'west_coast': dict(x0=-140.0,y0=25.0,x1=-115.0,y1=52.0,dx=0.07,dy=0.07,
+        sources=['ccroms','hycom_west']),
+    'great_lakes': dict(x0=-92.0,y0=40.0,x1=-76.0,y1=49.0,dx=0.05,dy=0.05,
+        sources=['glcfs_'+nam for nam in lakes],date_format='%I:00 %p on %B %d, %Y'),
+    'necofs': dict(x0=-75.9,y0=35.1,x1=-56.6,y1=46.0,dx=0.05,dy=0.05,
+        sources=['necofs'],timestamp='data',date_format='%I:00 %p on %B %d, %Y'),
+    'coawst': dict(x0=-100.0,y0=15.0,x1=-55.0,y1=48.0,dx=0.1,dy=0.1,
+        sources=['coawst'],timestamp='data',date_format='%I:00 %p on %B %d, %Y'),
+}
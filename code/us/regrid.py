@@ -0,0 +1,264 @@
+"""
+regrid: reusable linear regridding from a model grid to the uniform
+lon/lat grid of a merge script.
+
+A Regridder is built once from the source lon/lat and the target x,y
+linspaces and holds the interpolation as a sparse (target x source)
+matrix, so any stack of fields on the source grid -- u and v, every hour
+of a forecast -- is regridded with a single sparse matrix multiply:
+
+    r = regrid.Regridder(lon2d,lat2d,x,y)
+    ui,vi = r([u1,v1])
+    uit = r(u[istart:istop,isurf_layer,bj,bi])    # (time,ny,nx)
+
+RectilinearRegridder does the same for sources with 1D lon/lat, using
+bilinear weights computed directly from the coordinates, and
+CurvilinearRegridder for logically rectangular 2D (ROMS) grids, using
+bilinear weights within each grid cell that leave out land points.
+
+merge puts several sources together in priority order.  Each source, a
+Field, is regridded onto the target points inside its coverage, so a
+small source (a Great Lake, say) costs work in proportion to its own
+area rather than the whole target grid, and since those points don't
+change from run to run its interpolation weights come from interp_cache.
+Given a land mask of the target grid, merge stops once every ocean point
+is filled.  The fields can also be stacks of frames at the same times
+(for an animation of the forecast), which are regridded with one set of
+weights per source.
+"""
+import time
+import numpy as np
+import scipy.sparse
+import interp_cache
+import metrics
+
+def as_float(values):
+    '''float64 array of values (or of a list of arrays), masked values as NaN'''
+    if isinstance(values,(list,tuple)):
+        return np.array([as_float(v) for v in values])
+    return np.ma.filled(np.ma.asarray(values,dtype=np.float64),np.nan)
+
+def target_points(x,y,points=False):
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if x.ndim==1 and y.ndim==1 and not points:
+        return np.meshgrid(x,y)
+    return x,y
+
+class Regridder(object):
+    """Linear interpolation from scattered or curvilinear source points
+    lon,lat to a target grid.  x,y are the 1D linspaces of a uniform grid
+    or 2D arrays of target points; with points=True they are taken as
+    flat lists of target points instead.  Target points outside the
+    source grid get fill_value.
+
+    Masked or NaN source values make the target points that depend on
+    them NaN, as with griddata.  With min_weight set, they are left out
+    instead and the remaining weights renormalized, as long as they add
+    up to at least min_weight.
+    """
+    def __init__(self,lon,lat,x,y,points=False,fill_value=0.0,cache_dir=None,min_weight=None):
+        xx,yy = target_points(x,y,points)
+        self.shape = np.shape(xx)
+        self.fill_value = fill_value
+        self.min_weight = min_weight
+        self.matrix,self.outside = self.build(lon,lat,xx,yy,cache_dir)
+
+    def build(self,lon,lat,xx,yy,cache_dir=None):
+        '''sparse (target x source) weight matrix and the outside points'''
+        self.src_shape = np.shape(lon)
+        vtx,wts,outside = interp_cache.interp_weights(lon,lat,xx,yy,directory=cache_dir)
+        nsrc = int(np.prod(self.src_shape))
+        inside = np.where(~outside)[0]
+        rows = np.repeat(inside,3)
+        matrix = scipy.sparse.csr_matrix(
+            (wts[inside].ravel(),(rows,vtx[inside].ravel())),
+            shape=(len(outside),nsrc))
+        return matrix,outside
+
+    def __call__(self,values):
+        """Regrid values whose trailing dimensions are the source grid
+        shape (or the flattened source points).  Leading dimensions
+        (time, component, ...) are kept: an (nt,)+src_shape input gives an
+        (nt,)+target_shape output.
+        """
+        values = as_float(values)
+        nsrc = self.matrix.shape[1]
+        nd = len(self.src_shape)
+        if values.shape[values.ndim-nd:]==tuple(self.src_shape):
+            lead = values.shape[:values.ndim-nd]
+        elif values.shape[-1:]==(nsrc,):
+            lead = values.shape[:-1]
+        else:
+            raise ValueError('values of shape %s do not match source grid %s'
+                % (values.shape,self.src_shape))
+        vals = values.reshape(-1,nsrc)
+        if self.min_weight is None:
+            out = np.asarray(self.matrix.dot(vals.T)).T
+        else:
+            valid = ~np.isnan(vals)
+            num = np.asarray(self.matrix.dot(np.where(valid,vals,0.0).T)).T
+            den = np.asarray(self.matrix.dot(valid.T.astype(np.float64))).T
+            with np.errstate(invalid='ignore',divide='ignore'):
+                out = np.where(den>=self.min_weight,num/den,np.nan)
+        out[:,self.outside] = self.fill_value
+        return out.reshape(lead+tuple(self.shape))
+
+def axis_weights(c,t):
+    """Lower neighbour index, fractional distance to the upper neighbour
+    and outside flag of each target coordinate t on the increasing 1D
+    coordinate c.
+    """
+    i = np.clip(np.searchsorted(c,t,side='right')-1,0,len(c)-2)
+    f = (t-c[i])/(c[i+1]-c[i])
+    outside = (t<c[0])|(t>c[-1])
+    return i,f,outside
+
+class RectilinearRegridder(Regridder):
+    """Bilinear interpolation from a rectilinear source grid with 1D lon
+    (columns) and lat (rows), such as HYCOM and NCOM, to a target grid.
+    The weights come straight from the 1D coordinates, so there is no
+    triangulation at all.  Arguments are the same as for Regridder;
+    source values have shape (len(lat),len(lon)).
+    """
+    def build(self,lon,lat,xx,yy,cache_dir=None):
+        lon = np.asarray(lon,dtype=np.float64)
+        lat = np.asarray(lat,dtype=np.float64)
+        ny,nx = len(lat),len(lon)
+        self.src_shape = (ny,nx)
+        # decreasing coordinates are handled by flipping the index
+        col = np.arange(nx)
+        row = np.arange(ny)
+        if nx>1 and lon[-1]<lon[0]:
+            lon,col = lon[::-1],col[::-1]
+        if ny>1 and lat[-1]<lat[0]:
+            lat,row = lat[::-1],row[::-1]
+        if np.any(np.diff(lon)<=0) or np.any(np.diff(lat)<=0):
+            raise ValueError('lon and lat must be monotonic')
+        tx = np.ravel(xx).astype(np.float64)
+        ty = np.ravel(yy).astype(np.float64)
+        i,fx,outx = axis_weights(lon,tx)
+        j,fy,outy = axis_weights(lat,ty)
+        outside = outx|outy
+        inside = np.where(~outside)[0]
+        i,fx,j,fy = i[inside],fx[inside],j[inside],fy[inside]
+        rows = np.concatenate([inside]*4)
+        cols = np.concatenate((row[j]*nx+col[i],row[j]*nx+col[i+1],
+                               row[j+1]*nx+col[i],row[j+1]*nx+col[i+1]))
+        wts = np.concatenate(((1-fx)*(1-fy),fx*(1-fy),(1-fx)*fy,fx*fy))
+        matrix = scipy.sparse.csr_matrix((wts,(rows,cols)),shape=(len(tx),ny*nx))
+        matrix.eliminate_zeros()    # so a NaN neighbour with zero weight doesn't matter
+        return matrix,outside
+
+class CurvilinearRegridder(Regridder):
+    """Bilinear interpolation from a logically rectangular 2D source grid
+    lon,lat (e.g. ROMS lon_rho,lat_rho) to a target grid.  Each target
+    point is located in its grid cell and interpolated from the cell's
+    four corners; with a mask (e.g. mask_rho), land corners are left out
+    and the ocean ones renormalized, and points with only land corners
+    are NaN.  The weights are cached on disk like Regridder's.
+    """
+    def __init__(self,lon,lat,x,y,mask=None,**kwargs):
+        self.mask = mask
+        Regridder.__init__(self,lon,lat,x,y,**kwargs)
+
+    def build(self,lon,lat,xx,yy,cache_dir=None):
+        self.src_shape = np.shape(lon)
+        vtx,wts,outside = interp_cache.interp_weights(lon,lat,xx,yy,directory=cache_dir,
+            method='bilinear',mask=self.mask)
+        nsrc = int(np.prod(self.src_shape))
+        inside = np.where(~outside)[0]
+        self.dry = np.where(~outside&(wts.sum(axis=1)==0))[0]
+        matrix = scipy.sparse.csr_matrix(
+            (wts[inside].ravel(),(np.repeat(inside,4),vtx[inside].ravel())),
+            shape=(len(outside),nsrc))
+        matrix.eliminate_zeros()    # land corners
+        return matrix,outside
+
+    def __call__(self,values):
+        out = Regridder.__call__(self,values)
+        flat = out.reshape(out.shape[:out.ndim-len(self.shape)]+(-1,))
+        flat[...,self.dry] = np.nan
+        return out
+
+class Field(object):
+    """u,v of one source on its own grid lon,lat, to be regridded later
+    with regridder (a Regridder class) and its extra keyword arguments
+    (e.g. the land mask).  name (the source url) labels its metrics.
+    With times, a list of frame times, u and v are (frame,)+grid stacks.
+    date (a naive UTC datetime) is the time of the data: the middle of
+    the averaging window, or the first frame.
+    """
+    def __init__(self,lon,lat,u,v,regridder=Regridder,name=None,times=None,date=None,**kwargs):
+        self.lon = lon
+        self.lat = lat
+        self.u = u
+        self.v = v
+        self.regridder = regridder
+        self.name = name
+        self.times = times
+        self.date = date
+        self.kwargs = kwargs
+        self.bounds = (np.nanmin(lon),np.nanmax(lon),np.nanmin(lat),np.nanmax(lat))
+
+    def covers(self,xx,yy):
+        '''True for the points xx,yy inside the bounding box of the source grid'''
+        x0,x1,y0,y1 = self.bounds
+        return (xx>=x0)&(xx<=x1)&(yy>=y0)&(yy<=y1)
+
+    def lead(self):
+        '''shape of the frame dimension: (nframes,), or () for one field'''
+        return () if self.times is None else (len(self.times),)
+
+    def regrid(self,x,y,points=False):
+        """u,v on the target grid (or points) x,y, as for Regridder, with
+        missing values as 0.  All the frames share one Regridder."""
+        ui,vi = self.regridder(self.lon,self.lat,x,y,points=points,**self.kwargs)([self.u,self.v])
+        ui[np.isnan(ui)] = 0.0
+        vi[np.isnan(vi)] = 0.0
+        return ui,vi
+
+def merge(fields,x,y,land=None):
+    """Merge the Fields fields (None for a source with nothing to give),
+    in priority order, onto the uniform grid x,y: each one fills the
+    points that are still 0 after the ones before it.  Each field is
+    regridded onto the points inside its coverage (the same ones every
+    run, so the weights are cached).  land, a boolean (ny,nx) mask, marks
+    points that no source is expected to fill; the merge stops once all
+    the others are filled.  The result is the same as regridding every
+    field onto the whole grid and filling ui==0 points in turn.
+
+    Fields of frames (all at the same times) give (frame,ny,nx) results,
+    each frame merged on its own.
+    """
+    xx,yy = np.meshgrid(x,y)
+    lead = ()
+    for field in fields:
+        if field is not None:
+            lead = field.lead()
+            break
+    ui = np.zeros(lead+xx.shape)
+    vi = np.zeros(lead+xx.shape)
+    empty = np.ones(lead+xx.shape,dtype=bool)
+    ocean = np.ones(xx.shape,dtype=bool) if land is None else ~np.asarray(land,dtype=bool)
+    for n,field in enumerate(fields):
+        if field is None:
+            continue
+        if field.lead()!=lead:
+            raise ValueError('%s has frames %s, not %s' % (field.name,field.lead(),lead))
+        if not (empty&ocean).any():
+            print('grid filled, skipping the last %d sources' % (len(fields)-n))
+            break
+        flat = empty.reshape(lead+(-1,))
+        idx = np.where(field.covers(xx,yy).ravel())[0]
+        if len(idx)==0:
+            continue
+        t0 = time.time()
+        u,v = field.regrid(xx.ravel()[idx],yy.ravel()[idx],points=True)
+        metrics.record(field.name or 'source %d' % n,'regridding',time.time()-t0,shape=lead+(len(idx),))
+        fill = flat[...,idx]
+        ui.reshape(lead+(-1,))[...,idx] = np.where(fill,u,ui.reshape(lead+(-1,))[...,idx])
+        vi.reshape(lead+(-1,))[...,idx] = np.where(fill,v,vi.reshape(lead+(-1,))[...,idx])
+        flat[...,idx] = fill&(u==0)
+        print('source %d filled %d of %d points' % (n,(fill&(u!=0)).sum(),fill.sum()))
+    return ui,vi
@@ -0,0 +1,117 @@
+"""
+regrid_pool: regrid the sources of a domain in a pool of processes.
+
+regrid.merge regrids the sources one after another on one core.  Here
+each source is regridded in its own worker process (u, v and any frames
+together, since they share one set of weights), onto the same target
+points inside its coverage, and the priority merge is done afterwards
+from the results.  All the sources are regridded, even those a land
+mask would let regrid.merge skip, so it only pays off when there are
+spare cores: it is off by default (workers=1, or build.py without
+--regrid-workers), and never uses more processes than there are cores or
+sources.
+
+The source arrays and the per-source output grids live in shared memory
+(multiprocessing.RawArray) that the workers get when the pool starts, so
+no multi-megabyte arrays are pickled to or from the workers.
+
+The result is the same as regrid.merge.
+"""
+import time
+import multiprocessing
+import numpy as np
+import regrid
+import metrics
+
+workers = 1         # worker processes per domain (1: just regrid.merge)
+
+_shared = {}        # key -> (RawArray,shape), in the workers
+
+def share(a):
+    '''float64 copy of a in shared memory, as (RawArray,shape)'''
+    a = regrid.as_float(a)
+    raw = multiprocessing.RawArray('d',max(a.size,1))
+    np.frombuffer(raw,dtype=np.float64)[:a.size] = a.ravel()
+    return raw,a.shape
+
+def view(shared):
+    raw,shape = shared
+    n = int(np.prod(shape))
+    return np.frombuffer(raw,dtype=np.float64)[:n].reshape(shape)
+
+def init(shared):
+    _shared.update(shared)
+
+def regrid_source(task):
+    """Regrid source k into its shared output grids, onto the target
+    points inside its coverage.
+    """
+    t0 = time.time()
+    k,regridder,times,opts,array_opts = task
+    kw = dict(opts)
+    for name in array_opts:
+        kw[name] = view(_shared[(k,name)])
+    field = regrid.Field(*[view(_shared[(k,name)]) for name in ('lon','lat','u','v')],
+                         regridder=regridder,times=times,**kw)
+    xx = view(_shared['xx'])
+    yy = view(_shared['yy'])
+    idx = np.where(field.covers(xx,yy).ravel())[0]
+    if len(idx):
+        u,v = field.regrid(xx.ravel()[idx],yy.ravel()[idx],points=True)
+        lead = field.lead()
+        view(_shared[(k,'ui')]).reshape(lead+(-1,))[...,idx] = u
+        view(_shared[(k,'vi')]).reshape(lead+(-1,))[...,idx] = v
+    return k,len(idx),time.time()-t0
+
+def merge(fields,x,y,workers=None,land=None):
+    """Same as regrid.merge(fields,x,y,land), with the sources regridded in
+    workers processes (by default the module's workers), but no more than
+    the number of cores.
+    """
+    workers = min(workers or globals()['workers'],multiprocessing.cpu_count())
+    live = [k for k in range(len(fields)) if fields[k] is not None]
+    if workers<=1 or len(live)<=1:
+        return regrid.merge(fields,x,y,land)
+    xx,yy = np.meshgrid(x,y)
+    lead = fields[live[0]].lead()
+    for k in live:
+        if fields[k].lead()!=lead:
+            raise ValueError('%s has frames %s, not %s' % (fields[k].name,fields[k].lead(),lead))
+    shared = {'xx':share(xx),'yy':share(yy)}
+    tasks = []
+    for k in live:
+        f = fields[k]
+        for name in ('lon','lat','u','v'):
+            shared[(k,name)] = share(getattr(f,name))
+        opts = {}
+        array_opts = []
+        for name,val in f.kwargs.items():
+            if isinstance(val,np.ndarray):
+                shared[(k,name)] = share(val)
+                array_opts.append(name)
+            else:
+                opts[name] = val
+        shared[(k,'ui')] = share(np.zeros(lead+xx.shape))
+        shared[(k,'vi')] = share(np.zeros(lead+xx.shape))
+        tasks.append((k,f.regridder,f.times,opts,array_opts))
+
+    pool = multiprocessing.Pool(min(workers,len(tasks)),initializer=init,initargs=(shared,))
+    try:
+        for k,npts,seconds in pool.imap_unordered(regrid_source,tasks):
+            print('source %d regridded onto %d points' % (k,npts))
+            metrics.record(fields[k].name or 'source %d' % k,'regridding',seconds,shape=lead+(npts,))
+    finally:
+        pool.close()
+        pool.join()
+
+    # priority merge: each source fills the points still 0 (in each frame)
+    ui = np.zeros(lead+xx.shape)
+    vi = np.zeros(lead+xx.shape)
+    ocean = True if land is None else ~np.asarray(land,dtype=bool)
+    for k in live:
+        ind = (ui==0)
+        if not (ind&ocean).any():
+            break
+        ui[ind] = view(shared[(k,'ui')])[ind]
+        vi[ind] = view(shared[(k,'vi')])[ind]
+    return ui,vi
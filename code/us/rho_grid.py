@@ -0,0 +1,101 @@
+"""
+rho_grid: destaggering and rotation of ROMS velocities onto rho points.
+
+Shared by the US merge (surf_vel_roms), the west coast readers (through
+roms_utils) and coawst.  get keeps the RhoGrid of each grid window for
+reuse, at most max_grids of them (least recently used dropped first).
+
+    rg = rho_grid.get((url,j0,j1,i0,i1),anglev[inner])
+    u, v = rg(u, v)
+"""
+import threading
+import numpy as np
+
+max_grids = 8
+
+_grids = []         # [(key,RhoGrid)], most recently used last
+_lock = threading.Lock()
+
+class RhoGrid(object):
+    """Destaggering and rotation of ROMS velocities for a (window of a)
+    grid with rotation angle at the interior rho points.
+
+    u (..., ny+2, nx+1) and v (..., ny+1, nx+2) are averaged onto the
+    (ny, nx) interior rho points and rotated to east/north in one pass.
+    cos/sin of the angle and the intermediate arrays are kept between
+    calls, so only the two outputs are allocated.
+    """
+    def __init__(self,angle):
+        angle = np.asarray(angle,dtype=np.float64)
+        self.shape = angle.shape
+        self.cos = np.cos(angle)
+        self.sin = np.sin(angle)
+        self.work = {}
+        self.lock = threading.Lock()
+
+    def workspace(self,shape):
+        # only for the last shape used, so they don't pile up
+        if shape not in self.work:
+            self.work = {shape:[np.empty(shape) for k in range(3)]}
+        return self.work[shape]
+
+    def __call__(self,u,v,out=None):
+        """Return u,v (east,north) at the interior rho points, masked
+        where any of the u/v points they come from is masked.
+        """
+        ny,nx = self.shape
+        if u.shape[-2:]!=(ny+2,nx+1) or v.shape[-2:]!=(ny+1,nx+2):
+            raise ValueError('u %s and v %s do not match rho points %s'
+                % (u.shape,v.shape,self.shape))
+        mask = None
+        if np.ma.isMaskedArray(u) or np.ma.isMaskedArray(v):
+            mu = np.ma.getmaskarray(u)
+            mv = np.ma.getmaskarray(v)
+            mask = mu[...,1:-1,:-1]|mu[...,1:-1,1:]|mv[...,:-1,1:-1]|mv[...,1:,1:-1]
+            u = np.ma.filled(u,0.0)
+            v = np.ma.filled(v,0.0)
+        shape = u.shape[:-2]+self.shape
+        if out is None:
+            out = (np.empty(shape),np.empty(shape))
+        ue,vn = out
+        with self.lock:
+            ur,vr,tmp = self.workspace(shape)
+            np.add(u[...,1:-1,:-1],u[...,1:-1,1:],out=ur)
+            ur *= 0.5
+            np.add(v[...,:-1,1:-1],v[...,1:,1:-1],out=vr)
+            vr *= 0.5
+            np.multiply(ur,self.cos,out=ue)
+            np.multiply(vr,self.sin,out=tmp)
+            ue -= tmp
+            np.multiply(ur,self.sin,out=vn)
+            np.multiply(vr,self.cos,out=tmp)
+            vn += tmp
+        if mask is not None:
+            return np.ma.masked_array(ue,mask),np.ma.masked_array(vn,mask)
+        return ue,vn
+
+def get(key,angle):
+    """The RhoGrid for key (e.g. url and rho window), made from angle
+    the first time it is asked for."""
+    with _lock:
+        for k,(old,rg) in enumerate(_grids):
+            if old==key:
+                del _grids[k]
+                break
+        else:
+            rg = None
+        if rg is None or rg.shape!=np.shape(angle):
+            rg = RhoGrid(angle)
+        _grids.append((key,rg))
+        del _grids[:-max_grids]
+    return rg
+
+def window(igood,shape,halo=1):
+    '''rho-point slices (j0:j1, i0:i1) around the points igood, with halo
+    extra cells for interpolation plus one more for destaggering'''
+    pad = halo+1
+    j0 = max(igood[0].min()-pad,0)
+    j1 = min(igood[0].max()+pad+1,shape[0])
+    i0 = max(igood[1].min()-pad,0)
+    i1 = min(igood[1].max()+pad+1,shape[1])
+    return int(j0),int(j1),int(i0),int(i1)
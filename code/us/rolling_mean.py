@@ -0,0 +1,135 @@
+"""
+rolling_mean: incremental rolling time mean of a source field.
+
+Each cron run averages a window that has mostly been averaged before.
+time_mean keeps the float64 sum and valid-count of the last window it
+computed for a (url, variable, layer, subset) in cache/rolling, together
+with the time values and indices that went into it.  The next run only
+reads the steps that entered the window (or were revised by a newer
+forecast run, see time_axis.revisions) and subtracts the ones that left
+it (usually from slab_cache, so without network access), instead of
+re-reading all of them.
+
+Subtracting a step only takes out what went in if it reads back the same
+values, so the checksum of each step's values is kept with the state and
+the steps read back for removal are checked against it.  The state is
+rebuilt from scratch if they differ (the data was revised after it was
+added), if the grid subset changes, if the old time indices no longer
+hold the same time values (the aggregation was reorganised), if most of
+the window changed anyway, and after max_updates incremental updates to
+stop rounding errors from accumulating.
+"""
+import os
+import hashlib
+import numpy as np
+import netCDF4
+import reader
+import slab_cache
+import time_axis
+import atomic
+
+state_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),'cache','rolling')
+max_updates = 48
+
+def state_file(url,vname,isurf_layer,index,time_sub):
+    desc = '|'.join([url,vname,repr(isurf_layer),repr(time_sub)]+
+                    [slab_cache.index_repr(i) for i in index])
+    return os.path.join(state_dir,hashlib.sha1(desc.encode('utf-8')).hexdigest()+'.npz')
+
+def load_state(fname):
+    if not os.path.exists(fname):
+        return None
+    try:
+        z = np.load(fname)
+        st = dict([(k,z[k]) for k in z.files])
+        z.close()
+        return st
+    except Exception:
+        return None
+
+def save_state(fname,**arrays):
+    try:
+        os.makedirs(os.path.dirname(fname))
+    except OSError:
+        pass
+    with atomic.writer(fname,'wb') as f:
+        np.savez(f,**arrays)
+
+def update(st,url,vname,tidx,times,revisions,time_sub,isurf_layer,index,tvar,nc,**kwargs):
+    """Bring the saved state st up to the window tidx/times and return
+    (sum,count,checksums), or None if it has to be rebuilt from scratch.
+    A step whose revision changed (a newer forecast run) is replaced.
+    """
+    if st is None or st['updates'] >= max_updates or 'checksums' not in st:
+        return None
+    old_times = list(st['times'])
+    old_revs = [r or None for r in st['revisions']]
+    old_keys = list(zip(old_times,old_revs))
+    old_set = set(old_keys)
+    new_set = set(zip(times,revisions))
+    add = [k for k in range(len(tidx)) if (times[k],revisions[k]) not in old_set]
+    drop = [k for k in range(len(old_times)) if (old_times[k],old_revs[k]) not in new_set]
+    if len(add)+len(drop) >= len(tidx):
+        return None
+    drop_idx = [int(st['tidx'][k]) for k in drop]
+    drop_times = [old_times[k] for k in drop]
+    taxis = time_axis.get(url,tvar,nc)
+    if drop and (max(drop_idx)>=len(taxis) or
+                 not np.array_equal(taxis.values[drop_idx],np.asarray(drop_times))):
+        print('%s: time axis has changed, rebuilding mean' % vname)
+        return None
+    total = st['sum'].copy()
+    count = st['count'].copy()
+    old_sums = list(st['checksums'])
+    if drop:
+        sums = []
+        s,n = reader.time_sum(url,vname,drop_idx,time_sub,isurf_layer,index,checksums=sums,
+                              nc=nc,times=drop_times,revisions=[old_revs[k] for k in drop],**kwargs)
+        if sums!=[old_sums[k] for k in drop]:
+            print('%s: removed time steps have changed, rebuilding mean' % vname)
+            return None
+        total -= s
+        count -= n
+    checksums = dict([(old_keys[k],old_sums[k]) for k in range(len(old_times))])
+    if add:
+        sums = []
+        s,n = reader.time_sum(url,vname,[tidx[k] for k in add],time_sub,isurf_layer,index,checksums=sums,
+                              nc=nc,times=[times[k] for k in add],
+                              revisions=[revisions[k] for k in add],**kwargs)
+        if s.shape != total.shape:
+            return None
+        total += s
+        count += n
+        checksums.update(zip([(times[k],revisions[k]) for k in add],sums))
+    print('%s: added %d and removed %d time steps' % (vname,len(add),len(drop)))
+    return total,count,[checksums[k] for k in zip(times,revisions)]
+
+def time_mean(url,vname,istart,istop,time_sub,isurf_layer,index,tvar='time',nc=None,
+    times=None,revisions=None,**kwargs):
+    """Same as reader.time_mean, but updated incrementally from the state
+    saved by the previous call for the same source, variable and subset.
+    revisions are the slab cache revisions of the steps (see
+    time_axis.revisions).
+    """
+    if nc is None:
+        nc = netCDF4.Dataset(url)
+    tidx = list(range(istart,istop,time_sub))
+    if times is None:
+        times = time_axis.get(url,tvar,nc).values[istart:istop:time_sub]
+    times = [float(t) for t in np.asarray(times,dtype=np.float64)]
+    revisions = list(revisions) if revisions is not None else [None]*len(times)
+    fname = state_file(url,vname,isurf_layer,index,time_sub)
+    st = load_state(fname)
+    acc = update(st,url,vname,tidx,times,revisions,time_sub,isurf_layer,index,tvar,nc,**kwargs)
+    if acc is None:
+        checksums = []
+        total,count = reader.time_sum(url,vname,tidx,time_sub,isurf_layer,index,checksums=checksums,
+                                      nc=nc,times=times,revisions=revisions,**kwargs)
+        updates = 0
+    else:
+        total,count,checksums = acc
+        updates = st['updates']+1
+    save_state(fname,sum=total,count=count,times=np.array(times),tidx=np.array(tidx),
+               revisions=np.array([r or '' for r in revisions]),checksums=np.array(checksums),
+               updates=np.array(updates))
+    return reader.masked_mean(total,count)
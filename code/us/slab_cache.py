@@ -0,0 +1,71 @@
+"""
+slab_cache: read-through local cache of the surface slabs read by reader.
+
+Each hourly run reads a 24 hour window that the previous run already read
+23/24 of.  Every (url, variable, time, layer, j-range, i-range) slab that
+reader.time_mean fetches is saved here as a .npy file keyed by the time
+*value* (not index, which shifts as the aggregation grows), so later runs
+only fetch the time steps they haven't seen.  Steps that a newer forecast
+run may still replace also carry a revision (see time_axis.revisions) in
+their key, so a new run's values are fetched rather than the cached ones
+of the run before.  Masked points are stored as
+NaN.  Least recently used slabs are removed when the cache grows past
+max_bytes.
+"""
+import os
+import hashlib
+import numpy as np
+import interp_cache
+import atomic
+
+cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),'cache','slabs')
+max_bytes = 2*1024*1024*1024
+
+def index_repr(ind):
+    '''compact, stable description of one dimension's index'''
+    if isinstance(ind,slice):
+        return 's%s:%s:%s' % (ind.start,ind.stop,ind.step)
+    ind = np.atleast_1d(np.asarray(ind))
+    if ind.size>1 and np.all(np.diff(ind)==ind[1]-ind[0]):
+        return 'r%d:%d:%d' % (ind[0],ind[-1]+1,ind[1]-ind[0])
+    return 'a'+hashlib.sha1(np.ascontiguousarray(ind,dtype=np.int64).tobytes()).hexdigest()
+
+def slab_key(url,vname,tval,layer,index,revision=None):
+    desc = '|'.join([url,vname,repr(float(tval)),repr(layer)]+[index_repr(i) for i in index])
+    if revision is not None:
+        desc += '|'+str(revision)
+    return hashlib.sha1(desc.encode('utf-8')).hexdigest()
+
+def slab_file(key,directory=None):
+    return os.path.join(directory or cache_dir,key+'.npy')
+
+def load(key,directory=None):
+    '''cached slab as a masked array, or None'''
+    fname = slab_file(key,directory)
+    if not os.path.exists(fname):
+        return None
+    try:
+        data = np.load(fname)
+    except Exception:
+        return None                 # unreadable or half-written
+    try:
+        os.utime(fname,None)        # mark as recently used
+    except OSError:
+        pass
+    return np.ma.masked_invalid(data)
+
+def save(key,data,directory=None):
+    directory = directory or cache_dir
+    try:
+        os.makedirs(directory)
+    except OSError:
+        pass
+    data = np.ma.asarray(data)
+    if data.dtype.kind!='f':
+        data = data.astype(np.float64)
+    fname = slab_file(key,directory)
+    with atomic.writer(fname,'wb') as f:
+        np.save(f,np.ma.filled(data,np.nan))
+
+def evict(directory=None,budget=None):
+    interp_cache.evict(directory or cache_dir,max_bytes if budget is None else budget,'*.npy')
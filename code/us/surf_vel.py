@@ -0,0 +1,114 @@
+"""
+surf_vel: time-mean surface currents of a structured (1D or 2D lon/lat)
+or unstructured (ugrid, e.g. FVCOM) model source.
+
+surf_vel reads the part of the source that overlaps the x,y domain and
+returns a regrid.Field, the time mean u,v on the source points over the
+hours_ave hours around date_mid (by default now), which regrid.merge
+regrids onto the target grid.  ROMS sources go through
+surf_vel_roms instead.
+
+The read stops one short of the last row and column inside the domain,
+as the US script always did; inclusive=True reads them too, as the
+great_lakes and west coast scripts did.
+
+Given frames, a list of times, it returns the u,v of the nearest time
+step to each of them instead, for an animation of the forecast (steps
+more than frame_tol hours away are missing).
+"""
+import netCDF4
+import numpy as np
+import datetime
+import regrid
+import rolling_mean
+import time_axis
+import grid_store
+import reader
+import metrics
+
+def surf_vel(x,y,url,uvar='u',vvar='v',isurf_layer=0,lonvar='lon',latvar='lat',
+    tvar='time',date_mid=None,hours_ave=24,lon360=False,ugrid=False,lonlat_sub=1,time_sub=1,
+    time_chunk=None,read_workers=None,row_block=None,ugrid_margin=0.2,ugrid_ranges=8,
+    frames=None,frame_tol=3.,inclusive=False):
+            
+    with metrics.timer(url,'open dataset'):
+        nc=netCDF4.Dataset(url)
+    # static grid arrays come from the local store (see grid_store.py)
+    with metrics.timer(url,'grid read') as m:
+        g=grid_store.get(url,[lonvar,latvar],nc)
+        m.nbytes=g.nbytes
+    lon = g[lonvar]-360.*lon360
+    lat = g[latvar]
+    
+    if ugrid:
+        # elements inside the domain (plus a margin), read as a few
+        # contiguous index ranges
+        m=ugrid_margin
+        igood=g.where(lonvar,latvar,x.min()-m,x.max()+m,y.min()-m,y.max()+m,lon_offset=-360.*lon360)[0]
+        if len(igood)==0:
+            print('no overlap with the x,y domain')
+            return None
+        ranges,keep=reader.index_ranges(igood,max_ranges=ugrid_ranges)
+        kind,slon,slat=regrid.Regridder,lon[igood],lat[igood]
+    elif lon.ndim==1:
+        # ai and aj are logical arrays, True in subset region
+        igood = np.where((lon>=x.min()) & (lon<=x.max()))
+        jgood = np.where((lat>=y.min()) & (lat<=y.max()))
+        bi=np.arange(igood[0].min(),igood[0].max()+inclusive,lonlat_sub)
+        bj=np.arange(jgood[0].min(),jgood[0].max()+inclusive,lonlat_sub)
+        # rectilinear grid: bilinear weights straight from the 1D coordinates
+        kind,slon,slat=regrid.RectilinearRegridder,lon[bi],lat[bj]
+    elif lon.ndim==2:
+        igood=g.where(lonvar,latvar,x.min(),x.max(),y.min(),y.max(),lon_offset=-360.*lon360)
+        bj=np.arange(igood[0].min(),igood[0].max()+inclusive,lonlat_sub)
+        bi=np.arange(igood[1].min(),igood[1].max()+inclusive,lonlat_sub)
+        kind,slon,slat=regrid.Regridder,lon[np.ix_(bj,bi)],lat[np.ix_(bj,bi)]
+    else:
+        raise ValueError('%s: %s is neither 1D nor 2D' % (url,lonvar))
+
+    if frames is not None:
+        # every frame, read through the slab cache (see reader.time_steps)
+        with metrics.timer(url,'time index'):
+            taxis = time_axis.get(url,tvar,nc)
+            tidx = taxis.indices(frames,3600.*frame_tol)
+        opts=dict(nc=nc,chunk_size=time_chunk,max_workers=read_workers,row_block=row_block,
+                  times=taxis.values[np.maximum(tidx,0)],
+                  revisions=taxis.revisions(np.maximum(tidx,0)))
+        def steps(vname):
+            if ugrid:
+                parts=[reader.time_steps(url,vname,tidx,isurf_layer,(r,),**opts) for r in ranges]
+                return np.ma.concatenate(parts,axis=1)[:,keep]
+            return reader.time_steps(url,vname,tidx,isurf_layer,(bj,bi),**opts)
+        print('reading u...')
+        u1=steps(uvar)
+        print('reading v...')
+        v1=steps(vvar)
+        return regrid.Field(slon,slat,u1,v1,kind,name=url,times=frames,date=frames[0])
+        
+    #date_mid=datetime.datetime(2011,9,8,17,00)  # specific time (UTC)
+    date_mid=date_mid or datetime.datetime.utcnow()
+    with metrics.timer(url,'time index'):
+        taxis = time_axis.get(url,tvar,nc)
+        istart,istop = taxis.window(date_mid,hours_ave)
+        actual_stop_date=taxis.date(istop)
+    
+    # rolling mean over the time window, updated from the last run's state
+    # and read in parallel chunks through the slab cache (see rolling_mean.py)
+    times=taxis.values[istart:istop:time_sub]
+    revisions=taxis.revisions(range(istart,istop,time_sub))
+    opts=dict(nc=nc,chunk_size=time_chunk,max_workers=read_workers,row_block=row_block,times=times,
+              revisions=revisions)
+    def time_mean(vname):
+        if ugrid:
+            means=[rolling_mean.time_mean(url,vname,istart,istop,time_sub,isurf_layer,(r,),tvar=tvar,**opts)
+                   for r in ranges]
+            return np.ma.concatenate(means)[keep]
+        return rolling_mean.time_mean(url,vname,istart,istop,time_sub,isurf_layer,(bj,bi),tvar=tvar,**opts)
+    print('reading u...')
+    u1=time_mean(uvar)
+    print('reading v...')
+    v1=time_mean(vvar)
+
+    # regridded later, onto the points it covers (see regrid.merge)
+    return regrid.Field(slon,slat,u1,v1,kind,name=url,
+                        date=actual_stop_date-datetime.timedelta(0,3600.*hours_ave/2.))
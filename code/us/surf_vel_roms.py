@@ -5,112 +5,98 @@
 
 import numpy as np
 import netCDF4
-import scipy.interpolate
 import datetime
+import regrid
+import rolling_mean
+import time_axis
+import grid_store
+import reader
+import metrics
+import rho_grid
 
 
 
-def shrink(a,b):
-    """Return array shrunk to fit a specified shape by triming or averaging.
-    
-    a = shrink(array, shape)
-    
-    array is an numpy ndarray, and shape is a tuple (e.g., from
-    array.shape). a is the input array shrunk such that its maximum
-    dimensions are given by shape. If shape has more dimensions than
-    array, the last dimensions of shape are fit.
-    
-    as, bs = shrink(a, b)
-    
-    If the second argument is also an array, both a and b are shrunk to
-    the dimensions of each other. The input arrays must have the same
-    number of dimensions, and the resulting arrays will have the same
-    shape.
-    Example
-    -------
-    
-    >>> shrink(rand(10, 10), (5, 9, 18)).shape
-    (9, 10)
-    >>> map(shape, shrink(rand(10, 10, 10), rand(5, 9, 18)))        
-    [(5, 9, 10), (5, 9, 10)]   
-       
-    """
-
-    if isinstance(b, np.ndarray):
-        if not len(a.shape) == len(b.shape):
-            raise Exception, \
-                  'input arrays must have the same number of dimensions'
-        a = shrink(a,b.shape)
-        b = shrink(b,a.shape)
-        return (a, b)
-
-    if isinstance(b, int):
-        b = (b,)
-
-    if len(a.shape) == 1:                # 1D array is a special case
-        dim = b[-1]
-        while a.shape[0] > dim:          # only shrink a
-            if (dim - a.shape[0]) >= 2:  # trim off edges evenly
-                a = a[1:-1]
-            else:                        # or average adjacent cells
-                a = 0.5*(a[1:] + a[:-1])
-    else:
-        for dim_idx in range(-(len(a.shape)),0):
-            dim = b[dim_idx]
-            a = a.swapaxes(0,dim_idx)        # put working dim first
-            while a.shape[0] > dim:          # only shrink a
-                if (a.shape[0] - dim) >= 2:  # trim off edges evenly
-                    a = a[1:-1,:]
-                if (a.shape[0] - dim) == 1:  # or average adjacent cells
-                    a = 0.5*(a[1:,:] + a[:-1,:])
-            a = a.swapaxes(0,dim_idx)        # swap working dim back
-
-    return a
-
-def rot2d(x, y, ang):
-    '''rotate vectors by geometric angle'''
-    xr = x*np.cos(ang) - y*np.sin(ang)
-    yr = x*np.sin(ang) + y*np.cos(ang)
-    return xr, yr
-
 # <codecell>
 
-def surf_vel_roms(x,y,url,date_mid=datetime.datetime.utcnow,hours_ave=24,tvar='ocean_time',lonlat_sub=1,time_sub=6):
+def surf_vel_roms(x,y,url,date_mid=None,hours_ave=24,tvar='ocean_time',lonlat_sub=1,time_sub=6,
+    time_chunk=None,read_workers=None,row_block=None,frames=None,frame_tol=3.):
+    '''time mean u,v at the rho points as a regrid.Field, or given frames
+    (a list of times), the u,v of the nearest time step to each of them'''
     #url = 'http://testbedapps-dev.sura.org/thredds/dodsC/alldata/Shelf_Hypoxia/tamu/roms/tamu_roms.nc'
 
     #url='http://tds.ve.ismar.cnr.it:8080/thredds/dodsC/field2_test/run1/his'
     #####################################################################################
 
-    nc = netCDF4.Dataset(url)
-    mask = nc.variables['mask_rho'][:]
-    lon_rho = nc.variables['lon_rho'][:]
-    lat_rho = nc.variables['lat_rho'][:]
-    anglev = nc.variables['angle'][:]
-
-    desired_stop_date = date_mid+datetime.timedelta(0,3600.*hours_ave/2.)  # specific time (UTC)
-    istop = netCDF4.date2index(desired_stop_date,nc.variables[tvar],select='nearest')   
-    actual_stop_date=netCDF4.num2date(nc.variables[tvar][istop],nc.variables[tvar].units)   
-    start_date=actual_stop_date-datetime.timedelta(0,3600.*hours_ave)
-    istart = netCDF4.date2index(start_date,nc.variables[tvar],select='nearest') 
+    with metrics.timer(url,'open dataset'):
+        nc = netCDF4.Dataset(url)
+    # static grid arrays come from the local store (see grid_store.py)
+    with metrics.timer(url,'grid read') as m:
+        g = grid_store.get(url,['mask_rho','lon_rho','lat_rho','angle'],nc)
+        m.nbytes = g.nbytes
+    mask = g['mask_rho']
+    lon_rho = g['lon_rho']
+    lat_rho = g['lat_rho']
+    anglev = g['angle']
+
+    # only read the part of the grid that overlaps the x,y domain
+    igood = g.where('lon_rho','lat_rho',x.min(),x.max(),y.min(),y.max())
+    if len(igood[0])==0:
+        print('no overlap with the x,y domain')
+        return None
+    j0,j1,i0,i1 = rho_grid.window(igood,lon_rho.shape)
 
     uvar='u'
     vvar='v'
     isurf_layer = -1
-    print('reading u...')
-    u=np.mean(nc.variables[uvar][istart:istop:time_sub,isurf_layer,:,:],axis=0)
-    print('reading v...')
-    v=np.mean(nc.variables[vvar][istart:istop:time_sub,isurf_layer,:,:],axis=0)
+    # u is on (eta_rho, xi_rho-1) points, v on (eta_rho-1, xi_rho)
+    uindex = (slice(j0,j1),slice(i0,i1-1))
+    vindex = (slice(j0,j1-1),slice(i0,i1))
+    if frames is not None:
+        # every frame, read through the slab cache (see reader.time_steps)
+        with metrics.timer(url,'time index'):
+            taxis = time_axis.get(url,tvar,nc)
+            tidx = taxis.indices(frames,3600.*frame_tol)
+        opts=dict(nc=nc,chunk_size=time_chunk,max_workers=read_workers,row_block=row_block,
+                  times=taxis.values[np.maximum(tidx,0)],
+                  revisions=taxis.revisions(np.maximum(tidx,0)))
+        print('reading u...')
+        u=reader.time_steps(url,uvar,tidx,isurf_layer,uindex,**opts)
+        print('reading v...')
+        v=reader.time_steps(url,vvar,tidx,isurf_layer,vindex,**opts)
+    else:
+        date_mid = date_mid or datetime.datetime.utcnow()
+        with metrics.timer(url,'time index'):
+            taxis = time_axis.get(url,tvar,nc)
+            istart,istop = taxis.window(date_mid,hours_ave)
+            actual_stop_date=taxis.date(istop)
+        actual_date_mid=actual_stop_date-datetime.timedelta(0,3600.*hours_ave/2.)
+
+        # rolling mean over the time window, updated from the last run's state
+        # and read in parallel chunks through the slab cache (see rolling_mean.py)
+        times=taxis.values[istart:istop:time_sub]
+        revisions=taxis.revisions(range(istart,istop,time_sub))
+        opts=dict(nc=nc,chunk_size=time_chunk,max_workers=read_workers,row_block=row_block,times=times,
+                  revisions=revisions)
+        print('reading u...')
+        u=rolling_mean.time_mean(url,uvar,istart,istop,time_sub,isurf_layer,uindex,tvar=tvar,**opts)
+        print('reading v...')
+        v=rolling_mean.time_mean(url,vvar,istart,istop,time_sub,isurf_layer,vindex,tvar=tvar,**opts)
     print('done reading data...')
-    u = shrink(u, mask[1:-1, 1:-1].shape)
-    v = shrink(v, mask[1:-1, 1:-1].shape)
-
-    u, v = rot2d(u, v, anglev[1:-1, 1:-1])
+    inner = (slice(j0+1,j1-1),slice(i0+1,i1-1))
+    # u,v at the interior rho points, rotated to east/north
+    with metrics.timer(url,'destagger',shape=u.shape):
+        u, v = rho_grid.get((url,j0,j1,i0,i1),anglev[inner])(u, v)
 
 
     # <codecell>
 
-    lon=lon_rho[1:-1,1:-1]
-    lat=lat_rho[1:-1,1:-1]
+    lon=lon_rho[inner]
+    lat=lat_rho[inner]
+    mask=mask[inner]
+    if lonlat_sub>1:
+        sub=(slice(None,None,lonlat_sub),slice(None,None,lonlat_sub))
+        u, v = u[(Ellipsis,)+sub], v[(Ellipsis,)+sub]
+        lon, lat, mask = lon[sub], lat[sub], mask[sub]
 
 
     # <codecell>
@@ -118,15 +104,10 @@ def surf_vel_roms(x,y,url,date_mid=datetime.datetime.utcnow,hours_ave=24,tvar='o
 
     # <codecell>
 
-    xx2,yy2=np.meshgrid(x,y)
-    print('interpolating u to uniform grid...')
-    ui=scipy.interpolate.griddata((lon.flatten(),lat.flatten()),u.flatten(),(xx2,yy2),method='linear',fill_value=0.0)
-    print('interpolating v to uniform grid...')
-    vi=scipy.interpolate.griddata((lon.flatten(),lat.flatten()),v.flatten(),(xx2,yy2),method='linear',fill_value=0.0)
-    ui[np.isnan(ui)]=0.0
-    vi[np.isnan(vi)]=0.0
-
-    
-    return ui,vi
+    # regridded later, bilinearly within the ROMS grid cells with land
+    # points left out, onto the points it covers (see regrid.merge)
+    date = frames[0] if frames is not None else actual_date_mid
+    return regrid.Field(lon,lat,u,v,regrid.CurvilinearRegridder,name=url,mask=mask,times=frames,
+                        date=date)
 
 
@@ -0,0 +1,61 @@
+"""
+Shared fixtures of the tests: the modules are imported by name from the
+directory above (as the scripts do), and every cache goes to a fresh
+temporary directory so the tests neither use nor leave cached state.
+
+    cd code/us; python -m pytest -q
+"""
+import os
+import sys
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import datetime
+import numpy as np
+import netCDF4
+import pytest
+import interp_cache
+import slab_cache
+import rolling_mean
+import time_axis
+import grid_store
+import changes
+
+@pytest.fixture
+def caches(tmp_path,monkeypatch):
+    '''all the caches in tmp_path'''
+    for module,name in ((interp_cache,'interp'),(slab_cache,'slabs'),(time_axis,'time'),
+                        (grid_store,'grid')):
+        monkeypatch.setattr(module,'cache_dir',str(tmp_path/'cache'/name))
+    monkeypatch.setattr(rolling_mean,'state_dir',str(tmp_path/'cache'/'rolling'))
+    monkeypatch.setattr(changes,'state_file',str(tmp_path/'cache'/'changes.json'))
+    monkeypatch.setattr(time_axis,'_axes',{})
+    monkeypatch.setattr(grid_store,'_grids',{})
+    return tmp_path
+
+@pytest.fixture
+def dataset(caches):
+    """Function writing a small model file to the temporary directory:
+    hourly steps around now, 1D lon/lat, and u,v (time,depth,lat,lon)
+    with a few missing values.  Returns its path."""
+    def make(name='model.nc',nt=40,ny=6,nx=8,seed=0):
+        fname = str(caches/name)
+        rs = np.random.RandomState(seed)
+        nc = netCDF4.Dataset(fname,'w',format='NETCDF3_64BIT_OFFSET')
+        nc.createDimension('time',None)
+        nc.createDimension('depth',2)
+        nc.createDimension('lat',ny)
+        nc.createDimension('lon',nx)
+        t = nc.createVariable('time','f8',('time',))
+        t.units = 'hours since 1970-01-01 00:00:00'
+        now = netCDF4.date2num(datetime.datetime.utcnow(),t.units)
+        t[:] = np.floor(now)-nt//2+np.arange(nt)
+        nc.createVariable('lon','f8',('lon',))[:] = np.linspace(-72.,-65.,nx)
+        nc.createVariable('lat','f8',('lat',))[:] = np.linspace(38.,44.,ny)
+        for vname in ('u','v'):
+            var = nc.createVariable(vname,'f4',('time','depth','lat','lon'),fill_value=-999.)
+            data = rs.rand(nt,2,ny,nx)
+            var[:] = np.ma.masked_array(data,rs.rand(nt,2,ny,nx)<0.1)
+        nc.close()
+        return fname
+    return make
@@ -0,0 +1,20 @@
+import os
+import pytest
+import atomic
+
+def test_write_replaces_the_file(tmp_path):
+    fname = str(tmp_path/'out.json')
+    atomic.write_text(fname,'old')
+    atomic.write_text(fname,'new')
+    assert open(fname).read()=='new'
+    assert os.listdir(str(tmp_path))==['out.json']
+
+def test_failed_write_leaves_the_old_file(tmp_path):
+    fname = str(tmp_path/'out.json')
+    atomic.write_text(fname,'old')
+    with pytest.raises(ValueError):
+        with atomic.writer(fname) as f:
+            f.write('half')
+            raise ValueError('failed')
+    assert open(fname).read()=='old'
+    assert os.listdir(str(tmp_path))==['out.json']
@@ -0,0 +1,30 @@
+import os
+import build
+import changes
+import registry
+
+dom = dict(x0=-72.,y0=38.,x1=-65.,y1=44.,dx=0.5,dy=0.5,sources=['a'])
+probes = {'a':{'ntimes':40,'last_time':10.,'window':[8,32],'grid':[['lon',[8],'x']]}}
+
+def test_nothing_new_writes_nothing(caches,monkeypatch):
+    monkeypatch.setattr(registry,'domains',{'d':dom})
+    monkeypatch.setattr(registry,'sources',{'a':dict(url='http://a/x',grid='structured',priority=10)})
+    monkeypatch.setattr(build,'probe_sources',lambda *args,**kwargs: probes)
+    def read_sources(*args,**kwargs):
+        raise AssertionError('nothing should be read')
+    monkeypatch.setattr(build,'read_sources',read_sources)
+    outdir = str(caches/'%(name)s')
+    os.makedirs(outdir % {'name':'d'})
+    open(build.output_file('d',outdir),'w').close()
+    changes.save({changes.key('d'):changes.domain_state(dom,probes)})
+    os.utime(changes.state_file,(1000,1000))
+    report = str(caches/'run-report.json')
+    build.build(['d'],outdir=outdir,report=report)
+    assert not os.path.exists(report)
+    assert os.path.getmtime(changes.state_file)==1000
+
+def test_sources_of_the_same_priority_keep_their_order():
+    us = [s for s in sorted(registry.domains['us']['sources'],key=build.priority) if s.startswith('glcfs_')]
+    assert us==['glcfs_'+nam for nam in ['michigan','huron','erie','ontario','superior']]
+    lakes = sorted(registry.domains['great_lakes']['sources'],key=build.priority)
+    assert lakes==['glcfs_'+nam for nam in ['superior','michigan','huron','erie','ontario']]
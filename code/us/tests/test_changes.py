@@ -0,0 +1,49 @@
+import datetime
+import changes
+
+dom = dict(x0=-72.,y0=38.,x1=-65.,y1=44.,dx=0.1,dy=0.1,sources=['a','b'])
+
+def probes(**kw):
+    p = {'a':{'ntimes':40,'last_time':10.,'window':[8,32],'grid':[['lon',[8],'x']]},
+         'b':{'ntimes':12,'last_time':5.,'window':[0,11],'grid':[['lon',[4],'y']]}}
+    for s,new in kw.items():
+        p[s] = new if new is None else dict(p[s],**new)
+    return p
+
+def built(animate=False):
+    return {changes.key('d',animate):changes.domain_state(dom,probes())}
+
+def test_unchanged_when_every_probe_is_the_same():
+    assert changes.unchanged(built(),'d',dom,probes())
+
+def test_never_built():
+    assert not changes.unchanged({},'d',dom,probes())
+    assert not changes.unchanged(built(),'d',dom,probes(),animate=True)
+
+def test_new_step_grid_or_window_is_a_change():
+    assert not changes.unchanged(built(),'d',dom,probes(a={'ntimes':41,'last_time':11.}))
+    assert not changes.unchanged(built(),'d',dom,probes(b={'grid':[['lon',[4],'z']]}))
+    assert not changes.unchanged(built(),'d',dom,probes(a={'window':[9,33]}))
+
+def test_changed_domain_is_a_change():
+    assert not changes.unchanged(built(),'d',dict(dom,dx=0.05),probes())
+
+def test_source_that_could_not_be_probed_counts_as_unchanged():
+    assert changes.unchanged(built(),'d',dom,probes(b=None))
+
+def test_state_round_trip(caches):
+    changes.save(built())
+    assert changes.unchanged(changes.load(),'d',dom,probes())
+
+def test_probe_window_moves_with_the_time(dataset):
+    fname = dataset()
+    now = datetime.datetime.utcnow()
+    p = changes.probe(fname,'time',['lon','lat'],date_mid=now,hours_ave=24)
+    assert p['ntimes']==40
+    assert p['window'][1]-p['window'][0]==24
+    later = changes.probe(fname,'time',['lon','lat'],date_mid=now+datetime.timedelta(hours=3),hours_ave=24)
+    assert later['grid']==p['grid'] and later['last_time']==p['last_time']
+    assert later['window']!=p['window']
+    frames = [now+datetime.timedelta(hours=h) for h in range(3)]
+    p = changes.probe(fname,'time',['lon','lat'],frames=frames)
+    assert len(p['window'])==3
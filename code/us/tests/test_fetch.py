@@ -0,0 +1,64 @@
+import os
+import time
+import pytest
+import fetch
+
+def value(x,wait=0.):
+    time.sleep(wait)
+    return x
+
+def span(wait):
+    t0 = time.time()
+    time.sleep(wait)
+    return t0,time.time()
+
+def broken(msg):
+    raise ValueError(msg)
+
+def test_results_come_back_in_job_order():
+    jobs = [('http://h%d/x' % (k%2),value,(k,),{'wait':0.3-0.1*k}) for k in range(3)]
+    assert fetch.fetch_all(jobs,max_workers=3)==[0,1,2]
+
+def test_no_more_than_per_host_jobs_per_server():
+    jobs = [('http://same/%d' % k,span,(0.3,),{}) for k in range(4)]
+    spans = fetch.fetch_all(jobs,max_workers=4,per_host=2)
+    for t0,t1 in spans:
+        # jobs running at the time this one started, itself included
+        assert sum([1 for s0,s1 in spans if s0<=t0<s1])<=2
+
+def test_first_failure_in_job_order_is_raised():
+    jobs = [('http://a/x',value,(1,),{}),('http://b/x',broken,('second',),{}),
+            ('http://c/x',broken,('third',),{})]
+    with pytest.raises(ValueError) as err:
+        fetch.fetch_all(jobs,retries=0)
+    assert 'second' in str(err.value)
+
+def sleep(seconds):
+    time.sleep(seconds)
+    return 'woke'
+
+def fail_once(marker):
+    '''fails the first time it runs (in any process), then returns 42'''
+    if not os.path.exists(marker):
+        open(marker,'w').close()
+        raise IOError('first attempt fails')
+    return 42
+
+def test_hung_job_is_killed_after_its_timeout():
+    failures = {}
+    t0 = time.time()
+    results = fetch.fetch_all([('http://a/x',sleep,(60,),{}),('http://b/x',value,(1,),{})],
+                              timeout=0.5,retries=0,failures=failures)
+    assert time.time()-t0 < 20
+    assert results==[None,1]
+    assert list(failures)==[0] and failures[0].startswith('Timeout')
+
+def test_failed_job_is_retried(tmp_path):
+    marker = str(tmp_path/'tried')
+    assert fetch.fetch_all([('http://a/x',fail_once,(marker,),{})],retries=1,retry_wait=0.01)==[42]
+
+def test_failures_dict_instead_of_raising():
+    failures = {}
+    assert fetch.fetch_all([('http://a/x',broken,('always fails',),{})],retries=1,retry_wait=0.01,
+                           failures=failures)==[None]
+    assert failures[0]=='ValueError: always fails'
@@ -0,0 +1,44 @@
+import numpy as np
+import grid_store
+
+def boxes(n=40,seed=4):
+    rs = np.random.RandomState(seed)
+    for k in range(n):
+        x0,y0 = -76.+rs.rand()*8.,35.+rs.rand()*6.
+        yield x0,x0+rs.rand()*4.,y0,y0+rs.rand()*3.
+
+def check(index,lon,lat):
+    for x0,x1,y0,y1 in boxes():
+        want = np.where((lon>=x0)&(lon<=x1)&(lat>=y0)&(lat<=y1))
+        got = index.where(lon,lat,x0,x1,y0,y1)
+        assert len(got)==len(want)
+        for g,w in zip(got,want):
+            assert np.array_equal(g,w)
+
+def test_where_matches_np_where_on_a_curvilinear_grid():
+    jj,ii = np.mgrid[0:70,0:90].astype(np.float64)
+    lon = -76.+0.1*(ii*np.cos(0.5)-jj*np.sin(0.5))
+    lat = 36.+0.1*(ii*np.sin(0.5)+jj*np.cos(0.5))
+    lon[:5,:7] = np.nan             # e.g. masked points
+    index = grid_store.BoxIndex(lon,lat,block=16)
+    check(index,lon,lat)
+    # and the same index restored from its arrays
+    check(grid_store.BoxIndex(None,None,arrays=index.to_arrays()),lon,lat)
+
+def test_where_matches_np_where_on_unstructured_points():
+    rs = np.random.RandomState(5)
+    lon = -76.+rs.rand(5000)*9.
+    lat = 35.+rs.rand(5000)*7.
+    check(grid_store.BoxIndex(lon,lat,block=8),lon,lat)
+
+def test_grid_arrays_come_back_from_the_store(dataset,monkeypatch):
+    import netCDF4
+    fname = dataset()
+    nc = netCDF4.Dataset(fname)
+    lon = nc.variables['lon'][:]
+    nc.close()
+    g = grid_store.get(fname,['lon','lat'])
+    assert np.array_equal(g['lon'],lon)
+    monkeypatch.setattr(grid_store,'_grids',{})
+    g = grid_store.get(fname,['lon','lat'])
+    assert np.array_equal(g['lon'],lon)
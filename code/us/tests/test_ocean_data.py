@@ -0,0 +1,56 @@
+import json
+import datetime
+import numpy as np
+import ocean_data
+
+def field(n=300,seed=2):
+    rs = np.random.RandomState(seed)
+    ui = rs.randn(n)*0.5
+    vi = rs.randn(n)*0.5
+    vi[10:15] = np.nan          # missing, written as 0
+    return ui,vi
+
+def read_bin(tmp_path):
+    meta = json.load(open(str(tmp_path/'ocean-data.json')))
+    uv = np.fromfile(str(tmp_path/'ocean-data.bin'),dtype='<'+meta['dtype'][0]+'2')
+    return meta,uv.reshape(-1,2).astype(np.float64)*meta['scale']
+
+def test_write_bin_round_trip_int16(tmp_path):
+    ui,vi = field()
+    ocean_data.write_bin(str(tmp_path/'ocean-data.bin'),ui,vi,-80.,30.,-60.,45.,20,15,'now')
+    meta,uv = read_bin(tmp_path)
+    assert meta['gridWidth']==20 and meta['gridHeight']==15 and meta['x1']==-60.
+    assert meta['dtype']=='int16' and meta['layout']=='uv-interleaved'
+    assert np.allclose(uv[:,0],ui,atol=meta['scale']/2+1e-12,rtol=0)
+    assert np.allclose(uv[:,1],np.nan_to_num(vi),atol=meta['scale']/2+1e-12,rtol=0)
+    assert (uv[10:15,1]==0).all()
+
+def test_write_bin_round_trip_float16(tmp_path):
+    ui,vi = field()
+    ocean_data.write_bin(str(tmp_path/'ocean-data.bin'),ui,vi,-80.,30.,-60.,45.,20,15,'now',
+                         dtype='float16')
+    meta,uv = read_bin(tmp_path)
+    assert meta['scale']==1.0
+    assert np.allclose(uv[:,0],ui,rtol=1e-3,atol=1e-4)
+
+def test_write_frames_round_trip(tmp_path):
+    rs = np.random.RandomState(2)
+    nt,npts = 6,500
+    base = np.cumsum(rs.randn(nt,npts)*0.01,axis=0)
+    ui = base+0.3
+    vi = -base
+    ui[3,:20] += 2.5            # differences too large for one byte
+    vi[4,10:15] = np.nan        # missing, written as 0
+    times = [datetime.datetime(2024,1,1)+datetime.timedelta(hours=h) for h in range(nt)]
+    fname = str(tmp_path/'ocean-frames.bin')
+    meta = ocean_data.write_frames(fname,ui,vi,-80.,30.,-60.,45.,25,20,'now',times)
+    got,u,v = ocean_data.read_frames(fname)
+    assert got==meta
+    assert meta['encoding']=='delta-escape-zlib'
+    assert meta['frames'][3]['escapes']>=20
+    assert [fr['time'] for fr in meta['frames']][1]=='2024-01-01T01:00:00Z'
+    assert u.shape==(nt,npts) and v.shape==(nt,npts)
+    scale = meta['scale']
+    assert np.allclose(u,np.round(ui/scale)*scale,atol=1e-9,rtol=0)
+    assert np.allclose(v,np.round(np.nan_to_num(vi)/scale)*scale,atol=1e-9,rtol=0)
+    assert (v[4,10:15]==0).all()
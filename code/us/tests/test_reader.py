@@ -0,0 +1,66 @@
+import numpy as np
+import netCDF4
+import reader
+
+def direct_mean(fname,istart,istop,time_sub,index,vname='u'):
+    nc = netCDF4.Dataset(fname)
+    data = nc.variables[vname][istart:istop:time_sub,0][(slice(None),)+np.ix_(*index)]
+    nc.close()
+    return data.mean(axis=0)
+
+def check(got,want):
+    assert np.array_equal(np.ma.getmaskarray(got),np.ma.getmaskarray(want))
+    assert np.ma.allclose(got,want,atol=1e-12)
+
+def test_chunked_mean_matches_direct_mean(dataset):
+    fname = dataset()
+    index = (np.arange(1,6),np.arange(2,7))
+    for chunk_size,row_block,workers in ((2,2,3),(5,None,1),(40,1,4)):
+        got = reader.time_mean(fname,'u',3,31,2,0,index,chunk_size=chunk_size,row_block=row_block,
+                               max_workers=workers)
+        check(got,direct_mean(fname,3,31,2,index))
+
+def test_index_ranges_cover_the_indices():
+    rs = np.random.RandomState(6)
+    data = rs.rand(1000)
+    for n,max_ranges,max_gap in ((50,4,0),(200,8,3),(5,8,0),(300,1,0)):
+        idx = np.sort(rs.choice(1000,n,replace=False))
+        ranges,keep = reader.index_ranges(idx,max_ranges=max_ranges,max_gap=max_gap)
+        assert 1<=len(ranges)<=max_ranges
+        # no range overlaps the next, and every gap left is wider than max_gap
+        for a,b in zip(ranges[:-1],ranges[1:]):
+            assert b.start-a.stop>max_gap
+        # keep picks idx out of the concatenation of the ranges
+        assert np.array_equal(np.concatenate([data[r] for r in ranges])[keep],data[idx])
+
+def test_index_ranges_of_nothing():
+    ranges,keep = reader.index_ranges([])
+    assert ranges==[] and len(keep)==0
+
+def test_chunking_keeps_within_max_bytes():
+    nrows,nvals,itemsize,workers = 100,400,4,3
+    per = nvals*((itemsize+1)*(workers+1)+24)
+    for max_bytes in (10**8,16*nrows*nvals+50*per,16*nrows*nvals+3*per):
+        cs,rb = reader.chunking(nrows,nvals,itemsize,24,None,workers,max_bytes)
+        assert 1<=cs<=24
+        assert 16*nrows*nvals+cs*(rb or nrows)*per<=max_bytes
+    assert reader.chunking(nrows,nvals,itemsize,24,None,workers,10**8)==(24,None)
+    # the sums alone over the limit: one step of one row at a time
+    assert reader.chunking(nrows,nvals,itemsize,24,None,workers,1000)==(1,1)
+
+def test_small_max_bytes_gives_the_same_mean(dataset):
+    fname = dataset()
+    index = (np.arange(0,6),np.arange(0,8))
+    got = reader.time_mean(fname,'u',0,40,1,0,index,chunk_size=40,max_workers=2,max_bytes=2000)
+    check(got,direct_mean(fname,0,40,1,index))
+
+def test_pooled_time_sum_matches_masked_mean(dataset):
+    fname = dataset()
+    index = (np.arange(0,6),np.arange(1,8))
+    tidx = [0,2,4,10,12,30]
+    total,count = reader.time_sum(fname,'u',tidx,2,0,index,chunk_size=2,row_block=3,max_workers=3)
+    nc = netCDF4.Dataset(fname)
+    data = nc.variables['u'][tidx,0][(slice(None),)+np.ix_(*index)]
+    nc.close()
+    assert np.array_equal(count,(~np.ma.getmaskarray(data)).sum(axis=0))
+    check(reader.masked_mean(total,count),np.ma.mean(data,axis=0))
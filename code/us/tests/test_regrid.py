@@ -0,0 +1,136 @@
+import numpy as np
+import regrid
+
+def linear(lon,lat):
+    return 0.3+0.02*lon-0.05*lat
+
+x = np.linspace(-74.,-64.,41)
+y = np.linspace(36.,45.,37)
+
+def test_rectilinear_regridder_reproduces_a_linear_field(caches):
+    glon = np.linspace(-72.,-66.,25)            # inside part of the target grid
+    glon = glon+0.01*np.sin(np.arange(25))      # uneven spacing
+    glat = np.linspace(44.,38.,19)              # decreasing, as in some files
+    lon2,lat2 = np.meshgrid(glon,glat)
+    r = regrid.RectilinearRegridder(glon,glat,x,y)
+    ui = r(linear(lon2,lat2))
+    xx,yy = np.meshgrid(x,y)
+    inside = (xx>=glon.min())&(xx<=glon.max())&(yy>=38.)&(yy<=44.)
+    assert np.allclose(ui[inside],linear(xx,yy)[inside],atol=1e-12,rtol=0)
+    assert (ui[~inside]==0).all()
+    # a stack of fields in one go, and a missing value only spoils its cells
+    stack = r(np.array([linear(lon2,lat2),2*linear(lon2,lat2)]))
+    assert stack.shape==(2,len(y),len(x)) and np.allclose(stack[1],2*ui,atol=1e-12)
+    values = np.ma.masked_array(linear(lon2,lat2),np.zeros(lon2.shape,dtype=bool))
+    values[9,12] = np.ma.masked
+    ui = r(values)
+    near = (np.abs(xx-glon[12])<np.diff(glon).max())&(np.abs(yy-glat[9])<0.34)
+    assert np.isnan(ui[near]).any() and not np.isnan(ui[inside&~near]).any()
+
+def test_regridder_reproduces_a_linear_field(caches):
+    rs = np.random.RandomState(7)
+    lon = -72.+rs.rand(3000)*6.
+    lat = 38.+rs.rand(3000)*6.
+    r = regrid.Regridder(lon,lat,x,y)
+    ui = r(linear(lon,lat))
+    xx,yy = np.meshgrid(x,y)
+    inside = ~r.outside.reshape(xx.shape)
+    assert inside.sum()>300
+    assert np.allclose(ui[inside],linear(xx,yy)[inside],atol=1e-10,rtol=0)
+    assert (ui[~inside]==0).all()
+
+def rotated_grid(ny=30,nx=40,ang=0.5,step=0.15):
+    jj,ii = np.mgrid[0:ny,0:nx].astype(np.float64)
+    lon = -72.+step*(ii*np.cos(ang)-jj*np.sin(ang))
+    lat = 37.+step*(ii*np.sin(ang)+jj*np.cos(ang))
+    return lon,lat
+
+def test_curvilinear_regridder_reproduces_a_linear_field(caches):
+    lon,lat = rotated_grid()
+    r = regrid.CurvilinearRegridder(lon,lat,x,y)
+    ui = r(linear(lon,lat))
+    xx,yy = np.meshgrid(x,y)
+    inside = ~r.outside.reshape(xx.shape)
+    assert inside.sum()>300
+    assert np.allclose(ui[inside],linear(xx,yy)[inside],atol=1e-10,rtol=0)
+    assert (ui[~inside]==0).all()
+
+def test_curvilinear_regridder_leaves_out_land(caches):
+    lon,lat = rotated_grid()
+    mask = np.ones(lon.shape)
+    mask[5:15,10:20] = 0            # a block of land
+    values = np.ma.masked_array(linear(lon,lat),mask==0)
+    ui = regrid.CurvilinearRegridder(lon,lat,x,y,mask=mask)(values)
+    ref = regrid.CurvilinearRegridder(lon,lat,x,y)
+    wet = ref(np.where(mask>0,1.,0.))  # 1 where every corner of the cell is wet
+    xx,yy = np.meshgrid(x,y)
+    inside = ~ref.outside.reshape(xx.shape)
+    all_wet = inside&np.isclose(wet,1.)
+    all_land = inside&np.isclose(wet,0.)
+    coast = inside&~all_wet&~all_land
+    assert all_land.any() and coast.any()
+    assert np.allclose(ui[all_wet],linear(xx,yy)[all_wet],atol=1e-10,rtol=0)
+    assert np.isnan(ui[all_land]).all()
+    # coastal points come from their wet corners only
+    assert np.isfinite(ui[coast]).all()
+    lo,hi = linear(lon,lat)[mask>0].min(),linear(lon,lat)[mask>0].max()
+    assert ((ui[coast]>=lo)&(ui[coast]<=hi)).all()
+
+def fields():
+    """A scattered source over part of the grid, with a masked patch,
+    over a rectilinear one covering most of it."""
+    rs = np.random.RandomState(1)
+    lon = -72.+rs.rand(2000)*5.
+    lat = 38.+rs.rand(2000)*4.
+    u = np.ma.masked_array(np.sin(lon)*np.cos(lat),(lon>-69.)&(lat>41.))
+    scattered = regrid.Field(lon,lat,u,u*0.5)
+    glon = np.linspace(-75.,-66.,30)
+    glat = np.linspace(35.,44.,25)
+    lon2,lat2 = np.meshgrid(glon,glat)
+    island = (lon2+70.)**2+(lat2-40.)**2<1.
+    g = np.ma.masked_array(np.cos(lon2)+lat2/50.,island)
+    rect = regrid.Field(glon,glat,g,-g,regrid.RectilinearRegridder)
+    return [scattered,None,rect]
+
+def plain_merge(fields):
+    '''every field regridded onto the whole grid, filling the points still 0'''
+    ui = np.zeros((len(y),len(x)))
+    vi = np.zeros((len(y),len(x)))
+    for field in fields:
+        if field is None:
+            continue
+        u,v = field.regrid(x,y)
+        fill = ui==0
+        ui[fill] = u[fill]
+        vi[fill] = v[fill]
+    return ui,vi
+
+def test_merge_matches_plain_merge(caches):
+    ui,vi = regrid.merge(fields(),x,y)
+    ur,vr = plain_merge(fields())
+    assert np.allclose(ui,ur,atol=1e-12,rtol=0)
+    assert np.allclose(vi,vr,atol=1e-12,rtol=0)
+    assert (ui==0).any() and (ui!=0).any()
+
+def test_merge_of_frames_merges_each_frame(caches):
+    times = [0,1,2]
+    frames = []
+    for field in fields():
+        if field is not None:
+            scale = np.arange(1.,4.).reshape((3,)+(1,)*field.u.ndim)
+            field = regrid.Field(field.lon,field.lat,field.u*scale,field.v*scale,field.regridder,
+                                 name=field.name,times=times)
+        frames.append(field)
+    ui,vi = regrid.merge(frames,x,y)
+    ur,vr = plain_merge(fields())
+    assert ui.shape==(3,len(y),len(x))
+    for k in range(3):
+        assert np.allclose(ui[k],ur*(k+1),atol=1e-12,rtol=0)
+        assert np.allclose(vi[k],vr*(k+1),atol=1e-12,rtol=0)
+
+def test_land_mask_does_not_change_the_merge(caches):
+    ur,vr = plain_merge(fields())
+    land = (ur==0)&(vr==0)
+    ui,vi = regrid.merge(fields(),x,y,land=land)
+    assert np.allclose(ui,ur,atol=1e-12,rtol=0)
+    assert np.allclose(vi,vr,atol=1e-12,rtol=0)
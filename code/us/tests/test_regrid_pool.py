@@ -0,0 +1,33 @@
+import multiprocessing
+import numpy as np
+import pytest
+import regrid
+import regrid_pool
+from test_regrid import fields, x, y
+
+@pytest.fixture
+def cores(monkeypatch):
+    '''as many cores as the tests ask for, so the pool runs on any machine'''
+    monkeypatch.setattr(multiprocessing,'cpu_count',lambda: 4)
+
+def test_pooled_merge_matches_merge(caches,cores):
+    ui,vi = regrid_pool.merge(fields(),x,y,workers=2)
+    ur,vr = regrid.merge(fields(),x,y)
+    assert np.allclose(ui,ur,atol=1e-12,rtol=0)
+    assert np.allclose(vi,vr,atol=1e-12,rtol=0)
+    assert (ui!=0).any()
+
+def test_pooled_merge_with_a_land_mask(caches,cores):
+    ur,vr = regrid.merge(fields(),x,y)
+    land = (ur==0)&(vr==0)
+    ui,vi = regrid_pool.merge(fields(),x,y,workers=2,land=land)
+    assert np.allclose(ui,ur,atol=1e-12,rtol=0)
+    assert np.allclose(vi,vr,atol=1e-12,rtol=0)
+
+def test_one_core_is_a_plain_merge(caches,monkeypatch):
+    monkeypatch.setattr(multiprocessing,'cpu_count',lambda: 1)
+    def pool(*args,**kwargs):
+        raise AssertionError('no pool on one core')
+    monkeypatch.setattr(multiprocessing,'Pool',pool)
+    ui,vi = regrid_pool.merge(fields(),x,y,workers=8)
+    assert np.array_equal(ui,regrid.merge(fields(),x,y)[0])
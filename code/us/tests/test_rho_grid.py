@@ -0,0 +1,53 @@
+import numpy as np
+import rho_grid
+
+def shrink(a,shape):
+    '''roms_utils.shrink of the baseline: trim or average each of the last
+    dimensions down to shape'''
+    for dim_idx in range(-(len(a.shape)),0):
+        dim = shape[dim_idx]
+        a = a.swapaxes(0,dim_idx)
+        while a.shape[0] > dim:
+            if (a.shape[0] - dim) >= 2:
+                a = a[1:-1,:]
+            if (a.shape[0] - dim) == 1:
+                a = 0.5*(a[1:,:] + a[:-1,:])
+        a = a.swapaxes(0,dim_idx)
+    return a
+
+def rot2d(x,y,ang):
+    return x*np.cos(ang)-y*np.sin(ang),x*np.sin(ang)+y*np.cos(ang)
+
+def velocities(nt,ny,nx,seed=3):
+    rs = np.random.RandomState(seed)
+    return rs.randn(nt,ny+2,nx+1),rs.randn(nt,ny+1,nx+2)
+
+def test_matches_shrink_and_rot2d():
+    ny,nx = 9,13
+    angle = np.random.RandomState(4).rand(ny,nx)
+    u,v = velocities(3,ny,nx)
+    ue,vn = rho_grid.RhoGrid(angle)(u,v)
+    ur,vr = rot2d(shrink(u,(3,ny,nx)),shrink(v,(3,ny,nx)),angle)
+    assert np.allclose(ue,ur,atol=1e-12,rtol=0)
+    assert np.allclose(vn,vr,atol=1e-12,rtol=0)
+
+def test_masked_where_any_source_point_is_masked():
+    ny,nx = 5,6
+    u,v = velocities(1,ny,nx)
+    u = np.ma.masked_array(u,np.zeros(u.shape,dtype=bool))
+    u[0,3,2] = np.ma.masked
+    ue,vn = rho_grid.RhoGrid(np.zeros((ny,nx)))(u,v)
+    # u[...,3,2] is averaged into the rho points (2,1) and (2,2)
+    assert list(zip(*np.where(np.ma.getmaskarray(ue)[0])))==[(2,1),(2,2)]
+    assert np.array_equal(np.ma.getmaskarray(ue),np.ma.getmaskarray(vn))
+
+def test_get_keeps_at_most_max_grids(monkeypatch):
+    monkeypatch.setattr(rho_grid,'max_grids',2)
+    monkeypatch.setattr(rho_grid,'_grids',[])
+    angle = np.zeros((4,4))
+    first = rho_grid.get('a',angle)
+    assert rho_grid.get('a',angle) is first
+    rho_grid.get('b',angle)
+    rho_grid.get('c',angle)
+    assert [k for k,rg in rho_grid._grids]==['b','c']
+    assert rho_grid.get('a',angle) is not first
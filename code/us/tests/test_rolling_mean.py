@@ -0,0 +1,36 @@
+import shutil
+import numpy as np
+import netCDF4
+import rolling_mean
+import slab_cache
+from test_reader import direct_mean, check
+
+def rolling(fname,istart,istop,time_sub,index):
+    nc = netCDF4.Dataset(fname)
+    try:
+        return rolling_mean.time_mean(fname,'u',istart,istop,time_sub,0,index,nc=nc)
+    finally:
+        nc.close()
+
+def updates(fname,time_sub,index):
+    return int(rolling_mean.load_state(rolling_mean.state_file(fname,'u',0,index,time_sub))['updates'])
+
+def test_matches_direct_mean_as_the_window_moves(dataset):
+    fname = dataset()
+    index = (np.arange(1,5),np.arange(2,7))
+    for n,start in enumerate((2,6,8,14)):
+        check(rolling(fname,start,start+24,2,index),direct_mean(fname,start,start+24,2,index))
+        assert updates(fname,2,index)==n     # each move after the first is incremental
+
+def test_rebuilds_when_a_dropped_step_was_revised(dataset):
+    fname = dataset()
+    index = (np.arange(6),np.arange(8))
+    check(rolling(fname,0,24,1,index),direct_mean(fname,0,24,1,index))
+    # step 0 changes in the file and its cached copy is gone, so what would
+    # be subtracted for it no longer matches what was added
+    shutil.rmtree(slab_cache.cache_dir)
+    nc = netCDF4.Dataset(fname,'a')
+    nc.variables['u'][0,0] = nc.variables['u'][0,0]+1.
+    nc.close()
+    check(rolling(fname,1,25,1,index),direct_mean(fname,1,25,1,index))
+    assert updates(fname,1,index)==0
@@ -0,0 +1,12 @@
+import numpy as np
+import surf_vel
+
+def test_inclusive_reads_the_last_row_and_column(dataset):
+    fname = dataset()
+    x = np.linspace(-75.,-60.,16)
+    y = np.linspace(35.,47.,13)
+    field = surf_vel.surf_vel(x,y,fname,time_sub=1)
+    assert (len(field.lon),len(field.lat))==(7,5)
+    field = surf_vel.surf_vel(x,y,fname,time_sub=1,inclusive=True)
+    assert (len(field.lon),len(field.lat))==(8,6)
+    assert field.u.shape==(6,8)
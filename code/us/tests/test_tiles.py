@@ -0,0 +1,46 @@
+import os
+import json
+import numpy as np
+import tiles
+
+def read_level(outdir,index,level):
+    '''the u,v grid of a level, put back together from its tiles'''
+    ny,nx = level['gridHeight'],level['gridWidth']
+    u = np.zeros((ny,nx))
+    v = np.zeros((ny,nx))
+    size = index['tileSize']
+    for tile in level['tiles']:
+        data = np.fromfile(os.path.join(outdir,tile['file']),dtype='<i2').astype(np.float64)*index['scale']
+        uv = data.reshape(tile['gridWidth'],tile['gridHeight'],2)
+        j0,i0 = tile['row']*size,tile['col']*size
+        u[j0:j0+tile['gridHeight'],i0:i0+tile['gridWidth']] = uv[...,0].T
+        v[j0:j0+tile['gridHeight'],i0:i0+tile['gridWidth']] = uv[...,1].T
+    return u,v
+
+def test_write_pyramid_round_trip(tmp_path):
+    rs = np.random.RandomState(3)
+    ui = rs.randn(37,50)*0.3
+    vi = rs.randn(37,50)*0.3
+    ui[:5,:7] = vi[:5,:7] = 0.      # land
+    vi[20,20] = np.nan
+    outdir = str(tmp_path/'tiles')
+    index = tiles.write_pyramid(outdir,ui,vi,-80.,30.,-60.,45.,'now',tile_size=16)
+    assert json.load(open(os.path.join(outdir,'index.json')))['levels'][0]['zoom']==0
+    levels = index['levels']
+    assert len(levels[0]['tiles'])==1
+    full = levels[-1]
+    assert full['factor']==1 and (full['gridHeight'],full['gridWidth'])==(37,50)
+    assert len(full['tiles'])==3*4
+    u,v = read_level(outdir,index,full)
+    tol = index['scale']/2+1e-12
+    assert np.allclose(u,ui,atol=tol,rtol=0)
+    assert np.allclose(v,np.nan_to_num(vi),atol=tol,rtol=0)
+    # each level is the one above it block averaged, ignoring land
+    for fine,coarse in zip(levels[::-1],levels[-2::-1]):
+        cu,cv = tiles.coarsen(*read_level(outdir,index,fine))
+        u,v = read_level(outdir,index,coarse)
+        assert np.allclose(u,cu,atol=2*tol,rtol=0) and np.allclose(v,cv,atol=2*tol,rtol=0)
+    u,v = read_level(outdir,index,levels[-2])
+    assert u[1,1]==0 and v[1,1]==0
+    wet = [ui[4,7],ui[5,6],ui[5,7]]     # ui[4,6] is land
+    assert np.allclose(u[2,3],np.mean(wet),atol=2*tol,rtol=0)
@@ -0,0 +1,86 @@
+import datetime
+import numpy as np
+import netCDF4
+import time_axis
+
+class Recorder(object):
+    '''a dataset whose time variable records the slices read from it'''
+    def __init__(self,fname):
+        self.nc = netCDF4.Dataset(fname)
+        self.reads = []
+        self.variables = {'time':self}
+    def __len__(self):
+        return len(self.nc.variables['time'])
+    def __getattr__(self,name):
+        return getattr(self.nc.variables['time'],name)
+    def __getitem__(self,key):
+        self.reads.append(key)
+        return self.nc.variables['time'][key]
+    def close(self):
+        self.nc.close()
+
+def append_steps(fname,n):
+    nc = netCDF4.Dataset(fname,'a')
+    t = nc.variables['time']
+    t[len(t):len(t)+n] = t[-1]+1+np.arange(n)
+    nc.close()
+
+def full_axis(fname):
+    nc = netCDF4.Dataset(fname)
+    values = nc.variables['time'][:]
+    nc.close()
+    return values
+
+def test_index_matches_date2index(dataset):
+    fname = dataset()
+    nc = netCDF4.Dataset(fname)
+    t = nc.variables['time']
+    taxis = time_axis.get(fname,'time',nc)
+    t0 = netCDF4.num2date(t[0],t.units)
+    for h in (-3.,0.,0.4,0.6,7.3,12.,39.,45.):
+        date = datetime.datetime(t0.year,t0.month,t0.day,t0.hour)+datetime.timedelta(hours=h)
+        assert taxis.index(date)==netCDF4.date2index(date,t,select='nearest')
+    for h in (0.4,0.6,7.3,38.2):
+        date = datetime.datetime(t0.year,t0.month,t0.day,t0.hour)+datetime.timedelta(hours=h)
+        for select in ('before','after'):
+            assert taxis.index(date,select)==netCDF4.date2index(date,t,select=select)
+    assert taxis.date(5)==datetime.datetime(t0.year,t0.month,t0.day,t0.hour)+datetime.timedelta(hours=5)
+    nc.close()
+
+def test_refresh_reads_only_the_tail(dataset,monkeypatch):
+    monkeypatch.setattr(time_axis,'tail',5)
+    fname = dataset()
+    time_axis.TimeAxis(fname,'time')
+    append_steps(fname,3)
+    nc = Recorder(fname)
+    taxis = time_axis.TimeAxis(fname,'time',nc)
+    nc.close()
+    assert np.array_equal(taxis.values,full_axis(fname))
+    assert len(taxis)==43
+    assert [key for key in nc.reads if key==slice(None)]==[]
+
+def test_changed_tail_is_read_again(dataset,monkeypatch):
+    monkeypatch.setattr(time_axis,'tail',5)
+    fname = dataset()
+    time_axis.TimeAxis(fname,'time')
+    nc = netCDF4.Dataset(fname,'a')
+    nc.variables['time'][30:] = nc.variables['time'][30:]+0.5     # a new forecast run
+    nc.close()
+    assert np.array_equal(time_axis.TimeAxis(fname,'time').values,full_axis(fname))
+
+def test_changed_head_is_read_again(dataset,monkeypatch):
+    monkeypatch.setattr(time_axis,'tail',5)
+    fname = dataset()
+    time_axis.TimeAxis(fname,'time')
+    nc = netCDF4.Dataset(fname,'a')
+    nc.variables['time'][0] = nc.variables['time'][0]-0.5      # the oldest step rolled off
+    nc.close()
+    assert np.array_equal(time_axis.TimeAxis(fname,'time').values,full_axis(fname))
+
+def test_get_brings_the_axis_up_to_date(dataset):
+    fname = dataset()
+    taxis = time_axis.get(fname,'time')
+    append_steps(fname,2)
+    assert time_axis.get(fname,'time') is taxis
+    assert len(taxis)==42
+    assert np.array_equal(taxis.values,full_axis(fname))
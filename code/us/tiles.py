@@ -0,0 +1,109 @@
+"""
+tiles: multi-resolution tiled output of the merged surface current field.
+
+write_pyramid cuts the merged ui,vi grid into fixed-size tiles at a series
+of zoom levels, each level block-averaging the one below it by 2x2, and
+writes an index.json describing the levels and tiles, so a client only
+fetches the tiles of the zoom level and area it is displaying:
+
+    tiles/index.json
+    tiles/<zoom>/<row>_<col>.bin   (or .js)
+
+zoom 0 is the coarsest level; the highest zoom is the full resolution
+grid.  Tile payloads are the same as ocean_data.write_bin (without the
+JSON header, which is in the index) or ocean_data.write_js.
+"""
+import os
+import json
+import numpy as np
+import ocean_data
+import atomic
+
+def coarsen(ui,vi):
+    """Average 2x2 blocks of ui,vi (ny,nx), ignoring land/empty cells
+    (u==v==0) so coastal currents aren't diluted.  Odd sizes are padded
+    with empty cells.
+    """
+    ny,nx=ui.shape
+    ny2=(ny+1)//2
+    nx2=(nx+1)//2
+    u=np.zeros((2*ny2,2*nx2))
+    v=np.zeros((2*ny2,2*nx2))
+    u[:ny,:nx]=ui
+    v[:ny,:nx]=vi
+    wet=((u!=0)|(v!=0)).astype(np.float64)
+    def blocksum(a):
+        return a.reshape(ny2,2,nx2,2).sum(axis=3).sum(axis=1)
+    n=blocksum(wet)
+    n[n==0]=1.0
+    return blocksum(u)/n,blocksum(v)/n
+
+def write_pyramid(outdir,ui,vi,x0,y0,x1,y1,timestamp,tile_size=128,fmt='bin',
+    dtype='int16',scale=0.001,extra=None):
+    """Write the tiled pyramid of ui,vi (ny,nx on the x0..x1, y0..y1 grid)
+    to outdir and return the index dictionary.  fmt is 'bin' or 'js'.
+    extra holds more entries for the index (e.g. stale sources).
+    """
+    if fmt not in ('bin','js'):
+        raise ValueError('fmt must be bin or js, not %s' % fmt)
+    ui=np.where(np.isnan(ui),0.0,ui)
+    vi=np.where(np.isnan(vi),0.0,vi)
+    ny,nx=ui.shape
+    dx=(x1-x0)/(nx-1.)
+    dy=(y1-y0)/(ny-1.)
+
+    # build levels from full resolution down until one tile covers the domain
+    levels=[(ui,vi)]
+    while max(levels[-1][0].shape)>tile_size:
+        levels.append(coarsen(*levels[-1]))
+    levels.reverse()
+
+    index={'timestamp':timestamp,'format':fmt,'tileSize':tile_size,
+           'x0':x0,'y0':y0,'x1':x1,'y1':y1,'levels':[]}
+    index.update(extra or {})
+    if fmt=='bin':
+        index.update({'dtype':dtype,'byteorder':'little','layout':'uv-interleaved'})
+        if dtype=='float16':
+            index['scale']=1.0
+        else:
+            index['scale']=scale
+    nzoom=len(levels)
+    for zoom,(u,v) in enumerate(levels):
+        fac=2**(nzoom-1-zoom)
+        # cell centers of the level: block means of the full resolution grid
+        lx0=x0+0.5*(fac-1)*dx
+        ly0=y0+0.5*(fac-1)*dy
+        ldx=dx*fac
+        ldy=dy*fac
+        lny,lnx=u.shape
+        level={'zoom':zoom,'factor':fac,'x0':lx0,'y0':ly0,'dx':ldx,'dy':ldy,
+               'gridWidth':lnx,'gridHeight':lny,'tiles':[]}
+        zdir=os.path.join(outdir,str(zoom))
+        if not os.path.isdir(zdir):
+            os.makedirs(zdir)
+        for j0 in range(0,lny,tile_size):
+            for i0 in range(0,lnx,tile_size):
+                j1=min(j0+tile_size,lny)
+                i1=min(i0+tile_size,lnx)
+                tu=u[j0:j1,i0:i1].T.flatten()   # javascript convention
+                tv=v[j0:j1,i0:i1].T.flatten()
+                tx0=lx0+i0*ldx
+                ty0=ly0+j0*ldy
+                tx1=lx0+(i1-1)*ldx
+                ty1=ly0+(j1-1)*ldy
+                name='%d_%d.%s' % (j0//tile_size,i0//tile_size,fmt)
+                fname=os.path.join(zdir,name)
+                if fmt=='js':
+                    ocean_data.write_js(fname,tu,tv,tx0,ty0,tx1,ty1,i1-i0,j1-j0,timestamp)
+                else:
+                    ocean_data.write_bin(fname,tu,tv,tx0,ty0,tx1,ty1,i1-i0,j1-j0,timestamp,
+                        dtype=dtype,scale=scale,header=False)
+                level['tiles'].append({'file':'%d/%s' % (zoom,name),
+                    'row':j0//tile_size,'col':i0//tile_size,
+                    'x0':tx0,'y0':ty0,'x1':tx1,'y1':ty1,
+                    'gridWidth':i1-i0,'gridHeight':j1-j0})
+        index['levels'].append(level)
+
+    # the index last, once all its tiles are in place
+    atomic.write_text(os.path.join(outdir,'index.json'),json.dumps(index,sort_keys=True,indent=1))
+    return index
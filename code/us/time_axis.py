@@ -0,0 +1,168 @@
+"""
+time_axis: cached time coordinate of a model source.
+
+The "best" FMRC aggregations have time axes thousands of entries long,
+and netCDF4.date2index/num2date pull the whole variable over the network
+on every call.  A TimeAxis reads the time variable once, keeps it on disk
+in cache/time, and on later runs (and later gets) re-reads only the tail
+(the last `tail` entries plus anything new) and the first entry, falling
+back to a full read if any of them no longer match what it kept.  Times
+are held as seconds since 1970-01-01 so lookups are an np.searchsorted.
+
+The steps of a best aggregation near and after the present come from the
+latest forecast run and change when the next run comes out.  revisions
+tags those steps (the ones later than settle seconds before now) with
+the length and last time of the axis, which move with every new run, so
+caches keyed by time value don't keep a superseded forecast.
+
+    taxis = time_axis.get(url,'time',nc)
+    istart,istop = taxis.window(date_mid,hours_ave)
+    actual_stop_date = taxis.date(istop)
+"""
+import os
+import hashlib
+import datetime
+import numpy as np
+import netCDF4
+import atomic
+
+cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),'cache','time')
+tail = 200          # entries re-read on refresh (forecast part of a best aggregation)
+settle = 6*3600.    # seconds before now beyond which new runs no longer revise a step (about a forecast cycle)
+
+epoch = datetime.datetime(1970,1,1)
+
+_axes = {}          # (url,tvar) -> TimeAxis, refreshed on each get
+
+class TimeAxis(object):
+    """Time coordinate tvar of the dataset at url.  values are the raw
+    values in the file's units, seconds the same times in seconds since
+    1970-01-01.
+    """
+    def __init__(self,url,tvar='time',nc=None):
+        self.url = url
+        self.tvar = tvar
+        key = hashlib.sha1(('%s|%s' % (url,tvar)).encode('utf-8')).hexdigest()
+        self.fname = os.path.join(cache_dir,key+'.npz')
+        self.values = None
+        self.units = None
+        self.calendar = 'standard'
+        self.load()
+        self.refresh(nc)
+
+    def load(self):
+        if not os.path.exists(self.fname):
+            return
+        try:
+            z = np.load(self.fname)
+            self.values = z['values']
+            self.units = str(z['units'])
+            self.calendar = str(z['calendar'])
+            z.close()
+        except Exception:
+            self.values = None
+
+    def save(self):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            pass
+        with atomic.writer(self.fname,'wb') as f:
+            np.savez(f,values=self.values,units=np.array(self.units),calendar=np.array(self.calendar))
+
+    def refresh(self,nc=None):
+        """Bring the axis up to date with the dataset, reading as little
+        of the time variable as possible.
+        """
+        if nc is None:
+            nc = netCDF4.Dataset(self.url)
+        var = nc.variables[self.tvar]
+        n = len(var)
+        units = var.units
+        calendar = getattr(var,'calendar','standard')
+        old = self.values
+        if old is not None and units==self.units and len(old)>tail and n>len(old)-tail:
+            # keep the head, re-read the tail, check that all of the tail
+            # the old axis had, and the first time, still agree
+            k = len(old)-tail
+            new = np.asarray(var[k:n],dtype=np.float64)
+            m = min(len(old),n)-k
+            if np.array_equal(new[:m],old[k:k+m]) and float(var[0])==old[0]:
+                self.values = np.concatenate((old[:k],new))
+            else:
+                self.values = np.asarray(var[:],dtype=np.float64)
+        else:
+            self.values = np.asarray(var[:],dtype=np.float64)
+        self.units = units
+        self.calendar = calendar
+        # seconds since 1970: file units per second, and the 1970 origin
+        t0 = netCDF4.date2num(epoch,units,calendar)
+        t1 = netCDF4.date2num(epoch+datetime.timedelta(seconds=3600),units,calendar)
+        self.seconds = (self.values-t0)*(3600./(t1-t0))
+        if old is None or not np.array_equal(old,self.values):
+            self.save()
+
+    def __len__(self):
+        return len(self.values)
+
+    def index(self,date,select='nearest'):
+        """Index of date (a naive UTC datetime) on the axis, like
+        netCDF4.date2index.  select is 'nearest', 'before' or 'after'.
+        """
+        t = (date-epoch).total_seconds()
+        s = self.seconds
+        i = int(np.searchsorted(s,t))
+        if select=='after':
+            return min(i,len(s)-1)
+        if i<len(s) and s[i]==t:
+            return i
+        if select=='before':
+            return max(i-1,0)
+        if i==0:
+            return 0
+        if i==len(s):
+            return len(s)-1
+        return i if (s[i]-t) < (t-s[i-1]) else i-1
+
+    def indices(self,dates,tol):
+        """Nearest index of each of dates, or -1 where the nearest time is
+        more than tol seconds away (e.g. past the end of the forecast).
+        """
+        idx = np.array([self.index(d,select='nearest') for d in dates],dtype=np.int64)
+        t = np.array([(d-epoch).total_seconds() for d in dates])
+        idx[np.abs(self.seconds[idx]-t)>tol] = -1
+        return idx
+
+    def window(self,date_mid,hours_ave):
+        """istart,istop of the time mean over the hours_ave hours around
+        date_mid: istop is the step nearest the end of that window (or the
+        last step), istart the one nearest hours_ave hours before istop.
+        """
+        istop = self.index(date_mid+datetime.timedelta(0,3600.*hours_ave/2.),select='nearest')
+        start_date = self.date(istop)-datetime.timedelta(0,3600.*hours_ave)
+        return self.index(start_date,select='nearest'),istop
+
+    def revisions(self,idx,now=None,settle=None):
+        """Revision of each of the steps idx: None for steps more than
+        settle seconds before now (a naive UTC datetime, by default the
+        current time), which no new forecast run will change, and for the
+        later ones a tag of the forecast run they come from.
+        """
+        settle = settle if settle is not None else globals()['settle']
+        now = now or datetime.datetime.utcnow()
+        cutoff = (now-epoch).total_seconds()-settle
+        run = '%d:%r' % (len(self.values),float(self.values[-1]))
+        return [run if self.seconds[k]>cutoff else None for k in idx]
+
+    def date(self,i):
+        '''time i as a naive UTC datetime'''
+        return epoch+datetime.timedelta(seconds=float(self.seconds[i]))
+
+def get(url,tvar='time',nc=None):
+    """The TimeAxis for (url,tvar), brought up to date with the dataset."""
+    taxis = _axes.get((url,tvar))
+    if taxis is None:
+        taxis = _axes.setdefault((url,tvar),TimeAxis(url,tvar,nc))
+    else:
+        taxis.refresh(nc)
+    return taxis
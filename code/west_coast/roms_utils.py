@@ -1,66 +1,8 @@
-import numpy as np
-
-def shrink(a,b):
-    """Return array shrunk to fit a specified shape by triming or averaging.
-    
-    a = shrink(array, shape)
-    
-    array is an numpy ndarray, and shape is a tuple (e.g., from
-    array.shape). a is the input array shrunk such that its maximum
-    dimensions are given by shape. If shape has more dimensions than
-    array, the last dimensions of shape are fit.
-    
-    as, bs = shrink(a, b)
-    
-    If the second argument is also an array, both a and b are shrunk to
-    the dimensions of each other. The input arrays must have the same
-    number of dimensions, and the resulting arrays will have the same
-    shape.
-    Example
-    -------
-    
-    >>> shrink(rand(10, 10), (5, 9, 18)).shape
-    (9, 10)
-    >>> map(shape, shrink(rand(10, 10, 10), rand(5, 9, 18)))        
-    [(5, 9, 10), (5, 9, 10)]   
-       
-    """
-
-    if isinstance(b, np.ndarray):
-        if not len(a.shape) == len(b.shape):
-            raise Exception, \
-                  'input arrays must have the same number of dimensions'
-        a = shrink(a,b.shape)
-        b = shrink(b,a.shape)
-        return (a, b)
-
-    if isinstance(b, int):
-        b = (b,)
-
-    if len(a.shape) == 1:                # 1D array is a special case
-        dim = b[-1]
-        while a.shape[0] > dim:          # only shrink a
-            if (dim - a.shape[0]) >= 2:  # trim off edges evenly
-                a = a[1:-1]
-            else:                        # or average adjacent cells
-                a = 0.5*(a[1:] + a[:-1])
-    else:
-        for dim_idx in range(-(len(a.shape)),0):
-            dim = b[dim_idx]
-            a = a.swapaxes(0,dim_idx)        # put working dim first
-            while a.shape[0] > dim:          # only shrink a
-                if (a.shape[0] - dim) >= 2:  # trim off edges evenly
-                    a = a[1:-1,:]
-                if (a.shape[0] - dim) == 1:  # or average adjacent cells
-                    a = 0.5*(a[1:,:] + a[:-1,:])
-            a = a.swapaxes(0,dim_idx)        # swap working dim back
-
-    return a
-
-def rot2d(x, y, ang):
-    '''rotate vectors by geometric angle'''
-    xr = x*np.cos(ang) - y*np.sin(ang)
-    yr = x*np.sin(ang) + y*np.cos(ang)
-    return xr, yr
-
-# <codecell>
\ No newline at end of file
+"""
+roms_utils: ROMS helpers of the west coast readers.  The destaggering and
+rotation are those of the US merge (code/us/rho_grid.py).
+"""
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','us'))
+from rho_grid import RhoGrid, get as rho_grid, window as rho_window
@@ -8,6 +8,7 @@ import netCDF4
 import scipy.interpolate
 import datetime
 import roms_utils
+import grid_store     # on the path through roms_utils
 
 
 def surf_vel_roms(x,y,url,date_mid=datetime.datetime.utcnow,hours_ave=24,tvar='ocean_time',lonlat_sub=1,time_sub=6):
@@ -17,10 +18,19 @@ def surf_vel_roms(x,y,url,date_mid=datetime.datetime.utcnow,hours_ave=24,tvar='o
     #####################################################################################
 
     nc = netCDF4.Dataset(url)
-    mask = nc.variables['mask_rho'][:]
-    lon_rho = nc.variables['lon_rho'][:]
-    lat_rho = nc.variables['lat_rho'][:]
-    anglev = nc.variables['angle'][:]
+    # static grid arrays come from the local store (see code/us/grid_store.py)
+    g = grid_store.get(url,['mask_rho','lon_rho','lat_rho','angle'],nc)
+    mask = g['mask_rho']
+    lon_rho = g['lon_rho']
+    lat_rho = g['lat_rho']
+    anglev = g['angle']
+
+    # only read the part of the grid that overlaps the x,y domain
+    igood = g.where('lon_rho','lat_rho',x.min(),x.max(),y.min(),y.max())
+    if len(igood[0])==0:
+        print('no overlap with the x,y domain')
+        return None
+    j0,j1,i0,i1 = roms_utils.rho_window(igood,lon_rho.shape)
 
     desired_stop_date = date_mid+datetime.timedelta(0,3600.*hours_ave/2.)  # specific time (UTC)
     istop = netCDF4.date2index(desired_stop_date,nc.variables[tvar],select='nearest')   
@@ -31,21 +41,24 @@ def surf_vel_roms(x,y,url,date_mid=datetime.datetime.utcnow,hours_ave=24,tvar='o
     uvar='u'
     vvar='v'
     isurf_layer = -1
+    # u is on (eta_rho, xi_rho-1) points, v on (eta_rho-1, xi_rho)
     print('reading u...')
-    u=np.mean(nc.variables[uvar][istart:istop:time_sub,isurf_layer,:,:],axis=0)
+    u=np.mean(nc.variables[uvar][istart:istop:time_sub,isurf_layer,j0:j1,i0:i1-1],axis=0)
     print('reading v...')
-    v=np.mean(nc.variables[vvar][istart:istop:time_sub,isurf_layer,:,:],axis=0)
+    v=np.mean(nc.variables[vvar][istart:istop:time_sub,isurf_layer,j0:j1-1,i0:i1],axis=0)
     print('done reading data...')
-    u = roms_utils.shrink(u, mask[1:-1, 1:-1].shape)
-    v = roms_utils.shrink(v, mask[1:-1, 1:-1].shape)
-
-    u, v = roms_utils.rot2d(u, v, anglev[1:-1, 1:-1])
+    inner = (slice(j0+1,j1-1),slice(i0+1,i1-1))
+    # u,v at the interior rho points, rotated to east/north
+    u, v = roms_utils.rho_grid((url,j0,j1,i0,i1),anglev[inner])(u, v)
 
 
     # <codecell>
 
-    lon=lon_rho[1:-1,1:-1]
-    lat=lat_rho[1:-1,1:-1]
+    lon=lon_rho[inner]
+    lat=lat_rho[inner]
+    if lonlat_sub>1:
+        sub=(slice(None,None,lonlat_sub),slice(None,None,lonlat_sub))
+        u, v, lon, lat = u[sub], v[sub], lon[sub], lat[sub]
 
 
     # <codecell>
@@ -33,10 +33,8 @@ def surf_vel_scb(x,y,url,lonlat_sub=1,time_sub=6):
     print('reading v...')
     v=np.mean(nc.variables[vvar][0:24:3,isurf_layer,:,:],axis=0)
     print('done reading data...')
-    u = roms_utils.shrink(u, mask[1:-1, 1:-1].shape)
-    v = roms_utils.shrink(v, mask[1:-1, 1:-1].shape)
-
-    u, v = roms_utils.rot2d(u, v, anglev[1:-1, 1:-1])
+    # u,v at the interior rho points, rotated to east/north
+    u, v = roms_utils.rho_grid((url,),anglev[1:-1, 1:-1])(u, v)
 
 
     # <codecell>